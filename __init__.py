@@ -68,6 +68,14 @@ from .prompt_expander_node_advanced import AIVideoPromptExpanderAdvanced
 from .image_to_video_node import ImageToVideoPromptExpander
 from .image_to_image_node import ImageToImagePromptExpander
 from .text_to_image_node import TextToImagePromptEnhancer
+from .metrics import register_routes
+
+# Expose /prompt_enhancer/metrics (Prometheus text) and /prompt_enhancer/metrics.json
+try:
+    from server import PromptServer
+    register_routes(PromptServer.instance.routes)
+except Exception as exc:
+    print(f"[Metrics] Metrics endpoints not mounted: {exc}")
 
 # Node class mappings for ComfyUI
 NODE_CLASS_MAPPINGS = {
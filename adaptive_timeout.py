@@ -0,0 +1,227 @@
+"""
+Request deadlines derived from observed backend throughput
+
+Each completed generation updates an exponentially weighted estimate of prompt
+processing (prefill) and generation (decode) speed for its (endpoint, model)
+pair. Ollama reports both phases separately (``prompt_eval_duration`` /
+``eval_duration``); for OpenAI-compatible servers the prefill share is
+estimated and the remainder of the wall time is attributed to decoding.
+
+The read timeout of the next request is then::
+
+    (prompt_tokens / prefill_tps + max_tokens / decode_tps) * slack + overhead
+
+clamped to ``[min, max]``. Until a pair has been observed the old fixed
+timeouts apply. The connect timeout is kept short so an unreachable host is
+detected in seconds regardless of how long generation may take.
+
+Environment variables: ``PROMPT_ENHANCER_TIMEOUT_SLACK`` (multiplier, default
+2.0), ``PROMPT_ENHANCER_TIMEOUT_MIN`` / ``PROMPT_ENHANCER_TIMEOUT_MAX``
+(seconds, default 20 / 900) and ``PROMPT_ENHANCER_CONNECT_TIMEOUT`` (default 3.05).
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .metrics import REGISTRY
+
+
+SLACK_ENV = "PROMPT_ENHANCER_TIMEOUT_SLACK"
+MIN_TIMEOUT_ENV = "PROMPT_ENHANCER_TIMEOUT_MIN"
+MAX_TIMEOUT_ENV = "PROMPT_ENHANCER_TIMEOUT_MAX"
+CONNECT_TIMEOUT_ENV = "PROMPT_ENHANCER_CONNECT_TIMEOUT"
+
+DEFAULT_GENERATION_TIMEOUT = 120.0
+DEFAULT_SLACK = 2.0
+DEFAULT_MIN_TIMEOUT = 20.0
+DEFAULT_MAX_TIMEOUT = 900.0
+DEFAULT_CONNECT_TIMEOUT = 3.05
+OVERHEAD_SECONDS = 2.0
+EWMA_ALPHA = 0.3
+# Prompt processing is typically an order of magnitude faster than decoding
+ASSUMED_PREFILL_RATIO = 10.0
+IMAGE_TOKEN_ESTIMATE = 600
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+
+class ThroughputStats:
+    """EWMA prefill/decode tokens-per-second for one (endpoint, model) pair."""
+
+    __slots__ = ("prefill_tps", "decode_tps", "probe_seconds", "samples")
+
+    def __init__(self):
+        self.prefill_tps: Optional[float] = None
+        self.decode_tps: Optional[float] = None
+        self.probe_seconds: Optional[float] = None
+        self.samples = 0
+
+    def _blend(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + EWMA_ALPHA * (value - current)
+
+    def observe(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        elapsed: float,
+        prefill_seconds: Optional[float] = None,
+        decode_seconds: Optional[float] = None,
+    ) -> None:
+        if prefill_seconds and prompt_tokens:
+            self.prefill_tps = self._blend(self.prefill_tps, prompt_tokens / prefill_seconds)
+        if decode_seconds is None and completion_tokens:
+            prefill_rate = self.prefill_tps or (self.decode_tps or 0.0) * ASSUMED_PREFILL_RATIO
+            estimated_prefill = prompt_tokens / prefill_rate if prefill_rate else 0.0
+            # Never attribute less than half the wall time to decoding
+            decode_seconds = max(elapsed - estimated_prefill, elapsed * 0.5)
+        if decode_seconds and completion_tokens:
+            self.decode_tps = self._blend(self.decode_tps, completion_tokens / decode_seconds)
+        self.samples += 1
+
+    def expected_seconds(self, prompt_tokens: int, max_tokens: int) -> Optional[float]:
+        if not self.decode_tps:
+            return None
+        prefill_rate = self.prefill_tps or self.decode_tps * ASSUMED_PREFILL_RATIO
+        return prompt_tokens / prefill_rate + max_tokens / self.decode_tps
+
+
+_STATS: Dict[Tuple[str, str], ThroughputStats] = {}
+_LOCK = threading.Lock()
+
+
+def _stats(endpoint: str, model: Optional[str]) -> ThroughputStats:
+    key = (endpoint, model or "default")
+    stats = _STATS.get(key)
+    if stats is None:
+        stats = ThroughputStats()
+        _STATS[key] = stats
+    return stats
+
+
+def estimate_prompt_tokens(payload: Dict[str, Any]) -> int:
+    """Rough prompt size (~4 characters per token, fixed cost per image)."""
+
+    characters = 0
+    images = len(payload.get("images") or [])
+    characters += len(str(payload.get("prompt") or "")) + len(str(payload.get("system") or ""))
+    for message in payload.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if not isinstance(part, dict):
+                    continue
+                if part.get("type") in ("text", "input_text"):
+                    characters += len(str(part.get("text") or ""))
+                else:
+                    images += 1
+        images += len(message.get("images") or [])
+    return characters // 4 + images * IMAGE_TOKEN_ESTIMATE
+
+
+def requested_tokens(payload: Dict[str, Any]) -> int:
+    options = payload.get("options") or {}
+    value = payload.get("max_tokens") or options.get("num_predict") or 0
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def connect_timeout() -> float:
+    return _env_float(CONNECT_TIMEOUT_ENV, DEFAULT_CONNECT_TIMEOUT)
+
+
+def generation_timeout(endpoint: str, model: Optional[str], payload: Dict[str, Any]) -> Tuple[float, float]:
+    """(connect, read) timeout for a generation request."""
+
+    with _LOCK:
+        expected = _stats(endpoint, model).expected_seconds(
+            estimate_prompt_tokens(payload),
+            requested_tokens(payload) or 1000,
+        )
+    if expected is None:
+        read = DEFAULT_GENERATION_TIMEOUT
+    else:
+        read = expected * _env_float(SLACK_ENV, DEFAULT_SLACK) + OVERHEAD_SECONDS
+        read = min(max(read, _env_float(MIN_TIMEOUT_ENV, DEFAULT_MIN_TIMEOUT)),
+                   _env_float(MAX_TIMEOUT_ENV, DEFAULT_MAX_TIMEOUT))
+    return connect_timeout(), round(read, 1)
+
+
+def probe_timeout(endpoint: str, default: float) -> Tuple[float, float]:
+    """(connect, read) timeout for a model-list probe."""
+
+    with _LOCK:
+        observed = _stats(endpoint, None).probe_seconds
+    if observed is None:
+        return connect_timeout(), default
+    read = min(max(observed * _env_float(SLACK_ENV, DEFAULT_SLACK) * 2, 2.0), default)
+    return connect_timeout(), round(read, 2)
+
+
+def record_generation(endpoint: str, model: Optional[str], payload: Dict[str, Any],
+                      data: Any, elapsed: float) -> None:
+    """Update throughput estimates from a completed generation response."""
+
+    if not isinstance(data, dict):
+        return
+    prefill_seconds = decode_seconds = None
+    usage = data.get("usage")
+    if isinstance(usage, dict):
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+    else:
+        prompt_tokens = data.get("prompt_eval_count") or 0
+        completion_tokens = data.get("eval_count") or 0
+        if data.get("prompt_eval_duration"):
+            prefill_seconds = data["prompt_eval_duration"] / 1e9
+        if data.get("eval_duration"):
+            decode_seconds = data["eval_duration"] / 1e9
+    if not prompt_tokens:
+        prompt_tokens = estimate_prompt_tokens(payload)
+    if not completion_tokens:
+        return
+    with _LOCK:
+        _stats(endpoint, model or payload.get("model")).observe(
+            int(prompt_tokens), int(completion_tokens), elapsed, prefill_seconds, decode_seconds
+        )
+
+
+def record_probe(endpoint: str, elapsed: float) -> None:
+    with _LOCK:
+        stats = _stats(endpoint, None)
+        stats.probe_seconds = stats._blend(stats.probe_seconds, elapsed)
+
+
+def throughput_snapshot() -> Dict[str, Dict[str, Any]]:
+    with _LOCK:
+        return {
+            f"{endpoint} [{model}]": {
+                "prefill_tps": round(stats.prefill_tps, 1) if stats.prefill_tps else None,
+                "decode_tps": round(stats.decode_tps, 1) if stats.decode_tps else None,
+                "samples": stats.samples,
+            }
+            for (endpoint, model), stats in _STATS.items()
+            if stats.samples
+        }
+
+
+def _decode_gauge_values() -> Dict[tuple, float]:
+    with _LOCK:
+        return {key: stats.decode_tps for key, stats in _STATS.items() if stats.decode_tps}
+
+
+REGISTRY.gauge(
+    "prompt_enhancer_decode_tokens_per_second",
+    "Observed generation throughput per endpoint and model (EWMA).",
+    ("endpoint", "model"),
+    callback=_decode_gauge_values,
+)
@@ -0,0 +1,400 @@
+"""
+End-to-end node benchmarks against the offline mock backend
+
+Drives all five node entry points through a set of scenarios (0/1/2 reference
+images, multiple variations, seed modes, LM Studio, Ollama, an OpenAI-compatible
+server answering ``n`` choices and the model-free ``none`` backend) against
+:class:`MockLLMServer`, and reports per scenario:
+
+- p50 / p95 wall time per node execution
+- backend generation calls and model probes (GET /models, /api/tags) per run
+- bytes sent to and received from the backend per run
+- prompt tokens per run and the share served from the server's prefix cache
+- runs whose status output reports an error or failure
+
+Scenarios may script replies with mock rules, e.g. a well-formed answer to the
+text-to-image node's batched reference-directive request; the ``two_pass``
+variant without one gets unstructured text and takes the per-reference
+fallback.
+
+The process peak RSS is reported once for the whole suite (it only grows, so a
+per-scenario reading would repeat the heaviest scenario's figure).
+
+Results are compared against ``benchmark_baselines.json`` (recorded with
+``--update-baselines``, which merges into the file so a subset of scenarios can
+be re-recorded with ``--scenario``); a scenario regresses
+when any run failed, when its p95 or bytes grow by more than ``--tolerance`` or
+when it makes more backend calls than the baseline. The exit code is 1 if anything regressed.
+
+Run from the ComfyUI root (the nodes import torch, PIL and ComfyUI modules)::
+
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.benchmark_nodes
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.benchmark_nodes --scenario t2i --iterations 10
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.benchmark_nodes --update-baselines
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .mock_llm_server import MockConfig, MockLLMServer
+
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+DEFAULT_TOLERANCE = 0.25
+
+
+@dataclass
+class Scenario:
+    """One benchmark case: a node entry point plus input overrides."""
+
+    name: str
+    node: str
+    method: str
+    overrides: Dict[str, Any] = field(default_factory=dict)
+    images: Dict[str, int] = field(default_factory=dict)
+    backend: str = "lm_studio"
+    # Mock response rules installed for this scenario only
+    rules: List[Dict[str, Any]] = field(default_factory=list)
+
+
+# Well-formed answer to the text-to-image node's batched directive request (two references)
+_BATCHED_DIRECTIVES_RULE = {
+    "match": r"turn reference image captions into guidance",
+    "response": (
+        "[R1]\nFOCUS: Soft diffused light and a muted green palette.\n"
+        "GUIDANCE: Carry the diffused glasshouse light and muted greens into the scene.\n"
+        "[R2]\nFOCUS: An elderly figure leaning over a potting bench.\n"
+        "GUIDANCE: Keep the stooped, attentive pose of the figure at the bench."
+    ),
+}
+
+
+def _scenarios() -> List[Scenario]:
+    return [
+        Scenario("video_basic", "AIVideoPromptExpander", "expand_prompt",
+                 {"basic_prompt": "a lighthouse keeper walks along the cliffs at dusk", "num_variations": 1}),
+        Scenario("video_basic_3var", "AIVideoPromptExpander", "expand_prompt",
+                 {"basic_prompt": "a {red|blue|green} kite over a {beach|field}", "num_variations": 3,
+                  "wildcard_mode": "enumerate"}),
+        Scenario("video_basic_ollama", "AIVideoPromptExpander", "expand_prompt",
+                 {"basic_prompt": "a lighthouse keeper walks along the cliffs at dusk", "num_variations": 1},
+                 backend="ollama"),
+        Scenario("video_basic_3var_n", "AIVideoPromptExpander", "expand_prompt",
+                 {"basic_prompt": "a lighthouse keeper walks along the cliffs at dusk", "num_variations": 3},
+                 backend="openai_compat"),
+        Scenario("video_basic_none", "AIVideoPromptExpander", "expand_prompt",
+                 {"basic_prompt": "a {red|blue|green} kite over a {beach|field}", "num_variations": 3,
+                  "wildcard_mode": "enumerate"},
+                 backend="none"),
+        Scenario("video_advanced", "AIVideoPromptExpanderAdvanced", "expand_prompt",
+                 {"basic_prompt": "a dancer spins in an empty warehouse", "num_variations": 1}),
+        Scenario("video_advanced_1ref_2var", "AIVideoPromptExpanderAdvanced", "expand_prompt",
+                 {"basic_prompt": "a dancer spins in an empty warehouse", "num_variations": 2},
+                 images={"reference_image": 1}),
+        Scenario("img2vid_vision", "ImageToVideoPromptExpander", "expand_img2vid_prompt",
+                 {"motion_description": "the camera slowly pushes in", "use_vision_model": True},
+                 images={"image": 1}),
+        Scenario("img2vid_no_vision", "ImageToVideoPromptExpander", "expand_img2vid_prompt",
+                 {"motion_description": "the camera slowly pushes in", "use_vision_model": False},
+                 images={"image": 1}),
+        Scenario("img2img_vision", "ImageToImagePromptExpander", "expand_img2img_prompt",
+                 {"change_request": "turn the scene into a snowy winter evening", "use_vision_model": True},
+                 images={"image": 1}),
+        Scenario("t2i_0ref_fixed", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "fixed", "random_seed": 1234}),
+        Scenario("t2i_0ref_random", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "random"}),
+        Scenario("t2i_0ref_increment", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "increment", "random_seed": 10}),
+        Scenario("t2i_0ref_none", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "fixed", "random_seed": 1234},
+                 backend="none"),
+        Scenario("t2i_1ref", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "fixed", "random_seed": 1234,
+                  "reference_directive_1": "style only"},
+                 images={"reference_image_1": 1}),
+        Scenario("t2i_2ref", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "fixed", "random_seed": 1234,
+                  "reference_directive_1": "style only", "reference_directive_2": "subject only"},
+                 images={"reference_image_1": 1, "reference_image_2": 1}),
+        # Captions first, then the multi-reference directive path (single-pass skips it)
+        Scenario("t2i_2ref_two_pass", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "fixed", "random_seed": 1234,
+                  "reference_directive_1": "style only", "reference_directive_2": "subject only",
+                  "vision_pass": "two_pass"},
+                 images={"reference_image_1": 1, "reference_image_2": 1},
+                 rules=[_BATCHED_DIRECTIVES_RULE]),
+        Scenario("t2i_2ref_two_pass_fallback", "TextToImagePromptEnhancer", "enhance_prompt",
+                 {"text_prompt": "an old botanist in a glasshouse", "seed_mode": "fixed", "random_seed": 1234,
+                  "reference_directive_1": "style only", "reference_directive_2": "subject only",
+                  "vision_pass": "two_pass"},
+                 images={"reference_image_1": 1, "reference_image_2": 1}),
+    ]
+
+
+_NODE_MODULES = {
+    "AIVideoPromptExpander": "prompt_expander_node",
+    "AIVideoPromptExpanderAdvanced": "prompt_expander_node_advanced",
+    "ImageToVideoPromptExpander": "image_to_video_node",
+    "ImageToImagePromptExpander": "image_to_image_node",
+    "TextToImagePromptEnhancer": "text_to_image_node",
+}
+
+
+def _node_class(name: str) -> type:
+    """Import a node class on first use, so scenarios of other nodes need none of its dependencies."""
+
+    module = importlib.import_module(f".{_NODE_MODULES[name]}", __package__)
+    return getattr(module, name)
+
+
+def _default_inputs(node_cls: type) -> Dict[str, Any]:
+    """Build entry-point kwargs from the node's INPUT_TYPES defaults (images omitted)."""
+
+    spec = node_cls.INPUT_TYPES()
+    values: Dict[str, Any] = {}
+    for section in ("required", "optional"):
+        for name, entry in (spec.get(section) or {}).items():
+            kind = entry[0]
+            options = entry[1] if len(entry) > 1 and isinstance(entry[1], dict) else {}
+            if isinstance(kind, (list, tuple)):
+                values[name] = options.get("default", kind[0] if kind else "")
+            elif "default" in options:
+                values[name] = options["default"]
+            elif kind == "STRING":
+                values[name] = ""
+            elif kind in ("INT", "FLOAT"):
+                values[name] = 0
+            elif kind == "BOOLEAN":
+                values[name] = False
+    return values
+
+
+def _scenario_inputs(scenario: Scenario, node_cls: type, server: MockLLMServer) -> Dict[str, Any]:
+    endpoint = server.ollama_endpoint if scenario.backend == "ollama" else server.lm_studio_endpoint
+    values = _default_inputs(node_cls)
+    for name in ("llm_backend", "vision_backend", "expansion_backend"):
+        if name in values and values[name] not in ("auto", "disable"):
+            values[name] = scenario.backend
+    for name in ("api_endpoint", "vision_api_endpoint", "vision_endpoint", "expansion_endpoint"):
+        if name in values:
+            values[name] = endpoint
+    values["save_to_file"] = False
+    values.update(scenario.overrides)
+
+    if not scenario.images:
+        return values
+
+    import torch
+
+    # ComfyUI IMAGE tensors are [batch, height, width, channels] floats in 0..1
+    generator = torch.Generator().manual_seed(0)
+    for name, count in scenario.images.items():
+        values[name] = torch.rand((count, 512, 512, 3), generator=generator)
+    return values
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import psutil  # type: ignore
+
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _run_failed(outputs: Any, status_index: Optional[int]) -> bool:
+    """True when a node execution returned nothing or reported an error in its status."""
+
+    if not outputs or not str(outputs[0]).strip():
+        return True
+    status = outputs[status_index] if status_index is not None and status_index < len(outputs) else outputs[-1]
+    status = str(status).strip()
+    return status.startswith("❌") or "failed" in status.lower()
+
+
+def run_scenario(
+    scenario: Scenario,
+    node_cls: type,
+    server: MockLLMServer,
+    iterations: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    """Execute one scenario and return its measurements."""
+
+    server.set_rules(scenario.rules)
+    node = node_cls()
+    entry: Callable[..., Any] = getattr(node, scenario.method)
+    inputs = _scenario_inputs(scenario, node_cls, server)
+    return_names = tuple(getattr(node_cls, "RETURN_NAMES", ()))
+    status_index = return_names.index("status") if "status" in return_names else None
+
+    for _ in range(warmup):
+        entry(**inputs)
+
+    server.reset_stats()
+    timings: List[float] = []
+    failures = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        outputs = entry(**inputs)
+        timings.append(time.perf_counter() - started)
+        if _run_failed(outputs, status_index):
+            failures += 1
+
+    stats = server.stats()
+    requests = stats["requests"]
+    generation_calls = sum(count for path, count in requests.items() if path.startswith("POST "))
+    probe_calls = sum(count for path, count in requests.items() if path.startswith("GET "))
+    runs = max(1, iterations)
+    return {
+        "iterations": iterations,
+        "p50_seconds": round(_percentile(timings, 0.50), 4),
+        "p95_seconds": round(_percentile(timings, 0.95), 4),
+        "mean_seconds": round(sum(timings) / runs, 4),
+        "llm_calls_per_run": round(generation_calls / runs, 2),
+        "probe_calls_per_run": round(probe_calls / runs, 2),
+        "bytes_sent_per_run": int(stats["bytes_received"] / runs),
+        "bytes_received_per_run": int(stats["bytes_sent"] / runs),
+        "prompt_tokens_per_run": int(stats["prompt_tokens"] / runs),
+        "cached_prompt_ratio": round(stats["cached_prompt_tokens"] / stats["prompt_tokens"], 3)
+        if stats["prompt_tokens"] else 0.0,
+        "failed_runs": failures,
+    }
+
+
+def compare_to_baseline(result: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return human-readable regressions of ``result`` against ``baseline``."""
+
+    if result.get("failed_runs"):
+        # Timings and bytes of failed runs say nothing about the node's performance
+        return [f"failed_runs {result['failed_runs']}/{result['iterations']}"]
+    if not baseline:
+        return []
+    problems: List[str] = []
+    for key in ("p95_seconds", "bytes_sent_per_run", "bytes_received_per_run"):
+        old, new = baseline.get(key), result.get(key)
+        if old and new is not None and new > old * (1 + tolerance):
+            problems.append(f"{key} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    for key in ("llm_calls_per_run", "probe_calls_per_run"):
+        old, new = baseline.get(key), result.get(key)
+        if old is not None and new is not None and new > old:
+            problems.append(f"{key} {old} -> {new}")
+    return problems
+
+
+def _load_baselines(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle).get("scenarios", {})
+
+
+def _store_baselines(path: str, results: Dict[str, Dict[str, Any]], config: MockConfig) -> None:
+    existing = _load_baselines(path)
+    existing.update(results)
+    payload = {
+        "mock": {"latency": config.latency, "tokens_per_second": config.tokens_per_second,
+                 "response_tokens": config.response_tokens},
+        "scenarios": existing,
+    }
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def _format_row(name: str, result: Dict[str, Any], verdict: str) -> str:
+    return (
+        f"{name:<26} p50 {result['p50_seconds']:>7.3f}s  p95 {result['p95_seconds']:>7.3f}s  "
+        f"calls {result['llm_calls_per_run']:>4} (+{result['probe_calls_per_run']} probes)  "
+        f"sent {result['bytes_sent_per_run']:>8} B  prefix-cached {result.get('cached_prompt_ratio', 0.0):>5.0%}  "
+        f"failed {result['failed_runs']}  {verdict}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the prompt enhancer nodes against a mock backend")
+    parser.add_argument("--scenario", action="append", help="Run only scenarios whose name contains this text")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--update-baselines", action="store_true", help="Write results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--latency", default="fixed:0.02", help="Mock time-to-first-token distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Mock decode rate (0 = instant)")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Mock prompt processing rate for uncached tokens (0 = instant)")
+    parser.add_argument("--json", dest="json_path", help="Also write the full results to this file")
+    args = parser.parse_args(argv)
+
+    scenarios = [
+        scenario for scenario in _scenarios()
+        if not args.scenario or any(fragment in scenario.name for fragment in args.scenario)
+    ]
+    if not scenarios:
+        print("[Benchmark] No scenarios selected")
+        return 1
+
+    config = MockConfig(models=["mock-vision-7b"], latency=args.latency,
+                        tokens_per_second=args.tokens_per_second,
+                        prefill_tokens_per_second=args.prefill_tokens_per_second, seed=0)
+    baselines = {} if args.update_baselines else _load_baselines(args.baseline)
+    results: Dict[str, Dict[str, Any]] = {}
+    regressed = False
+
+    with MockLLMServer(config) as server:
+        print(f"[Benchmark] Mock backend at {server.url} ({config.latency}, "
+              f"{config.tokens_per_second or 'instant'} tok/s), {args.iterations} iterations")
+        for scenario in scenarios:
+            result = run_scenario(scenario, _node_class(scenario.node), server, args.iterations, args.warmup)
+            problems = compare_to_baseline(result, baselines.get(scenario.name), args.tolerance)
+            result["regressions"] = problems
+            results[scenario.name] = result
+            if problems:
+                regressed = True
+                verdict = "REGRESSED: " + "; ".join(problems)
+            elif scenario.name in baselines:
+                verdict = "ok"
+            else:
+                verdict = "(no baseline)"
+            print(_format_row(scenario.name, result, verdict))
+        print(f"[Benchmark] Process peak RSS after the suite: {_peak_rss_mb()} MB")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+    if args.update_baselines:
+        _store_baselines(args.baseline, {
+            name: {key: value for key, value in result.items() if key != "regressions"}
+            for name, result in results.items()
+        }, config)
+        print(f"[Benchmark] Baselines written to {args.baseline}")
+        return 0
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Persistent model-detection and capability probe results
+
+Constructing an ``LLMBackend`` used to ask the server for its model list to
+auto-detect the model id and again to look for vision flags, on every node
+execution and from scratch after every restart. The outcome is stored here per
+(backend, endpoint, requested model) and written to a small JSON file, so a
+backend built from a fresh-enough record performs no HTTP request at all.
+
+A record is trusted for ``ttl`` seconds after it was last validated. While it
+is fresh, at most once per ``revalidate_interval`` a daemon thread fetches the
+model list again and compares its hash with the stored one: an unchanged list
+just renews the record, a changed one triggers a full re-probe whose result
+the next backend construction picks up. Node executions never wait for either.
+
+Environment variables: ``PROMPT_ENHANCER_CAPABILITY_CACHE`` (JSON file path,
+``off`` keeps records in memory only), ``PROMPT_ENHANCER_CAPABILITY_TTL``
+(seconds, default 86400) and ``PROMPT_ENHANCER_CAPABILITY_REVALIDATE``
+(seconds, default 60).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import record_cache
+
+
+CACHE_PATH_ENV = "PROMPT_ENHANCER_CAPABILITY_CACHE"
+TTL_ENV = "PROMPT_ENHANCER_CAPABILITY_TTL"
+REVALIDATE_ENV = "PROMPT_ENHANCER_CAPABILITY_REVALIDATE"
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "capabilities.json")
+DEFAULT_TTL_SECONDS = 86400.0
+DEFAULT_REVALIDATE_SECONDS = 60.0
+CACHE_VERSION = 1
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+
+def capability_key(backend_type: str, endpoint: str, model_name: Optional[str]) -> str:
+    """Cache key; ``model_name=None`` stands for "auto-detect"."""
+
+    return f"{backend_type}|{endpoint.rstrip('/')}|{model_name or '*auto*'}"
+
+
+def listing_hash(listing: Any) -> str:
+    """Stable digest of a /models or /api/tags response."""
+
+    return hashlib.sha1(json.dumps(listing, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CapabilityCache:
+    """
+    TTL'd probe records keyed by :func:`capability_key`, mirrored to disk.
+
+    Records are plain dicts with ``model_name``, ``capabilities``, ``notes``,
+    ``listing_hash``, ``probed_at`` and ``validated_at`` (wall-clock seconds).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        revalidate_interval: Optional[float] = None,
+    ):
+        if path is None:
+            path = os.environ.get(CACHE_PATH_ENV, "").strip() or DEFAULT_CACHE_PATH
+        self.path: Optional[str] = None if path.lower() in ("0", "off", "none", "false") else path
+        self.ttl = float(ttl if ttl is not None else _env_float(TTL_ENV, DEFAULT_TTL_SECONDS))
+        self.revalidate_interval = float(
+            revalidate_interval if revalidate_interval is not None
+            else _env_float(REVALIDATE_ENV, DEFAULT_REVALIDATE_SECONDS)
+        )
+        self._records: Optional[Dict[str, Dict[str, Any]]] = None
+        self._last_check: Dict[str, float] = {}
+        self._in_flight: set = set()
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._records is not None:
+            return self._records
+        records: Dict[str, Dict[str, Any]] = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as handle:
+                    payload = json.load(handle)
+                if isinstance(payload, dict) and payload.get("version") == CACHE_VERSION:
+                    records = {key: value for key, value in payload.get("records", {}).items() if isinstance(value, dict)}
+            except (OSError, ValueError) as exc:
+                print(f"[LLM Backend] Ignoring unreadable capability cache {self.path}: {exc}")
+        self._records = records
+        return records
+
+    def _save(self) -> None:
+        if not self.path or self._records is None:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as handle:
+                json.dump({"version": CACHE_VERSION, "records": self._records}, handle, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            print(f"[LLM Backend] Could not write capability cache {self.path}: {exc}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _fresh(self, record: Dict[str, Any], now: float) -> bool:
+        return now - float(record.get("validated_at") or 0.0) < self.ttl
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Fresh record for ``key`` (a copy), or None when missing or expired."""
+
+        with self._lock:
+            record = self._load().get(key)
+            hit = record is not None and self._fresh(record, time.time())
+        record_cache("capabilities", hit)
+        return json.loads(json.dumps(record)) if hit else None
+
+    def store(self, key: str, record: Dict[str, Any]) -> None:
+        """Save a newly probed record (must carry ``listing_hash``)."""
+
+        now = time.time()
+        entry = dict(record)
+        entry.setdefault("probed_at", now)
+        entry["validated_at"] = now
+        with self._lock:
+            self._load()[key] = entry
+            self._last_check[key] = time.monotonic()
+            self._save()
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one record (or all of them)."""
+
+        with self._lock:
+            records = self._load()
+            if key is None:
+                records.clear()
+                self._last_check.clear()
+            else:
+                records.pop(key, None)
+                self._last_check.pop(key, None)
+            self._save()
+
+    def revalidate_async(
+        self,
+        key: str,
+        fetch_hash: Callable[[], str],
+        reprobe: Callable[[], Optional[Dict[str, Any]]],
+    ) -> bool:
+        """Re-check ``key`` on a daemon thread if the interval has elapsed.
+
+        ``fetch_hash`` returns the current model-list hash; ``reprobe`` runs a
+        full probe and returns a new record (or None). Returns True when a
+        check was started.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_check.get(key)
+            if key in self._in_flight or (last is not None and now - last < self.revalidate_interval):
+                return False
+            self._in_flight.add(key)
+            self._last_check[key] = now
+        thread = threading.Thread(
+            target=self._revalidate,
+            args=(key, fetch_hash, reprobe),
+            name="prompt-enhancer-capabilities",
+            daemon=True,
+        )
+        thread.start()
+        return True
+
+    def _revalidate(self, key: str, fetch_hash, reprobe) -> None:
+        try:
+            current = fetch_hash()
+            with self._lock:
+                record = self._load().get(key)
+                if record is not None and record.get("listing_hash") == current:
+                    record["validated_at"] = time.time()
+                    self._save()
+                    return
+            print(f"[LLM Backend] Model list changed for {key.split('|')[1]}, re-probing capabilities")
+            fresh = reprobe()
+            if fresh and fresh.get("listing_hash"):
+                self.store(key, fresh)
+        except Exception as exc:
+            # Server unreachable: keep serving the record until its TTL runs out
+            print(f"[LLM Backend] Capability revalidation skipped for {key.split('|')[1]}: {exc}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+
+_CACHE: Optional[CapabilityCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_capability_cache() -> CapabilityCache:
+    """Process-wide capability cache (configured from the environment on first use)."""
+
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = CapabilityCache()
+    return _CACHE
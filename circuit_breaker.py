@@ -0,0 +1,292 @@
+"""
+Per-endpoint circuit breakers and an optional background health pinger
+
+Every HTTP request LLMBackend makes reports its transport outcome here
+(connection errors, timeouts, HTTP 429/5xx count as failures). After
+``failure_threshold`` consecutive failures the endpoint's breaker opens and
+requests to it fail immediately with :class:`CircuitOpenError` instead of
+waiting for a timeout. Once the cool-down has elapsed the breaker goes
+half-open and lets a single trial request through: success closes it, failure
+re-opens it with a doubled cool-down (capped).
+
+Set ``PROMPT_ENHANCER_HEALTH_PING`` to an interval in seconds to ping every
+known endpoint in the background, so a dead server is detected (and a revived
+one re-admitted) without a node execution paying for it.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from .metrics import REGISTRY
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+FAILURE_THRESHOLD_ENV = "PROMPT_ENHANCER_BREAKER_THRESHOLD"
+COOLDOWN_ENV = "PROMPT_ENHANCER_BREAKER_COOLDOWN"
+HEALTH_PING_ENV = "PROMPT_ENHANCER_HEALTH_PING"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN_SECONDS = 15.0
+MAX_COOLDOWN_SECONDS = 300.0
+PING_TIMEOUT_SECONDS = 3.0
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to an endpoint whose breaker is open."""
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+
+def is_breaker_failure(exc: Optional[BaseException] = None, status_code: Optional[int] = None) -> bool:
+    """True for outcomes that mean the server is down or overloaded."""
+
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    if isinstance(exc, CircuitOpenError):
+        return False
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state machine for one endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        cooldown: Optional[float] = None,
+        probe_url: Optional[str] = None,
+    ):
+        self.name = name
+        self.failure_threshold = int(failure_threshold or _env_number(FAILURE_THRESHOLD_ENV, DEFAULT_FAILURE_THRESHOLD))
+        self.base_cooldown = float(cooldown or _env_number(COOLDOWN_ENV, DEFAULT_COOLDOWN_SECONDS))
+        self.probe_url = probe_url
+        self._state = CLOSED
+        self._failures = 0
+        self._cooldown = self.base_cooldown
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self._cooldown:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def available(self) -> bool:
+        """Whether a request could be sent now (does not claim the trial slot)."""
+
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == CLOSED or (state == HALF_OPEN and not self._trial_in_flight)
+
+    def allow_request(self) -> bool:
+        """Claim permission to send a request; in half-open only one trial passes."""
+
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"[LLM Backend] Circuit for {self.name} closed (endpoint recovered)")
+            self._state = CLOSED
+            self._failures = 0
+            self._cooldown = self.base_cooldown
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            self._last_error = error
+            self._failures += 1
+            if state == HALF_OPEN:
+                self._cooldown = min(MAX_COOLDOWN_SECONDS, self._cooldown * 2)
+                self._open(now)
+            elif state == CLOSED and self._failures >= self.failure_threshold:
+                self._open(now)
+
+    def record(self, exc: Optional[BaseException] = None, status_code: Optional[int] = None) -> None:
+        """Feed the outcome of one request (an exception or an HTTP status)."""
+
+        if is_breaker_failure(exc, status_code):
+            self.record_failure(str(exc) if exc is not None else f"HTTP {status_code}")
+        else:
+            self.record_success()
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._trial_in_flight = False
+        print(f"[LLM Backend] Circuit for {self.name} opened for {self._cooldown:.0f}s "
+              f"after {self._failures} failure(s): {self._last_error}")
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._current_state(time.monotonic()) != OPEN:
+                return 0.0
+            return max(0.0, self._cooldown - (time.monotonic() - self._opened_at))
+
+    def to_dict(self) -> Dict[str, object]:
+        state = self.state
+        return {
+            "endpoint": self.name,
+            "state": state,
+            "consecutive_failures": self._failures,
+            "retry_after": round(self.retry_after(), 1),
+            "last_error": self._last_error,
+        }
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(endpoint: str, probe_url: Optional[str] = None) -> CircuitBreaker:
+    """Return the process-wide breaker for ``endpoint`` (created on first use)."""
+
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, probe_url=probe_url)
+            _BREAKERS[endpoint] = breaker
+        elif probe_url and not breaker.probe_url:
+            breaker.probe_url = probe_url
+    _ensure_health_monitor()
+    return breaker
+
+
+_STATE_VALUES = {CLOSED: 0.0, HALF_OPEN: 1.0, OPEN: 2.0}
+
+
+def _state_gauge_values() -> Dict[tuple, float]:
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return {(breaker.name,): _STATE_VALUES[breaker.state] for breaker in breakers}
+
+
+REGISTRY.gauge(
+    "prompt_enhancer_circuit_state",
+    "Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open).",
+    ("endpoint",),
+    callback=_state_gauge_values,
+)
+
+
+def breaker_states() -> List[Dict[str, object]]:
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return [breaker.to_dict() for breaker in breakers]
+
+
+def breaker_status(endpoints: Optional[Iterable[str]] = None) -> str:
+    """Status-line fragment for breakers that are not closed ('' when all healthy)."""
+
+    with _BREAKERS_LOCK:
+        if endpoints is None:
+            breakers = list(_BREAKERS.values())
+        else:
+            breakers = [_BREAKERS[url] for url in endpoints if url in _BREAKERS]
+    parts = []
+    for breaker in breakers:
+        state = breaker.state
+        if state == OPEN:
+            parts.append(f"{_short(breaker.name)} open (retry in {breaker.retry_after():.0f}s)")
+        elif state == HALF_OPEN:
+            parts.append(f"{_short(breaker.name)} half-open")
+    return "⚡ Breaker: " + ", ".join(parts) if parts else ""
+
+
+def _short(url: str) -> str:
+    return url.split("://", 1)[-1].split("/", 1)[0]
+
+
+class HealthMonitor:
+    """Daemon thread that pings every breaker's probe URL at a fixed interval."""
+
+    def __init__(self, interval: float, fetch: Optional[Callable[[str], int]] = None):
+        self.interval = max(1.0, interval)
+        self._fetch = fetch or self._default_fetch
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prompt-enhancer-health", daemon=True)
+
+    @staticmethod
+    def _default_fetch(url: str) -> int:
+        return requests.get(url, timeout=PING_TIMEOUT_SECONDS).status_code
+
+    def start(self) -> "HealthMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def ping_once(self) -> None:
+        with _BREAKERS_LOCK:
+            breakers = [breaker for breaker in _BREAKERS.values() if breaker.probe_url]
+        for breaker in breakers:
+            try:
+                status_code = self._fetch(breaker.probe_url)
+            except Exception as exc:
+                if is_breaker_failure(exc):
+                    breaker.record_failure(f"health ping: {exc}")
+                continue
+            if is_breaker_failure(status_code=status_code):
+                breaker.record_failure(f"health ping: HTTP {status_code}")
+            else:
+                breaker.record_success()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.ping_once()
+            except Exception as exc:
+                print(f"[LLM Backend] Health ping failed: {exc}")
+
+
+_MONITOR: Optional[HealthMonitor] = None
+
+
+def start_health_monitor(interval: float) -> HealthMonitor:
+    """Start (or return) the background pinger."""
+
+    global _MONITOR
+    with _BREAKERS_LOCK:
+        if _MONITOR is None:
+            _MONITOR = HealthMonitor(interval).start()
+            print(f"[LLM Backend] Health monitor pinging endpoints every {_MONITOR.interval:.0f}s")
+        return _MONITOR
+
+
+def _ensure_health_monitor() -> None:
+    if _MONITOR is not None:
+        return
+    interval = _env_number(HEALTH_PING_ENV, 0.0)
+    if interval > 0:
+        start_health_monitor(interval)
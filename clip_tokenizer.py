@@ -0,0 +1,325 @@
+"""
+Offline CLIP BPE tokenizer for token budgets on SD-family platforms
+
+Stable Diffusion 1.5 / SDXL (and Pony / Illustrious, which are SDXL
+fine-tunes) read prompts through CLIP's byte-level BPE in 75-token chunks
+(77 with the start/end markers). Word counts are a poor stand-in: one
+"masterpiece" is one token, a hyphenated colour or an unusual name can be
+five. This module reproduces CLIP's tokenization with only the standard
+library and the bundled merge table ``bpe_simple_vocab_16e6.txt.gz`` (from
+OpenAI CLIP, MIT licence), so counts match what the text encoder will see.
+
+Attention syntax understood by ComfyUI (``(phrase:1.2)``, ``(phrase)``,
+``[phrase]``) is stripped before counting, like the encoder does, and
+``BREAK`` marks a chunk boundary.
+
+Per-word BPE results and whole-phrase encodings are memoized in LRU caches,
+so re-counting prompts built from the same vocabulary (wildcard batches,
+variations) costs a dictionary lookup per phrase.
+"""
+
+import gzip
+import html
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import register_cache_info
+
+
+VOCAB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bpe_simple_vocab_16e6.txt.gz")
+
+CHUNK_TOKENS = 75
+BREAK_KEYWORD = "BREAK"
+
+# CLIP's pre-tokenizer with \p{L} / \p{N} spelled for the stdlib ``re`` module
+_PIECE_RE = re.compile(
+    r"<start_of_text>|<end_of_text>|'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|(?:[^\s\w]|_)+",
+    re.IGNORECASE,
+)
+_WEIGHT_RE = re.compile(r":\s*-?\d+(?:\.\d+)?\s*(?=\))")
+_SYNTAX_RE = re.compile(r"(?<!\\)[()\[\]]")
+_BREAK_RE = re.compile(r"\s*\bBREAK\b\s*")
+
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    """Reversible byte -> printable character map used by CLIP's byte-level BPE."""
+
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    codes = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            codes.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, (chr(code) for code in codes)))
+
+
+class CLIPTokenizer:
+    """CLIP byte-level BPE (encode/decode) loaded from the bundled merge table."""
+
+    def __init__(self, vocab_path: str = VOCAB_PATH):
+        self.byte_encoder = _bytes_to_unicode()
+        self.byte_decoder = {value: key for key, value in self.byte_encoder.items()}
+        with gzip.open(vocab_path) as handle:
+            merges = handle.read().decode("utf-8").split("\n")
+        merges = [tuple(line.split()) for line in merges[1:49152 - 256 - 2 + 1]]
+        vocab = list(self.byte_encoder.values())
+        vocab += [value + "</w>" for value in vocab]
+        vocab += ["".join(merge) for merge in merges]
+        vocab += ["<start_of_text>", "<end_of_text>"]
+        self.encoder = {token: index for index, token in enumerate(vocab)}
+        self.decoder = {index: token for token, index in self.encoder.items()}
+        self.bpe_ranks = {merge: rank for rank, merge in enumerate(merges)}
+        self.sot_token_id = self.encoder["<start_of_text>"]
+        self.eot_token_id = self.encoder["<end_of_text>"]
+        self.encode_piece = lru_cache(maxsize=65536)(self._encode_piece)
+
+    def _bpe(self, token: str) -> List[str]:
+        word = list(token[:-1]) + [token[-1] + "</w>"]
+        ranks = self.bpe_ranks
+        while len(word) > 1:
+            best = None
+            best_rank = None
+            for pair in zip(word, word[1:]):
+                rank = ranks.get(pair)
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best, best_rank = pair, rank
+            if best is None:
+                break
+            first, second = best
+            merged: List[str] = []
+            index = 0
+            while index < len(word):
+                if index < len(word) - 1 and word[index] == first and word[index + 1] == second:
+                    merged.append(first + second)
+                    index += 2
+                else:
+                    merged.append(word[index])
+                    index += 1
+            word = merged
+        return word
+
+    def _encode_piece(self, piece: str) -> Tuple[int, ...]:
+        if piece in ("<start_of_text>", "<end_of_text>"):
+            return (self.encoder[piece],)
+        token = "".join(self.byte_encoder[byte] for byte in piece.encode("utf-8"))
+        return tuple(self.encoder[part] for part in self._bpe(token))
+
+    def encode(self, text: str) -> List[int]:
+        """Token ids for ``text`` (without start/end markers)."""
+
+        text = " ".join(html.unescape(html.unescape(text)).split()).lower()
+        ids: List[int] = []
+        for piece in _PIECE_RE.findall(text):
+            ids.extend(self.encode_piece(piece))
+        return ids
+
+    def decode(self, ids: Sequence[int]) -> str:
+        text = "".join(self.decoder[index] for index in ids)
+        raw = bytearray(self.byte_decoder[char] for char in text)
+        return raw.decode("utf-8", errors="replace").replace("</w>", " ").strip()
+
+
+_TOKENIZER: Optional[CLIPTokenizer] = None
+_TOKENIZER_LOCK = threading.Lock()
+
+
+def get_tokenizer() -> CLIPTokenizer:
+    """Shared tokenizer (the merge table is loaded on first use)."""
+
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        with _TOKENIZER_LOCK:
+            if _TOKENIZER is None:
+                _TOKENIZER = CLIPTokenizer()
+    return _TOKENIZER
+
+
+def strip_attention_syntax(text: str) -> str:
+    """Remove ComfyUI emphasis markup, keeping the words the encoder sees."""
+
+    return _SYNTAX_RE.sub(" ", _WEIGHT_RE.sub("", text)).replace("\\(", "(").replace("\\)", ")")
+
+
+@lru_cache(maxsize=8192)
+def _count_segment(text: str) -> int:
+    return len(get_tokenizer().encode(strip_attention_syntax(text)))
+
+
+register_cache_info(
+    "clip_phrases",
+    lambda: (lambda info: (info.hits, info.misses, info.currsize))(_count_segment.cache_info()),
+)
+
+
+def count_tokens(text: str) -> int:
+    """CLIP tokens in ``text``, excluding start/end markers and ``BREAK``."""
+
+    return sum(_count_segment(segment) for segment in _BREAK_RE.split(text or "") if segment)
+
+
+def _cut_points(text: str) -> List[int]:
+    """Word ends outside any parentheses/brackets (safe truncation points)."""
+
+    points: List[int] = []
+    depth = 0
+    for match in re.finditer(r"\S+", text):
+        for index, char in enumerate(match.group()):
+            if char in "([" and (index == 0 or match.group()[index - 1] != "\\"):
+                depth += 1
+            elif char in ")]" and (index == 0 or match.group()[index - 1] != "\\"):
+                depth = max(0, depth - 1)
+        if depth == 0:
+            points.append(match.end())
+    return points
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    """Longest prefix of ``text`` within ``limit`` tokens, cut at a word boundary.
+
+    Emphasis groups are never split; trailing separators are dropped.
+    """
+
+    if count_tokens(text) <= limit:
+        return text
+    points = _cut_points(text)
+    low, high = 0, len(points) - 1
+    best = 0
+    while low <= high:
+        middle = (low + high) // 2
+        if count_tokens(text[:points[middle]]) <= limit:
+            best = points[middle]
+            low = middle + 1
+        else:
+            high = middle - 1
+    return text[:best].rstrip(" ,;.")
+
+
+def split_phrases(text: str) -> List[str]:
+    """Comma/semicolon/newline separated phrases, ignoring separators inside emphasis."""
+
+    phrases: List[str] = []
+    current: List[str] = []
+    depth = 0
+    previous = ""
+    for char in text:
+        if char in "([" and previous != "\\":
+            depth += 1
+        elif char in ")]" and previous != "\\":
+            depth = max(0, depth - 1)
+        if char in ",;\n" and depth == 0:
+            phrases.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+        previous = char
+    phrases.append("".join(current).strip())
+    return [phrase for phrase in phrases if phrase]
+
+
+def phrase_weight(phrase: str) -> float:
+    """Attention weight ComfyUI would apply to most of ``phrase``."""
+
+    explicit = re.search(r":\s*(-?\d+(?:\.\d+)?)\s*\)\s*$", phrase)
+    if explicit:
+        return float(explicit.group(1))
+    stripped = phrase.strip()
+    depth = 0
+    while len(stripped) > 1 and stripped[0] == "(" and stripped[-1] == ")":
+        depth += 1
+        stripped = stripped[1:-1].strip()
+    if depth:
+        return 1.1 ** depth
+    if stripped.startswith("[") and stripped.endswith("]"):
+        return 1 / 1.1
+    return 1.0
+
+
+def default_importance(required: Sequence[str] = ()) -> Callable[[str, int, int], float]:
+    """Importance = emphasis weight with a front-loading bonus; ``required`` phrases are kept."""
+
+    required_lower = [value.lower() for value in required if value]
+
+    def score(phrase: str, index: int, total: int) -> float:
+        lowered = phrase.lower()
+        if any(value in lowered for value in required_lower):
+            return math.inf
+        return phrase_weight(phrase) * (1.0 - 0.5 * index / max(1, total))
+
+    return score
+
+
+def _pack(phrases: List[str], chunk_tokens: int) -> List[List[str]]:
+    chunks: List[List[str]] = [[]]
+    used = 0
+    for phrase in phrases:
+        # A phrase costs its own tokens plus the joining comma
+        cost = _count_segment(phrase) + (1 if chunks[-1] else 0)
+        if chunks[-1] and used + cost > chunk_tokens:
+            chunks.append([])
+            cost -= 1
+            used = 0
+        chunks[-1].append(phrase)
+        used += cost
+    return [chunk for chunk in chunks if chunk]
+
+
+def pack_chunks(
+    text: str,
+    max_tokens: Optional[int] = None,
+    chunk_tokens: int = CHUNK_TOKENS,
+    use_break: bool = True,
+    importance: Optional[Callable[[str, int, int], float]] = None,
+) -> Tuple[str, Dict[str, object]]:
+    """Fit ``text`` into ``max_tokens`` and lay it out in whole-phrase chunks.
+
+    Phrases are never split across a chunk boundary: when one would straddle
+    it, a ``BREAK`` is placed before it (``use_break``). If the prompt is over
+    budget the least important phrases (by ``importance(phrase, index,
+    total)``) are dropped first, so front-loaded and emphasized content
+    survives; the remaining phrases keep their original order.
+
+    Returns the new prompt and a summary (tokens before/after, chunks,
+    dropped phrases).
+    """
+
+    before = count_tokens(text)
+    limit = max_tokens or before
+    max_chunks = max(1, math.ceil(limit / chunk_tokens))
+    phrases = split_phrases(_BREAK_RE.sub(", ", text))
+    score = importance or default_importance()
+    ranked = sorted(range(len(phrases)), key=lambda index: score(phrases[index], index, len(phrases)))
+    dropped: List[str] = []
+
+    def render(kept: List[str]) -> Tuple[str, int]:
+        if use_break:
+            chunks = _pack(kept, chunk_tokens)
+            return f" {BREAK_KEYWORD} ".join(", ".join(chunk) for chunk in chunks), len(chunks)
+        joined = ", ".join(kept)
+        return joined, max(1, math.ceil(count_tokens(joined) / chunk_tokens))
+
+    removed: set = set()
+    kept = list(phrases)
+    result, chunks = render(kept)
+    while kept and (count_tokens(result) > limit or chunks > max_chunks):
+        victim = next(index for index in ranked if index not in removed)
+        if score(phrases[victim], victim, len(phrases)) == math.inf:
+            break
+        removed.add(victim)
+        dropped.append(phrases[victim])
+        kept = [phrase for index, phrase in enumerate(phrases) if index not in removed]
+        result, chunks = render(kept)
+    if count_tokens(result) > limit and not use_break:
+        # Only required phrases are left; cut the tail at a token boundary
+        result = truncate_to_tokens(result, limit)
+    return result, {
+        "tokens_before": before,
+        "tokens_after": count_tokens(result),
+        "chunks": chunks,
+        "dropped_phrases": dropped,
+    }
@@ -0,0 +1,442 @@
+"""
+Model-free prompt expansion for ``llm_backend="none"``
+
+Builds prompts from the user's concept, the resolved node settings and phrase
+banks, with no model server involved: the same inputs and seed always give the
+same prompt, and a prompt takes well under a millisecond, so the nodes can run
+in bulk for dataset generation and smoke tests on machines without a GPU.
+
+Image prompts follow the platform's prompt style (sentences for natural
+language models, comma-separated tags for CLIP/booru models, a single change
+sentence for edit models) and are filled to the platform's word target.
+Video prompts reuse the expansion presets and ``RANDOM_POOLS`` to write one
+paragraph per shot, scaled to the expansion tier's word count.
+
+The text-to-image fallback used when the main LLM fails builds on the same
+setting phrases (:func:`settings_to_phrases`).
+"""
+
+import random
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .presets import RANDOM_POOLS, get_preset
+
+
+TIER_ALIASES = {
+    "concise": "basic",
+    "moderate": "enhanced",
+    "detailed": "advanced",
+    "exhaustive": "cinematic",
+}
+
+# Lower bounds of the word counts the LLM is asked for in expand_prompt()
+VIDEO_TIER_WORDS = {"basic": 150, "enhanced": 250, "advanced": 400, "cinematic": 600}
+
+# Share of the platform's max_words an image prompt is filled to, per tier
+IMAGE_TIER_SCALE = {"basic": 0.5, "enhanced": 0.75, "advanced": 1.0, "cinematic": 1.2}
+
+SHOT_COUNTS = {
+    "continuous_paragraph": 1,
+    "2_shot_structure": 2,
+    "3_shot_structure": 3,
+    "4_shot_structure": 4,
+}
+
+SETTING_TEMPLATES = {
+    "camera_angle": "shot from {value}",
+    "composition": "composition guided by {value}",
+    "lighting_source": "lit by {value}",
+    "lighting_quality": "lighting quality is {value}",
+    "time_of_day": "set during {value}",
+    "historical_period": "evokes the {value}",
+    "weather": "{value} conditions",
+    "color_mood": "{value} color palette",
+    "genre_style": "{value} tone",
+    "subject_framing": "{value} framing",
+    "subject_pose": "subject posed {value}",
+}
+
+# Sentence-level detail for natural-language image platforms
+NATURAL_BANKS: Dict[str, Sequence[str]] = {
+    "subject": (
+        "the main subject is rendered with clear, believable proportions",
+        "small details on the subject reward a closer look",
+        "the subject's expression and posture carry a quiet sense of story",
+        "fabric, skin and hair show distinct, tactile textures",
+        "the subject stands out cleanly against the background",
+        "the silhouette of the subject reads clearly at a glance",
+    ),
+    "environment": (
+        "the surroundings are layered with a distinct foreground, midground and background",
+        "environmental details ground the scene in a specific, lived-in place",
+        "secondary elements around the subject add context without clutter",
+        "the setting recedes into the distance with natural atmospheric perspective",
+        "weathered surfaces and props hint at the history of the place",
+        "the background is softly resolved so it supports rather than competes",
+    ),
+    "atmosphere": (
+        "a faint haze softens the far distance",
+        "dust motes drift through shafts of light",
+        "the air feels still and heavy with mood",
+        "a gentle breeze stirs loose fabric and foliage",
+        "soft mist pools low across the ground",
+        "the overall mood is calm, immersive and cinematic",
+    ),
+    "lighting": (
+        "highlights roll off smoothly into deep, detailed shadows",
+        "rim light separates the subject from the background",
+        "bounced fill light keeps the shadow side readable",
+        "light falls off naturally across the frame",
+        "specular glints pick out wet and metallic surfaces",
+    ),
+    "camera": (
+        "shallow depth of field isolates the subject",
+        "the framing leaves deliberate negative space",
+        "leading lines guide the eye toward the focal point",
+        "the perspective feels natural, as if seen through a prime lens",
+        "crisp focus sits exactly on the point of interest",
+    ),
+    "finish": (
+        "rich, nuanced color grading ties the palette together",
+        "fine surface detail is resolved with crisp clarity",
+        "tonal transitions are smooth with no banding",
+        "the image has the polish of a professional production",
+        "textures stay sharp while gradients remain soft",
+    ),
+}
+
+# Short tags for CLIP and booru-style platforms
+TAG_BANKS: Dict[str, Sequence[str]] = {
+    "subject": ("detailed face", "expressive eyes", "intricate clothing", "dynamic pose", "sharp features", "natural skin texture"),
+    "environment": ("detailed background", "scenic backdrop", "depth", "layered scenery", "environmental storytelling"),
+    "atmosphere": ("atmospheric", "volumetric fog", "floating particles", "ambient haze", "moody"),
+    "lighting": ("dramatic lighting", "rim light", "soft shadows", "cinematic lighting", "light rays"),
+    "camera": ("depth of field", "sharp focus", "bokeh", "rule of thirds", "wide angle"),
+    "finish": ("high resolution", "fine details", "vivid colors", "color graded", "crisp"),
+}
+
+BOORU_TAGS: Sequence[str] = (
+    "1girl", "solo", "looking at viewer", "outdoors", "indoors", "upper body", "full body",
+    "cowboy shot", "from side", "from above", "light particles", "scenery",
+)
+
+EDIT_SUFFIXES: Sequence[str] = (
+    "keeping the rest of the image unchanged",
+    "preserving the original composition and lighting",
+    "blending the change seamlessly with the existing image",
+)
+
+# Per-shot beats for video prompts
+VIDEO_ATMOSPHERE: Sequence[str] = (
+    "mist drifts slowly through the frame",
+    "dust particles glitter in the light",
+    "loose fabric ripples in a soft breeze",
+    "steam curls upward and dissolves",
+    "light rain streaks past in the foreground",
+    "leaves tumble lazily across the ground",
+    "embers float upward and fade",
+    "thin clouds slide across the sky",
+)
+
+VIDEO_DETAIL: Sequence[str] = (
+    "Every surface carries fine texture, from worn edges to subtle reflections.",
+    "Background elements move naturally, keeping the world alive behind the subject.",
+    "Shadows shift gently as the light source changes angle.",
+    "The color palette stays consistent, tying the shots together.",
+    "Motion is smooth and physically grounded, with natural weight and momentum.",
+    "Sound-implying details, like rustling cloth and distant echoes, deepen the mood.",
+    "Depth cues layer the frame from foreground silhouettes to a hazy horizon.",
+    "Small gestures and glances give the subject a clear inner life.",
+)
+
+FINAL_CUES: Sequence[str] = ("Final shot,", "Final wide reveal,", "Final establishing shot,")
+
+
+def _usable(value: Any) -> bool:
+    if not value:
+        return False
+    lowered = str(value).lower()
+    return "auto" not in lowered and "none" not in lowered and "random" not in lowered
+
+
+def settings_to_phrases(settings: Dict[str, str]) -> List[str]:
+    """Descriptive phrases for the resolved text-to-image settings (auto/none skipped)."""
+
+    phrases: List[str] = []
+    for key, template in SETTING_TEMPLATES.items():
+        value = settings.get(key)
+        if not value:
+            continue
+        lowered = value.lower()
+        if "auto" in lowered or "none" in lowered:
+            continue
+        phrase = template.format(value=value)
+        if phrase not in phrases:
+            phrases.append(phrase)
+    return phrases
+
+
+def analysis_to_phrases(analyses: Sequence[Dict[str, Any]]) -> List[str]:
+    """
+    Reference phrases from text-to-image reference analyses
+
+    Uses the caption when there is one, otherwise the measured traits
+    (framing, exposure, contrast, color temperature, palette). Directive
+    instructions and guidance notes are left out: they address a model, not
+    the image prompt. Analyses without either are skipped.
+    """
+    phrases: List[str] = []
+    for analysis in analyses:
+        phrase = (analysis.get("vision_caption") or "").strip()
+        if not phrase and analysis.get("tone"):
+            traits = [
+                f"{analysis.get('orientation', 'balanced')} framing with {analysis['tone']} exposure",
+                analysis.get("contrast_description"),
+                analysis.get("temperature_description"),
+            ]
+            palette = analysis.get("palette_names") or []
+            if palette:
+                traits.append(f"palette of {', '.join(palette)}")
+            phrase = ", ".join(trait for trait in traits if trait)
+        phrase = phrase.rstrip(".,; ")
+        if phrase and phrase not in phrases:
+            phrases.append(phrase)
+    return phrases
+
+
+def _seeded_rng(seed: Optional[int], *parts: Any) -> random.Random:
+    """Private RNG keyed by the seed and the inputs, leaving the global one untouched."""
+
+    key = "\x1f".join(str(part) for part in parts)
+    return random.Random(((seed or 0) << 32) ^ zlib.crc32(key.encode("utf-8")))
+
+
+def _word_count(parts: Sequence[str]) -> int:
+    return sum(len(part.split()) for part in parts)
+
+
+def _sentence(text: str) -> str:
+    text = text.strip().rstrip(".,; ")
+    return text[:1].upper() + text[1:] + "." if text else ""
+
+
+def _image_family(platform: str, platform_config: Dict[str, Any]) -> str:
+    style = str(platform_config.get("prompt_style", ""))
+    if platform == "pony":
+        return "pony"
+    if style == "edit_focused":
+        return "edit"
+    if style == "booru_detailed":
+        return "booru"
+    if style == "token_optimized":
+        return "tags"
+    return "natural"
+
+
+class DeterministicExpander:
+    """Seeded, model-free counterpart of the LLM expansion for images and video."""
+
+    def expand_image(
+        self,
+        base_prompt: str,
+        platform: str,
+        platform_config: Dict[str, Any],
+        settings: Dict[str, str],
+        reference_phrases: Sequence[str] = (),
+        seed: Optional[int] = None,
+        tier: str = "advanced",
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Expand a text-to-image prompt without an LLM
+
+        Setting phrases and reference phrases (see :func:`analysis_to_phrases`)
+        come first, then phrase-bank detail until the platform's word target
+        (scaled by tier) is reached.
+
+        Returns:
+            Tuple of (prompt, meta)
+        """
+        tier = TIER_ALIASES.get(tier, tier)
+        base = (base_prompt or "").strip().rstrip(".,; ") or "a vividly described scene"
+        family = _image_family(platform, platform_config)
+        rng = _seeded_rng(seed, base, platform, tier)
+
+        target_words = int((platform_config.get("max_words") or 150) * IMAGE_TIER_SCALE.get(tier, 1.0))
+        setting_phrases = settings_to_phrases(settings)
+        reference_phrases = list(dict.fromkeys(phrase.strip() for phrase in reference_phrases if phrase and phrase.strip()))
+
+        if family == "edit":
+            prompt = f"{_sentence(base)[:-1]}, {rng.choice(EDIT_SUFFIXES)}."
+            return prompt, self._meta("image", family, prompt, len(setting_phrases), len(reference_phrases), 0, seed)
+
+        leading = setting_phrases + reference_phrases
+        banks = TAG_BANKS if family in ("tags", "booru", "pony") else NATURAL_BANKS
+        bank_phrases = self._fill_from_banks(rng, banks, _word_count([base] + leading), target_words)
+
+        if family == "natural":
+            parts = [_sentence(base)] + [_sentence(phrase) for phrase in leading + bank_phrases]
+            prompt = " ".join(part for part in parts if part)
+        else:
+            tags = [base]
+            if family == "booru":
+                tags.extend(rng.sample(list(BOORU_TAGS), 2))
+            if platform_config.get("quality_emphasis") and family != "pony":
+                tags.extend(list(platform_config.get("quality_tokens") or [])[:3])
+            tags.extend(leading + bank_phrases)
+            prompt = ", ".join(dict.fromkeys(tag for tag in tags if tag))
+
+        return prompt, self._meta(
+            "image", family, prompt, len(setting_phrases), len(reference_phrases), len(bank_phrases), seed
+        )
+
+    def expand_video(
+        self,
+        base_prompt: str,
+        preset: str,
+        tier: str,
+        mode: str = "text-to-video",
+        aesthetic_controls: Optional[Dict[str, str]] = None,
+        variation_seed: Optional[int] = None,
+        shot_structure: str = "3_shot_structure",
+        vision_caption: str = "",
+        seed: Optional[int] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Expand a video prompt into shot paragraphs without an LLM
+
+        Camera, lighting and motion come from the user's aesthetic controls,
+        then the preset's preferences, then RANDOM_POOLS. Every shot names
+        framing and camera movement, repeats the subject and carries
+        atmospheric motion; the last shot opens with an ending cue.
+
+        Returns:
+            Tuple of (prompt, meta)
+        """
+        tier = TIER_ALIASES.get(tier, tier)
+        if tier not in VIDEO_TIER_WORDS:
+            tier = "enhanced"
+        subject = (base_prompt or "").strip().rstrip(".,; ") or "the subject"
+        rng = _seeded_rng(seed, subject, preset, tier, variation_seed, shot_structure)
+        preset_config = get_preset(preset)
+        controls = {key: value for key, value in (aesthetic_controls or {}).items() if _usable(value)}
+
+        def pick(control: str, preference: Optional[str], pool: str) -> str:
+            if control in controls:
+                return str(controls[control])
+            options = list(preset_config.get(preference) or []) if preference and preset != "random" else []
+            options = options or list(RANDOM_POOLS.get(pool, ()))
+            return rng.choice(options) if options else ""
+
+        style_hints = list(preset_config.get("style_hints") or [])
+        style = controls.get("visual_style") or controls.get("art_style") or rng.choice(style_hints or RANDOM_POOLS["visual_styles"])
+        time_of_day = controls.get("time_of_day") or rng.choice(RANDOM_POOLS["times_of_day"])
+        if "time_of_day" not in controls and any(word.split()[0] in subject.lower() for word in RANDOM_POOLS["times_of_day"]):
+            # The concept already names a time of day; don't contradict it
+            time_of_day = ""
+        color = controls.get("color_tone") or rng.choice(RANDOM_POOLS["color_tones"])
+        motions = list(preset_config.get("motion_preferences") or []) or ["natural, fluid movement"]
+
+        shot_count = SHOT_COUNTS.get(shot_structure, 3)
+        shot_sizes = list(RANDOM_POOLS["shot_sizes"])
+        rng.shuffle(shot_sizes)
+        atmosphere = list(VIDEO_ATMOSPHERE)
+        rng.shuffle(atmosphere)
+
+        opening = f"{_sentence(subject)} {_sentence(', '.join(part for part in (style, time_of_day, color) if part))}"
+        if vision_caption and mode == "image-to-video":
+            opening += f" {_sentence('matching the reference image: ' + vision_caption.split('. ')[0])}"
+        extras = [
+            str(controls[key]) for key in ("composition", "lens", "camera_angle", "visual_effect", "scene_detail")
+            if key in controls
+        ]
+        if "character_emotion" in controls:
+            extras.append(f"the subject conveys {controls['character_emotion']}")
+
+        shots: List[List[str]] = []
+        for index in range(shot_count):
+            size = controls.get("shot_size") if index == 0 and "shot_size" in controls else shot_sizes[index % len(shot_sizes)]
+            movement = pick("camera_movement", None, "camera_movements")
+            camera_style = pick("", "camera_preferences", "lenses")
+            lighting = pick("light_source", "lighting_preferences", "lighting_types")
+            if "lighting_quality" in controls:
+                lighting = f"{lighting} with {controls['lighting_quality']}"
+            lead = rng.choice(FINAL_CUES) if index == shot_count - 1 and shot_count > 1 else ""
+            # Repeat the subject every shot so identity carries across cuts
+            subject_ref = subject if index == 0 else f"the same scene, {subject}"
+            sentences = [
+                _sentence(f"{lead} {size}, {movement}, {camera_style}: {subject_ref}".strip()),
+                _sentence(f"lighting: {lighting}; motion: {rng.choice(motions)}"),
+                _sentence(atmosphere[index % len(atmosphere)]),
+            ]
+            if index == 0 and extras:
+                sentences.append(_sentence(", ".join(extras)))
+            shots.append(sentences)
+
+        target_words = VIDEO_TIER_WORDS[tier]
+        fillers = list(VIDEO_DETAIL)
+        rng.shuffle(fillers)
+        extra = [phrase for bank in NATURAL_BANKS.values() for phrase in bank]
+        rng.shuffle(extra)
+        fillers.extend(_sentence(phrase) for phrase in extra)
+        detail_index = 0
+        words = _word_count([opening] + [" ".join(shot) for shot in shots])
+        while words < target_words and detail_index < len(fillers):
+            shots[detail_index % shot_count].append(fillers[detail_index])
+            words += len(fillers[detail_index].split())
+            detail_index += 1
+
+        if shot_count == 1:
+            prompt = " ".join([opening] + shots[0])
+        else:
+            prompt = opening + "\n\n" + "\n\n".join(
+                f"Shot {index + 1}: " + " ".join(shot) for index, shot in enumerate(shots)
+            )
+        meta = self._meta("video", f"{shot_count}_shot", prompt, len(controls), 0, detail_index, seed)
+        meta["variation_seed"] = variation_seed
+        return prompt, meta
+
+    @staticmethod
+    def _fill_from_banks(
+        rng: random.Random,
+        banks: Dict[str, Sequence[str]],
+        words: int,
+        target_words: int,
+    ) -> List[str]:
+        """Round-robin phrases from each bank (shuffled per seed) until ``target_words``."""
+
+        queues = []
+        for name in banks:
+            options = list(banks[name])
+            rng.shuffle(options)
+            queues.append(options)
+        chosen: List[str] = []
+        while words < target_words and any(queues):
+            for options in queues:
+                if not options or words >= target_words:
+                    continue
+                phrase = options.pop()
+                chosen.append(phrase)
+                words += len(phrase.split())
+        return chosen
+
+    @staticmethod
+    def _meta(
+        kind: str,
+        family: str,
+        prompt: str,
+        setting_phrases: int,
+        reference_phrases: int,
+        bank_phrases: int,
+        seed: Optional[int],
+    ) -> Dict[str, Any]:
+        return {
+            "engine": "deterministic",
+            "kind": kind,
+            "style": family,
+            "words": len(prompt.split()),
+            "setting_phrases": setting_phrases,
+            "reference_phrases": reference_phrases,
+            "bank_phrases": bank_phrases,
+            "seed": seed,
+        }
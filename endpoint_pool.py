@@ -0,0 +1,207 @@
+"""
+Endpoint pools for spreading backend requests across several servers
+
+``api_endpoint`` may list several LM Studio / Ollama URLs separated by commas,
+semicolons or newlines, optionally prefixed with a strategy in brackets::
+
+    [least_outstanding] http://gpu-a:1234/v1, http://gpu-b:1234/v1
+
+Pools are shared process-wide (keyed by the endpoint list) so every node and
+every LLMBackend instance sees the same in-flight counts and latency averages.
+Health comes from the endpoint's circuit breaker: endpoints whose breaker is
+open are skipped while any other endpoint is available.
+"""
+
+import os
+import random
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .circuit_breaker import get_breaker
+
+
+LB_STRATEGIES = ("round_robin", "least_outstanding", "latency_ewma")
+LB_STRATEGY_ENV = "PROMPT_ENHANCER_LB_STRATEGY"
+DEFAULT_STRATEGY = "round_robin"
+
+EWMA_ALPHA = 0.3
+
+_SPLIT_RE = re.compile(r"[,;\s]+")
+_STRATEGY_RE = re.compile(r"^\s*\[([A-Za-z_\-]+)\]\s*")
+
+
+def parse_endpoints(spec: str) -> Tuple[List[str], Optional[str]]:
+    """Split an ``api_endpoint`` value into URLs and an optional strategy."""
+
+    spec = spec or ""
+    strategy = None
+    match = _STRATEGY_RE.match(spec)
+    if match:
+        strategy = match.group(1).lower().replace("-", "_")
+        spec = spec[match.end():]
+    endpoints: List[str] = []
+    for part in _SPLIT_RE.split(spec.strip()):
+        url = part.strip().rstrip("/")
+        if url and url not in endpoints:
+            endpoints.append(url)
+    return endpoints, strategy
+
+
+def resolve_strategy(strategy: Optional[str]) -> str:
+    name = (strategy or os.environ.get(LB_STRATEGY_ENV, "") or DEFAULT_STRATEGY).strip().lower()
+    if name not in LB_STRATEGIES:
+        print(f"[LLM Backend] Unknown load-balancing strategy '{name}', using {DEFAULT_STRATEGY}")
+        return DEFAULT_STRATEGY
+    return name
+
+
+class EndpointState:
+    """Running statistics and health for one endpoint."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency_ewma: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.breaker = get_breaker(url)
+
+    def healthy(self) -> bool:
+        return self.breaker.available()
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy(),
+            "breaker": self.breaker.state,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ewma": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class EndpointPool:
+    """Selects an endpoint per request and tracks the outcome."""
+
+    def __init__(self, endpoints: Sequence[str], strategy: Optional[str] = None):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.strategy = resolve_strategy(strategy)
+        self._states = {url: EndpointState(url) for url in self.endpoints}
+        self._cursor = 0
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def state(self, url: str) -> Optional[EndpointState]:
+        return self._states.get(url)
+
+    def select(self, exclude: Sequence[str] = ()) -> str:
+        """Pick an endpoint without reserving it or advancing the rotation."""
+
+        with self._lock:
+            cursor = self._cursor
+            try:
+                return self._select_locked(exclude)
+            finally:
+                self._cursor = cursor
+
+    def acquire(self, exclude: Sequence[str] = ()) -> str:
+        """Pick an endpoint and count the request as in flight."""
+
+        with self._lock:
+            url = self._select_locked(exclude)
+            state = self._states[url]
+            state.outstanding += 1
+            state.requests += 1
+            return url
+
+    def release(self, url: str, success: bool, elapsed: float, error: Optional[str] = None) -> None:
+        """Record the outcome of a request started with :meth:`acquire`."""
+
+        with self._lock:
+            state = self._states.get(url)
+            if state is None:
+                return
+            state.outstanding = max(0, state.outstanding - 1)
+            if success:
+                if state.latency_ewma is None:
+                    state.latency_ewma = elapsed
+                else:
+                    state.latency_ewma += EWMA_ALPHA * (elapsed - state.latency_ewma)
+            else:
+                state.failures += 1
+                state.last_error = error
+
+    def health(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [self._states[url].to_dict() for url in self.endpoints]
+
+    def _select_locked(self, exclude: Sequence[str]) -> str:
+        allowed = [url for url in self.endpoints if url not in exclude] or list(self.endpoints)
+        candidates = [url for url in allowed if self._states[url].healthy()]
+        if not candidates:
+            # Every breaker is open: use the one that will admit a trial first
+            return min(allowed, key=lambda url: self._states[url].breaker.retry_after())
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if self.strategy == "least_outstanding":
+            fewest = min(self._states[url].outstanding for url in candidates)
+            candidates = [url for url in candidates if self._states[url].outstanding == fewest]
+        elif self.strategy == "latency_ewma":
+            return self._weighted_choice(candidates)
+        return self._next_in_rotation(candidates)
+
+    def _next_in_rotation(self, candidates: List[str]) -> str:
+        total = len(self.endpoints)
+        for step in range(total):
+            url = self.endpoints[(self._cursor + step) % total]
+            if url in candidates:
+                self._cursor = (self._cursor + step + 1) % total
+                return url
+        return candidates[0]
+
+    def _weighted_choice(self, candidates: List[str]) -> str:
+        known = [self._states[url].latency_ewma for url in candidates if self._states[url].latency_ewma]
+        # Unmeasured endpoints get the best observed latency so they are explored
+        default = min(known) if known else 1.0
+        weights = []
+        for url in candidates:
+            state = self._states[url]
+            latency = state.latency_ewma or default
+            weights.append(1.0 / (max(latency, 1e-3) * (state.outstanding + 1)))
+        return self._rng.choices(candidates, weights=weights, k=1)[0]
+
+
+_POOLS: Dict[Tuple[str, ...], EndpointPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(endpoints: Sequence[str], strategy: Optional[str] = None) -> EndpointPool:
+    """Return the shared pool for this endpoint list (created on first use)."""
+
+    key = tuple(endpoints)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = EndpointPool(key, strategy)
+            _POOLS[key] = pool
+        elif strategy or os.environ.get(LB_STRATEGY_ENV):
+            pool.strategy = resolve_strategy(strategy)
+        return pool
+
+
+def pool_health() -> Dict[str, List[Dict[str, object]]]:
+    """Health of every pool created so far, keyed by its endpoint list."""
+
+    with _POOLS_LOCK:
+        pools = list(_POOLS.items())
+    return {", ".join(key): pool.health() for key, pool in pools}
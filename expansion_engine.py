@@ -5,16 +5,24 @@ Core expansion engine - VERSION 1.3 - FIXED RANDOM + WILDCARDS
 - NEW: Wildcard support {category:option1|option2|option3}
 """
 
-import random
-import re
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 from .presets import get_preset, get_random_elements, RANDOM_POOLS
 from .utils import detect_complexity, parse_keywords, clean_llm_output, extract_prompt_from_response
+from .wildcards import expand_wildcards, iter_wildcard_combinations
 
 
 class PromptExpander:
     """Main prompt expansion engine with wildcards and enhanced detail requirements"""
     
+    # Axes a regenerated variation is steered along (indexed by variation_seed)
+    VARIATION_AXES = (
+        "camera approach and framing",
+        "lighting setup and time of day",
+        "action beat and subject motion",
+        "color palette and atmosphere",
+        "setting details and background",
+    )
+    
     def __init__(self):
         self.wan_guide = self._load_wan_guide()
     
@@ -41,7 +49,8 @@ class PromptExpander:
         
         Wildcards syntax:
         - {animal:cat|dog|bird} - picks one randomly
-        - {animal} - if you have predefined categories
+        - {animal} - predefined categories or wildcard files
+        - {red|blue} - anonymous alternation, may be nested
         
         tier parameter accepts both old and new names:
         - Old: auto, basic, enhanced, advanced, cinematic
@@ -61,21 +70,17 @@ class PromptExpander:
             "exhaustive": "cinematic"
         }
         
+        # STEP 1: Process wildcards in the input prompt
+        processed_prompt, wildcard_replacements = self._process_wildcards(basic_prompt, variation_seed)
+        
         # Convert new names to old internal names
         if tier in tier_mapping:
             detected_tier = tier_mapping[tier]
         elif tier == "auto":
-            # STEP 1: Process wildcards in the input prompt
-            processed_prompt, wildcard_replacements = self._process_wildcards(basic_prompt, variation_seed)
             detected_tier = detect_complexity(processed_prompt)
         else:
             # Old tier names still work
             detected_tier = tier
-            processed_prompt, wildcard_replacements = self._process_wildcards(basic_prompt, variation_seed)
-        
-        # STEP 1b: Process wildcards if not done yet (for non-auto cases)
-        if tier != "auto":
-            processed_prompt, wildcard_replacements = self._process_wildcards(basic_prompt, variation_seed)
         
         # STEP 3: Get preset configuration
         preset_config = get_preset(preset)
@@ -140,78 +145,86 @@ class PromptExpander:
         """
         Process wildcards in the prompt
         
-        Supported formats:
+        Supported formats (see wildcards.py):
         - {category:option1|option2|option3} - inline options
-        - {category} - predefined categories
+        - {category} - predefined categories and wildcard files
+        - {option1|option2} - alternations, nesting allowed
         
         Returns:
             Tuple of (processed_prompt, replacements_dict)
         """
-        if not prompt or '{' not in prompt:
-            return prompt, {}
-        
-        # Set random seed for reproducibility if provided
-        if seed is not None:
-            random.seed(seed)
-        
-        replacements = {}
-        processed = prompt
+        return expand_wildcards(prompt, seed=seed)
+    
+    def iter_wildcard_prompts(
+        self,
+        prompt: str,
+        wildcard_mode: str = "enumerate",
+        count: Optional[int] = None,
+        seed: Optional[int] = None
+    ) -> Iterator[Tuple[int, str, Dict]]:
+        """
+        Lazily yield (index, processed_prompt, replacements) for a wildcard prompt
         
-        # Pattern for inline wildcards: {name:opt1|opt2|opt3}
-        inline_pattern = r'\{([^:}]+):([^}]+)\}'
+        wildcard_mode:
+        - enumerate: every combination in order (capped by count)
+        - stratified: count distinct samples spread across the combinations
+        - random: count independent random draws
+        """
+        return iter_wildcard_combinations(prompt, wildcard_mode, count, seed)
+    
+    def wildcard_variations(self, prompt: str, wildcard_mode: str, count: int) -> List[str]:
+        """
+        Resolve wildcards for a node's variations
         
-        for match in re.finditer(inline_pattern, prompt):
-            full_match = match.group(0)
-            category = match.group(1).strip()
-            options_str = match.group(2)
-            options = [opt.strip() for opt in options_str.split('|')]
-            
-            # Pick random option
-            chosen = random.choice(options)
-            replacements[category] = chosen
-            
-            # Replace in prompt
-            processed = processed.replace(full_match, chosen, 1)
-        
-        # Pattern for predefined wildcards: {name}
-        predefined_pattern = r'\{([^:}]+)\}'
-        
-        # Predefined wildcard categories
-        predefined_wildcards = {
-            "animal": ["cat", "dog", "bird", "horse", "rabbit", "fox", "deer", "wolf"],
-            "person": ["man", "woman", "child", "elder", "teenager", "artist", "scientist"],
-            "profession": ["detective", "chef", "doctor", "teacher", "engineer", "musician", "artist"],
-            "instrument": ["piano", "guitar", "violin", "drums", "saxophone", "flute"],
-            "location": ["park", "studio", "street", "forest", "beach", "city", "room"],
-            "weather": ["sunny", "rainy", "snowy", "foggy", "stormy", "cloudy"],
-            "time": ["morning", "noon", "afternoon", "evening", "night", "midnight"],
-            "emotion": ["happy", "sad", "angry", "surprised", "calm", "excited", "pensive"],
-            "action": ["walking", "running", "dancing", "working", "playing", "creating"],
-            "color": ["red", "blue", "green", "yellow", "purple", "orange", "black", "white"],
-            "vehicle": ["car", "motorcycle", "bicycle", "truck", "bus", "train", "boat"],
-            "tool": ["hammer", "wrench", "paintbrush", "camera", "telescope", "microscope"],
-            "object": ["book", "ball", "box", "bottle", "phone", "computer", "chair"]
-        }
+        "random" rolls once and shares the result across all variations;
+        "enumerate"/"stratified" give each variation its own distinct
+        combination (fewer than count if the prompt has fewer combinations).
+        """
+        if wildcard_mode == "random":
+            processed, _ = expand_wildcards(prompt)
+            return [processed] * count
+        variations = [processed for _, processed, _ in self.iter_wildcard_prompts(prompt, wildcard_mode, count)]
+        return variations or [prompt]
+    
+    def iter_expansions(
+        self,
+        basic_prompt: str,
+        wildcard_mode: str = "enumerate",
+        count: Optional[int] = None,
+        seed: Optional[int] = None,
+        **expand_kwargs
+    ) -> Iterator[Tuple[str, str, Dict]]:
+        """
+        Stream expand_prompt() over the combinations of a wildcard prompt
         
-        for match in re.finditer(predefined_pattern, processed):
-            full_match = match.group(0)
-            category = match.group(1).strip().lower()
-            
-            # Skip if already processed (was inline format)
-            if category in replacements:
-                continue
-            
-            # Check if we have this category
-            if category in predefined_wildcards:
-                chosen = random.choice(predefined_wildcards[category])
-                replacements[category] = chosen
-                processed = processed.replace(full_match, chosen, 1)
+        Each combination is expanded with its combination index as
+        variation_seed, so nothing beyond the current prompt is held in memory.
+        Remaining keyword arguments are passed through to expand_prompt().
         
-        # Reset random state
-        if seed is not None:
-            random.seed()
+        Yields:
+            Tuple of (system_prompt, user_prompt, breakdown_dict)
+        """
+        for index, processed, replacements in self.iter_wildcard_prompts(basic_prompt, wildcard_mode, count, seed):
+            system_prompt, user_prompt, breakdown = self.expand_prompt(
+                basic_prompt=processed,
+                variation_seed=index,
+                **expand_kwargs
+            )
+            breakdown["wildcard_index"] = index
+            if replacements:
+                breakdown["wildcard_replacements"] = replacements
+                breakdown["original_prompt"] = basic_prompt
+                breakdown["processed_prompt"] = processed
+            yield system_prompt, user_prompt, breakdown
+    
+    def regeneration_seed(self, index: int, attempt: int) -> int:
+        """
+        variation_seed for re-running variation ``index`` after a near-duplicate
         
-        return processed, replacements if replacements else {}
+        Always past the first-round seeds, and each attempt steers along the
+        next of VARIATION_AXES.
+        """
+        return len(self.VARIATION_AXES) * attempt + (index + attempt - 1) % len(self.VARIATION_AXES)
     
     def _merge_random_with_controls(self, random_elements: Dict, user_controls: Dict) -> Dict:
         """
@@ -306,24 +319,30 @@ PRESET: {preset_name}
         
         prompt += self._get_detailed_tier_instructions(tier, mode, preset_name)
         
+        # Add creativity mode instructions
+        prompt += self._format_creativity_instructions(creativity_mode)
+        
+        # Add Wan 2.2 reference (static; kept ahead of per-run content so the
+        # backend can reuse the cached prompt prefix)
+        if tier in ["advanced", "cinematic"]:
+            prompt += self._get_wan_guide_section(tier, preset_config)
+        
         # Add aesthetic controls if provided (for advanced node)
         if aesthetic_controls:
             prompt += self._format_aesthetic_controls(aesthetic_controls)
         
-        # Add creativity mode instructions
-        prompt += self._format_creativity_instructions(creativity_mode)
-        
         # Add vision context and reference mode instructions (Pass 2 of 2-pass system)
         if vision_caption:
             prompt += self._format_reference_mode_instructions(vision_caption, reference_mode)
         
-        # Add Wan 2.2 reference
-        if tier in ["advanced", "cinematic"]:
-            prompt += self._get_wan_guide_section(tier, preset_config)
-        
         # Add variation instructions
         if variation_seed is not None:
             prompt += f"\nVARIATION {variation_seed + 1}: Create unique variation by changing camera approach, lighting setup, or specific action details while keeping core concept.\n"
+            # Seeds past the first round come from diversity regeneration:
+            # name a different axis to change so the retry actually diverges
+            if variation_seed >= len(self.VARIATION_AXES):
+                axis = self.VARIATION_AXES[variation_seed % len(self.VARIATION_AXES)]
+                prompt += f"Lead this variation with a clearly different {axis} than the obvious choice; avoid reusing stock phrasing.\n"
         
         # Final reminders
         prompt += f"""\nFINAL REMINDERS:
@@ -7,8 +7,10 @@ import torch
 from typing import Tuple, Optional
 from .llm_backend import LLMBackend
 from .img2img_expansion_engine import ImageToImageExpander
-from .platforms import get_platform_list, get_platform_config
+from .platforms import fit_clip_token_budget, get_platform_list, get_platform_config, get_stop_settings
 from .utils import save_prompts_to_file, parse_keywords
+from .wildcards import expand_wildcards
+from .telemetry import span, timed_stage, traced_node, timing_metadata, timing_status
 from .qwen3_vl_backend import caption_with_qwen3_vl
 
 
@@ -216,6 +218,7 @@ class ImageToImagePromptExpander:
     CATEGORY = "Eric Prompt Enhancers"
     OUTPUT_NODE = True
     
+    @traced_node("image_to_image")
     def expand_img2img_prompt(
         self,
         image: torch.Tensor,
@@ -241,6 +244,9 @@ class ImageToImagePromptExpander:
         """Main processing function"""
         
         try:
+            # Process wildcards and alternations in the change request
+            change_request, _ = expand_wildcards(change_request)
+            
             # STEP 1: Analyze image with vision model
             if use_vision_model:
                 image_desc_result = self._analyze_image_for_editing(
@@ -259,8 +265,10 @@ class ImageToImagePromptExpander:
                     )
                 
                 image_description = image_desc_result["description"]
+                vision_residency = image_desc_result.get("residency", "")
             else:
                 image_description = "[Vision analysis skipped]"
+                vision_residency = ""
             
             # STEP 2: Gather aesthetic controls
             aesthetic_controls = {}
@@ -295,13 +303,15 @@ class ImageToImagePromptExpander:
                 endpoint=expansion_endpoint,
                 model_name=None,  # Auto-detect for all backends
                 temperature=temperature
-            )
+            ).for_task("main_expand")
             
-            response = expansion_llm.send_prompt(
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                max_tokens=500  # Platform-optimized lengths
-            )
+            with span("expand"):
+                response = expansion_llm.send_prompt(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    max_tokens=500,  # Platform-optimized lengths
+                    **get_stop_settings(target_platform)
+                )
             
             if not response["success"]:
                 # Fallback: use basic combination
@@ -315,6 +325,11 @@ class ImageToImagePromptExpander:
             if pos_kw_list:
                 enhanced_prompt += f", {', '.join(pos_kw_list)}"
             
+            # STEP 5.5: Fit CLIP-tokenized platforms to their real token budget
+            enhanced_prompt, clip_budget_meta = fit_clip_token_budget(enhanced_prompt, target_platform)
+            if clip_budget_meta:
+                breakdown_dict["clip_tokens"] = clip_budget_meta
+            
             # STEP 6: Generate negative prompt
             negative_prompt = self.expander.generate_negative_prompt(
                 platform=target_platform,
@@ -330,7 +345,8 @@ class ImageToImagePromptExpander:
                     "vision_model": vision_backend if use_vision_model else "none",
                     "expansion_model": expansion_llm.model_name or "auto-detected",
                     "image_description": image_description,
-                    "change_request": change_request
+                    "change_request": change_request,
+                    "timings": timing_metadata()
                 }
                 
                 breakdown_text = self._format_breakdown(breakdown_dict)
@@ -349,7 +365,13 @@ class ImageToImagePromptExpander:
                 file_status = "Not saved"
             
             platform_name = get_platform_config(target_platform)["name"]
-            status = f"✅ Image-to-Image | Platform: {platform_name} | {file_status}"
+            status = f"✅ Image-to-Image | Platform: {platform_name} | {file_status} | {timing_status()}"
+            breaker_note = expansion_llm.breaker_status()
+            if breaker_note:
+                status += f" | {breaker_note}"
+            for residency_note in (vision_residency, expansion_llm.residency_status()):
+                if residency_note:
+                    status += f" | {residency_note}"
             
             return (
                 enhanced_prompt,
@@ -369,6 +391,7 @@ class ImageToImagePromptExpander:
                 f"❌ {str(e)}"
             )
     
+    @timed_stage("vision")
     def _analyze_image_for_editing(
         self,
         image: torch.Tensor,
@@ -435,7 +458,8 @@ Output ONLY the description."""
                 backend_type=backend,
                 endpoint=endpoint,
                 model_name=None,  # Auto-detect for all backends
-                temperature=temperature
+                temperature=temperature,
+                role="vision"
             )
 
             if backend == "lm_studio":
@@ -456,7 +480,8 @@ Output ONLY the description."""
             
             return {
                 "success": True,
-                "description": description
+                "description": description,
+                "residency": llm.residency_status()
             }
         
         except Exception as e:
@@ -485,7 +510,14 @@ Output ONLY the description."""
             lines.append("\nAESTHETIC CONTROLS:")
             for key, value in breakdown_dict['aesthetic_controls'].items():
                 lines.append(f"  - {key.replace('_', ' ').title()}: {value}")
-        
+
+        clip_tokens = breakdown_dict.get('clip_tokens')
+        if clip_tokens:
+            lines.append(
+                f"\nCLIP TOKENS: {clip_tokens['tokens_before']} → {clip_tokens['tokens_after']} "
+                f"(budget {clip_tokens['budget']}, {len(clip_tokens['dropped_phrases'])} phrase(s) dropped)"
+            )
+
         lines.append("\n" + "=" * 60)
         
         return "\n".join(lines)
@@ -11,6 +11,8 @@ import base64
 from typing import Tuple, Optional
 from .llm_backend import LLMBackend
 from .expansion_engine import PromptExpander
+from .platforms import get_stop_settings
+from .telemetry import span, timed_stage, traced_node, timing_metadata, timing_status
 from .utils import (
     save_prompts_to_file,
     parse_keywords,
@@ -243,6 +245,7 @@ class ImageToVideoPromptExpander:
     CATEGORY = "Eric Prompt Enhancers"
     OUTPUT_NODE = True
     
+    @traced_node("image_to_video")
     def expand_img2vid_prompt(
         self,
         image: torch.Tensor,
@@ -289,8 +292,10 @@ class ImageToVideoPromptExpander:
                     )
                 
                 image_description = image_desc_result["description"]
+                vision_residency = image_desc_result.get("residency", "")
             else:
                 image_description = "[Image description skipped - using motion only]"
+                vision_residency = ""
             
             # STEP 2: Build combined prompt with reference mode instruction
             combined_input = self._build_combined_prompt_with_mode(
@@ -331,13 +336,15 @@ class ImageToVideoPromptExpander:
                 endpoint=expansion_endpoint,
                 model_name=None,  # Auto-detect for all backends
                 temperature=temperature
-            )
+            ).for_task("main_expand")
             
-            response = expansion_llm.send_prompt(
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                max_tokens=2000
-            )
+            with span("expand"):
+                response = expansion_llm.send_prompt(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    max_tokens=2000,
+                    **get_stop_settings()
+                )
             
             if not response["success"]:
                 return (
@@ -373,10 +380,11 @@ class ImageToVideoPromptExpander:
                     "type": "image-to-video",
                     "preset": preset,
                     "tier": expansion_tier,
-                    "vision_model": vision_model_name if use_vision_model else "none",
-                    "expansion_model": expansion_model_name,
+                    "vision_model": vision_backend if use_vision_model else "none",
+                    "expansion_model": expansion_llm.model_name or "auto-detected",
                     "image_description": image_description,
-                    "motion_input": motion_description
+                    "motion_input": motion_description,
+                    "timings": timing_metadata()
                 }
                 
                 breakdown_text = self._format_breakdown(
@@ -400,7 +408,13 @@ class ImageToVideoPromptExpander:
             else:
                 file_status = "Not saved"
             
-            status = f"✅ Image-to-Video prompt | Vision: {use_vision_model} | {file_status}"
+            status = f"✅ Image-to-Video prompt | Vision: {use_vision_model} | {file_status} | {timing_status()}"
+            breaker_note = expansion_llm.breaker_status()
+            if breaker_note:
+                status += f" | {breaker_note}"
+            for residency_note in (vision_residency, expansion_llm.residency_status()):
+                if residency_note:
+                    status += f" | {residency_note}"
             
             return (
                 enhanced_prompt,
@@ -420,6 +434,7 @@ class ImageToVideoPromptExpander:
                 f"❌ {str(e)}"
             )
     
+    @timed_stage("vision")
     def _analyze_image(
         self,
         image: torch.Tensor,
@@ -481,7 +496,8 @@ Output ONLY the description, no labels or meta-commentary."""
                 backend_type=backend,
                 endpoint=endpoint,
                 model_name=None,  # Auto-detect for all backends
-                temperature=temperature
+                temperature=temperature,
+                role="vision"
             )
             
             # For vision models, we need to send the image
@@ -509,7 +525,8 @@ Output ONLY the description, no labels or meta-commentary."""
             
             return {
                 "success": True,
-                "description": description
+                "description": description,
+                "residency": llm.residency_status()
             }
         
         except Exception as e:
@@ -536,8 +553,6 @@ Output ONLY the description, no labels or meta-commentary."""
     
     def _call_vision_lm_studio(self, llm, system_prompt: str, user_prompt: str, img_base64: str) -> dict:
         """Call LM Studio with vision (OpenAI-compatible format)"""
-        import requests
-        
         try:
             url = f"{llm.endpoint}/chat/completions"
             
@@ -561,11 +576,9 @@ Output ONLY the description, no labels or meta-commentary."""
                 "temperature": llm.temperature,
                 "max_tokens": 1000
             }
+            llm.ensure_resident("vision")
             
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = llm.post_json(url, payload)
             content = data['choices'][0]['message']['content']
             
             return {"success": True, "response": content, "error": None}
@@ -575,8 +588,6 @@ Output ONLY the description, no labels or meta-commentary."""
     
     def _call_vision_ollama(self, llm, system_prompt: str, user_prompt: str, img_base64: str) -> dict:
         """Call Ollama with vision"""
-        import requests
-        
         try:
             url = f"{llm.endpoint}/api/generate"
             
@@ -587,16 +598,15 @@ Output ONLY the description, no labels or meta-commentary."""
                 "prompt": full_prompt,
                 "images": [img_base64],
                 "stream": False,
+                **llm.keep_alive_fields("vision"),
                 "options": {
                     "temperature": llm.temperature,
                     "num_predict": 1000
                 }
             }
+            llm.ensure_resident("vision")
             
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = llm.post_json(url, payload)
             content = data.get('response', '')
             
             return {"success": True, "response": content, "error": None}
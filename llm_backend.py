@@ -1,57 +1,254 @@
 """
 LLM Backend handlers for LM Studio, Ollama, and Qwen3-VL
 Handles API communication with local LLM servers and local models
+(backend type "none" makes no requests; nodes expand deterministically)
+
+Backend type "openai_compat" talks to any OpenAI-compatible server (vLLM,
+llama.cpp server, TGI) like LM Studio, and additionally forwards ``seed`` and
+can request several choices of one prompt in a single call (send_prompt_n).
 """
 
 import requests
+import contextvars
+import copy
 import json
+import re
 import base64
-from typing import Dict, Optional, List, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Any, Sequence, Tuple
+from .adaptive_timeout import generation_timeout, probe_timeout, record_generation, record_probe
+from .capability_cache import capability_key, get_capability_cache, listing_hash
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, breaker_status, get_breaker
+from .endpoint_pool import EndpointPool, get_pool, parse_endpoints
+from .metrics import LLM_LATENCY, LLM_REQUESTS
+from .model_residency import (
+    LOAD_TIMEOUT_SECONDS,
+    MODEL_LOAD_SECONDS,
+    MODEL_PREFLIGHTS,
+    MODEL_SWAPS,
+    choose_loaded_model,
+    find_resident,
+    format_residency,
+    get_keep_warm,
+    keep_alive,
+    loaded_models,
+    mark_loaded,
+    model_state,
+    preflight_enabled,
+    remember_choice,
+)
+from .stop_sequences import MAX_SERVER_STOPS, apply_stops, normalize_stops, stop_check
+from .task_routing import route_for, task_slot
+from .telemetry import record_llm_call, span
+
+
+OPENAI_BACKENDS = ("lm_studio", "openai_compat")
+HTTP_BACKENDS = OPENAI_BACKENDS + ("ollama",)
+_SERVER_LABELS = {"lm_studio": "LM Studio", "openai_compat": "OpenAI-compatible server", "ollama": "Ollama"}
+
+# Ollama endpoints found not to serve /api/chat (pre-0.1.14); they get /api/generate
+_OLLAMA_LEGACY: set = set()
+# openai_compat endpoints found to reject or ignore "n"; their choices are filled
+# with concurrent single requests
+_NO_N_CHOICES: set = set()
+
+
+def _ollama_text(data: Dict) -> str:
+    """Generated text from an /api/chat or /api/generate response."""
+
+    message = data.get("message")
+    if isinstance(message, dict):
+        return message.get("content") or ""
+    return data.get("response") or ""
+
+
+def _ollama_model_missing(response: Optional[requests.Response]) -> bool:
+    """True for Ollama's JSON 404 about an unknown model (as opposed to a missing route)."""
+
+    if response is None:
+        return False
+    try:
+        error = response.json().get("error")
+    except Exception:
+        return False
+    return isinstance(error, str) and "model" in error.lower() and "not found" in error.lower()
+
+
+_N_FIELD_RE = re.compile(r"(?<![\w-])['\"`]?n['\"`]?(?![\w-])")
+
+
+def _n_rejected(response: Optional[requests.Response]) -> bool:
+    """True when a 400/422 body blames the ``n`` field rather than the rest of the request."""
+
+    if response is None:
+        return False
+    try:
+        data = response.json()
+    except Exception:
+        return bool(_N_FIELD_RE.search(response.text or ""))
+    error = data.get("error") if isinstance(data, dict) else None
+    if isinstance(error, dict):
+        if error.get("param") == "n":
+            return True
+        error = error.get("message")
+    if isinstance(error, str):
+        return bool(_N_FIELD_RE.search(error))
+    # FastAPI/pydantic validation errors (vLLM and friends): {"detail": [{"loc": ["body", "n"], ...}]}
+    detail = data.get("detail") if isinstance(data, dict) else None
+    if isinstance(detail, list):
+        return any(isinstance(item, dict) and "n" in (item.get("loc") or []) for item in detail)
+    return isinstance(detail, str) and bool(_N_FIELD_RE.search(detail))
+
+
+def _usage_tokens(data: Any) -> Tuple[Optional[int], Optional[int]]:
+    """Extract (prompt_tokens, completion_tokens) from an OpenAI or Ollama response."""
+
+    if not isinstance(data, dict):
+        return None, None
+    usage = data.get("usage")
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    if "eval_count" in data or "prompt_eval_count" in data:
+        return data.get("prompt_eval_count"), data.get("eval_count")
+    return None, None
 
 
 class LLMBackend:
     """Handles communication with local LLM backends"""
     
-    def __init__(self, backend_type: str, endpoint: str, model_name: str, temperature: float = 0.7):
+    def __init__(
+        self,
+        backend_type: str,
+        endpoint: str,
+        model_name: str,
+        temperature: float = 0.7,
+        strategy: Optional[str] = None,
+        keep_alive: Optional[str] = None,
+        role: str = "text"
+    ):
         self.backend_type = backend_type.lower()
-        self.endpoint = endpoint.rstrip('/')
         self.temperature = temperature
+        # "text" or "vision": which loaded LM Studio model an auto-detecting backend prefers
+        self.role = role
+        # Ollama keep_alive for this backend (None: the configured value per role)
+        self.keep_alive = keep_alive
+        self._residency: Dict[str, Dict[str, Any]] = {}
+        # Pipeline task whose concurrency limit requests count against (see for_task)
+        self.task: Optional[str] = None
         
-        # Auto-detect model if not provided
-        if model_name is None:
-            self.model_name = self._auto_detect_model()
+        # HTTP backends accept several endpoints; requests are spread over a shared pool
+        self.pool: Optional[EndpointPool] = None
+        self.endpoints: List[str] = []
+        if self.backend_type in HTTP_BACKENDS:
+            endpoints, inline_strategy = parse_endpoints(endpoint)
+            if not endpoints:
+                endpoints = [endpoint.rstrip('/')]
+            self.endpoints = endpoints
+            for url in endpoints:
+                get_breaker(url, probe_url=self._probe_url(url))
+            self.pool = get_pool(endpoints, strategy or inline_strategy)
+            self.endpoint = self.pool.select()
         else:
-            self.model_name = model_name
-            
-        self._capabilities = self._infer_capabilities()
+            self.endpoint = endpoint.rstrip('/')
+        
+        # Model id and capabilities per endpoint (hosts may serve different models);
+        # fresh results come from the persistent capability cache without a request
+        self._auto_model = model_name is None
+        self._requested_model = model_name
+        self._endpoint_records: Dict[str, Dict[str, Any]] = {}
+        self.model_name = model_name
+        self._capabilities: Dict[str, bool] = {"vision": False}
         self._capability_notes: Dict[str, Any] = {}
-        self._probe_backend_capabilities()
+        self._apply_record(self._capability_record(self.endpoint))
+        self._prefer_loaded_model()
+
+    def _capability_record(self, endpoint: str) -> Dict[str, Any]:
+        """Detection/probe result for ``endpoint``, cached per (endpoint, model)."""
+
+        if endpoint in self._endpoint_records:
+            return self._endpoint_records[endpoint]
+        if self.pool is None:
+            record = self._probe_record(endpoint)
+        else:
+            cache = get_capability_cache()
+            key = capability_key(self.backend_type, endpoint, self._requested_model)
+            record = cache.lookup(key)
+            if record is not None:
+                record.setdefault("notes", {})["source"] = "capability_cache"
+                cache.revalidate_async(
+                    key,
+                    lambda: listing_hash(self._model_listing(endpoint)),
+                    lambda: self._probe_record(endpoint),
+                )
+            else:
+                record = self._probe_record(endpoint)
+                if record.get("listing_hash"):
+                    cache.store(key, record)
+        self._endpoint_records[endpoint] = record
+        return record
+
+    def _apply_record(self, record: Dict[str, Any]) -> None:
+        self.model_name = record.get("model_name") or self.model_name
+        self._capabilities = dict(record.get("capabilities") or {"vision": False})
+        self._capability_notes = dict(record.get("notes") or {})
+
+    def _model_listing(self, endpoint: str) -> Dict[str, Any]:
+        """GET the model list of ``endpoint`` (/models or /api/tags)."""
+
+        response = self.get(self._probe_url(endpoint), timeout=6, endpoint=endpoint)
+        response.raise_for_status()
+        return response.json()
+
+    def _probe_record(self, endpoint: str) -> Dict[str, Any]:
+        """Fetch the model list once and derive model id and capabilities from it."""
+
+        if self.backend_type == "none":
+            return {"model_name": "deterministic", "capabilities": {"vision": False}, "notes": {}, "listing_hash": None}
+
+        listing: Optional[Dict[str, Any]] = None
+        error: Optional[str] = None
+        if self.pool is not None:
+            try:
+                listing = self._model_listing(endpoint)
+            except Exception as exc:
+                error = str(exc)
+
+        model_name = self._requested_model
+        if model_name is None:
+            if error is not None:
+                print(f"[LLM Backend] Auto-detection failed: {error}, using 'default'")
+                model_name = "default"
+            else:
+                model_name = self._auto_detect_model(listing)
+
+        capabilities = self._infer_capabilities(model_name)
+        notes: Dict[str, Any] = {}
+        if error is not None and self.backend_type in OPENAI_BACKENDS:
+            notes.setdefault("probe_errors", []).append(error)
+        elif listing is not None:
+            self._probe_backend_capabilities(listing, model_name, capabilities, notes)
+
+        return {
+            "model_name": model_name,
+            "capabilities": capabilities,
+            "notes": notes,
+            "listing_hash": listing_hash(listing) if listing is not None else None,
+        }
     
-    def _auto_detect_model(self) -> Optional[str]:
-        """Auto-detect the currently loaded model from LM Studio or Ollama"""
+    def _auto_detect_model(self, listing: Optional[Dict[str, Any]]) -> str:
+        """Auto-detect the currently loaded model from an LM Studio or Ollama model list"""
         try:
-            if self.backend_type == "lm_studio":
-                # Query LM Studio for loaded models
-                url = f"{self.endpoint}/models"
-                response = requests.get(url, timeout=5)
-                response.raise_for_status()
-                data = response.json()
-                
-                models = data.get("data", [])
+            if self.backend_type in OPENAI_BACKENDS:
+                models = (listing or {}).get("data", [])
                 if models and len(models) > 0:
                     # Get the first model (usually the loaded one)
                     detected = models[0].get("id") or models[0].get("model")
-                    print(f"[LLM Backend] Auto-detected LM Studio model: {detected}")
+                    print(f"[LLM Backend] Auto-detected {_SERVER_LABELS[self.backend_type]} model: {detected}")
                     return detected
                     
             elif self.backend_type == "ollama":
-                # Query Ollama for loaded models
-                url = f"{self.endpoint.replace('/v1', '')}/api/tags"
-                response = requests.get(url, timeout=5)
-                response.raise_for_status()
-                data = response.json()
-                
-                models = data.get("models", [])
+                models = (listing or {}).get("models", [])
                 if models and len(models) > 0:
                     # Get the first model
                     detected = models[0].get("name")
@@ -65,14 +262,14 @@ class LLMBackend:
             print(f"[LLM Backend] Auto-detection failed: {e}, using 'default'")
             return "default"
 
-    def _infer_capabilities(self) -> Dict[str, bool]:
+    def _infer_capabilities(self, model_name: Optional[str]) -> Dict[str, bool]:
         """Best-effort capability inference based on backend and model naming."""
 
         capabilities = {
             "vision": False
         }
 
-        name = (self.model_name or "").lower()
+        name = (model_name or "").lower()
 
         if any(tag in name for tag in ["vision", "vl", "mm", "multimodal", "clip", "siglip", "diffusion"]):
             capabilities["vision"] = True
@@ -84,26 +281,23 @@ class LLMBackend:
 
         return capabilities
 
-    def _probe_backend_capabilities(self) -> None:
-        """Query backend metadata for more precise capability detection."""
-
-        if self.backend_type != "lm_studio":
-            return
+    def _probe_backend_capabilities(
+        self,
+        payload: Dict[str, Any],
+        model_name: Optional[str],
+        capabilities: Dict[str, bool],
+        notes: Dict[str, Any],
+    ) -> None:
+        """Use backend model metadata for more precise capability detection."""
 
-        try:
-            url = f"{self.endpoint}/models"
-            response = requests.get(url, timeout=6)
-            response.raise_for_status()
-            payload = response.json()
-        except Exception as exc:
-            self._capability_notes.setdefault("probe_errors", []).append(str(exc))
+        if self.backend_type not in OPENAI_BACKENDS:
             return
 
         models = payload.get("data")
         if not isinstance(models, list):
             return
 
-        normalized = (self.model_name or "").lower()
+        normalized = (model_name or "").lower()
         candidate: Optional[Dict[str, Any]] = None
         fallback: List[Dict[str, Any]] = []
 
@@ -127,11 +321,11 @@ class LLMBackend:
             return
 
         if self._candidate_supports_vision(candidate):
-            self._capabilities["vision"] = True
+            capabilities["vision"] = True
             matched_id = candidate.get("id") or candidate.get("model") or candidate.get("name")
             if matched_id:
-                self._capability_notes["vision_probe_match"] = matched_id
-            self._capability_notes["vision_source"] = "lm_studio_probe"
+                notes["vision_probe_match"] = matched_id
+            notes["vision_source"] = "lm_studio_probe"
 
     def _candidate_supports_vision(self, candidate: Dict[str, Any]) -> bool:
         """Inspect LM Studio model metadata for any vision/multimodal signals."""
@@ -189,15 +383,278 @@ class LLMBackend:
 
         return bool(self._capabilities.get("vision"))
 
+    @property
+    def pool_size(self) -> int:
+        """Number of endpoints this backend can route to."""
+
+        return len(self.pool) if self.pool is not None else 1
+
+    def _use_endpoint(self, endpoint: str) -> None:
+        if endpoint == self.endpoint:
+            return
+        self.endpoint = endpoint
+        if self._auto_model:
+            self._apply_record(self._capability_record(endpoint))
+            self._prefer_loaded_model()
+
+    def _probe_url(self, endpoint: str) -> str:
+        if self.backend_type == "ollama":
+            return f"{endpoint.replace('/v1', '')}/api/tags"
+        return f"{endpoint}/models"
+
+    def _breaker(self) -> Optional[CircuitBreaker]:
+        if self.pool is None:
+            return None
+        return get_breaker(self.endpoint, probe_url=self._probe_url(self.endpoint))
+
+    def available(self) -> bool:
+        """False when every endpoint's circuit breaker is open."""
+
+        if self.pool is None:
+            return True
+        return any(get_breaker(url).available() for url in self.endpoints)
+
+    def breaker_status(self) -> str:
+        """Status-line fragment for this backend's endpoints ('' when all closed)."""
+
+        return breaker_status(self.endpoints)
+
+    def keep_alive_for(self, role: str) -> Optional[str]:
+        """How long Ollama should keep the model (and its prompt cache) resident (None: server default)."""
+
+        return self.keep_alive or keep_alive(role)
+
+    def keep_alive_fields(self, role: str) -> Dict[str, str]:
+        """``{"keep_alive": ...}`` for an Ollama payload, empty when nothing is configured."""
+
+        value = self.keep_alive_for(role)
+        return {"keep_alive": value} if value else {}
+
+    def _model_state(self, endpoint: str) -> Optional[List[Dict[str, Any]]]:
+        """LM Studio model entries with load state (None when unavailable)."""
+
+        if self.backend_type != "lm_studio":
+            return None
+
+        def fetch(url: str) -> Any:
+            response = self.get(url, timeout=3, endpoint=endpoint)
+            response.raise_for_status()
+            return response.json()
+
+        return model_state(endpoint, fetch)
+
+    def _prefer_loaded_model(self) -> None:
+        """Auto-detect: switch to the loaded model suited to this backend's role."""
+
+        if not self._auto_model:
+            return
+        choice = choose_loaded_model(self._model_state(self.endpoint), self.endpoint, self.role)
+        if choice is None:
+            return
+        model_id = choice["id"]
+        if model_id != self.model_name:
+            kind = "loaded" if choice.get("state") == "loaded" else "vision-capable"
+            print(f"[LLM Backend] Using {kind} model {model_id} for {self.role} instead of {self.model_name}")
+            self.model_name = model_id
+            self._capabilities = self._infer_capabilities(model_id)
+            self._capability_notes = {"vision_source": "lm_studio_state"}
+        if choice.get("type") == "vlm":
+            self._capabilities["vision"] = True
+        remember_choice(self.endpoint, self.role, model_id)
+
+    def _check_swap(self, role: str) -> Optional[Dict[str, Any]]:
+        """Warn (once per endpoint and model) when a request will make LM Studio load another model."""
+
+        key = f"{self.endpoint}|{self.model_name}"
+        if key in self._residency:
+            return self._residency[key]
+        entries = self._model_state(self.endpoint)
+        record: Dict[str, Any] = {
+            "model": self.model_name, "endpoint": self.endpoint, "state": "unknown", "load_seconds": 0.0
+        }
+        self._residency[key] = record
+        if entries is None:
+            return record
+        loaded = loaded_models(entries)
+        if self.model_name in loaded or not loaded:
+            record["state"] = "loaded" if loaded else "unknown"
+            return record
+        record.update(state="swap", replaces=loaded)
+        print(
+            f"[LLM Backend] {self.model_name} is not loaded on {self.endpoint} (loaded: {', '.join(loaded)}); "
+            f"this {role} request makes LM Studio swap models"
+        )
+        MODEL_SWAPS.inc(backend=self.backend_type, role=role)
+        mark_loaded(self.endpoint, self.model_name)
+        return record
+
+    def ensure_resident(self, role: str) -> Optional[Dict[str, Any]]:
+        """
+        Prepare the model before the first request to this endpoint
+        
+        Ollama: asks /api/ps once per (endpoint, model) and, if the model is
+        not resident, loads it with an empty /api/generate so the load is
+        timed on its own instead of inflating the first generation.
+        LM Studio: flags a request that would JIT-swap the loaded model.
+        """
+        if not self.model_name or self.model_name == "default":
+            return None
+        if self.backend_type == "lm_studio":
+            return self._check_swap(role)
+        if self.backend_type != "ollama":
+            return None
+        keep_alive_value = self.keep_alive_for(role)
+        get_keep_warm().touch(self.endpoint, self.model_name, keep_alive_value)
+        key = f"{self.endpoint}|{self.model_name}"
+        if key in self._residency or not preflight_enabled():
+            return self._residency.get(key)
+
+        record = {"model": self.model_name, "endpoint": self.endpoint, "state": "unknown", "load_seconds": 0.0}
+        self._residency[key] = record
+        try:
+            response = self.get(f"{self.endpoint}/api/ps", timeout=5)
+            response.raise_for_status()
+            resident = find_resident(response.json(), self.model_name)
+            if resident is None:
+                started = time.perf_counter()
+                with span("model_load", model=self.model_name):
+                    self.post_json(
+                        f"{self.endpoint}/api/generate",
+                        {"model": self.model_name, **self.keep_alive_fields(role)},
+                        timeout=LOAD_TIMEOUT_SECONDS
+                    )
+                record.update(state="cold", load_seconds=round(time.perf_counter() - started, 2))
+                MODEL_LOAD_SECONDS.observe(record["load_seconds"], backend=self.backend_type)
+                print(f"[LLM Backend] Loaded {self.model_name} on {self.endpoint} in {record['load_seconds']:.1f}s")
+            else:
+                record["state"] = "warm"
+        except Exception as exc:
+            # Older servers have no /api/ps; the generation request loads the model itself
+            print(f"[LLM Backend] Residency preflight skipped for {self.model_name}: {exc}")
+        MODEL_PREFLIGHTS.inc(backend=self.backend_type, result=record["state"])
+        return record
+
+    def residency_status(self) -> str:
+        """Status-line fragment with the preflight outcome per model ('' when none ran)."""
+
+        notes = [format_residency(record) for record in self._residency.values()]
+        return ", ".join(f"Model {note}" for note in notes if note)
+
+    def for_task(self, task: str) -> "LLMBackend":
+        """
+        Backend for one pipeline task according to the routing table
+
+        Returns ``self`` when ``task`` has no route (or this backend makes no
+        model calls). Otherwise the route's backend / endpoint / model, with
+        unspecified fields taken from this backend, whose requests hold one of
+        the task's ``max_concurrency`` slots. See :mod:`task_routing`.
+        """
+        route = route_for(task)
+        if not route or self.backend_type == "none":
+            return self
+        backend_type = route.get("backend", self.backend_type)
+        if backend_type != self.backend_type and not route.get("endpoint"):
+            print(f"[LLM Backend] Route for '{task}' names backend {backend_type} without an endpoint, ignoring it")
+            return self
+        endpoint = route.get("endpoint") or ",".join(self.endpoints) or self.endpoint
+        same_server = backend_type == self.backend_type and not route.get("endpoint")
+        if same_server and "model" not in route and "temperature" not in route:
+            # Only a concurrency limit: share this backend's resolved model and pool
+            routed = copy.copy(self)
+        else:
+            try:
+                routed = LLMBackend(
+                    backend_type=backend_type,
+                    endpoint=endpoint,
+                    model_name=route.get("model") or (self.model_name if same_server else None),
+                    temperature=float(route.get("temperature", self.temperature)),
+                    keep_alive=self.keep_alive,
+                    role="vision" if task == "caption" else self.role
+                )
+            except Exception as exc:
+                print(f"[LLM Backend] Route for '{task}' failed ({exc}), using {self.backend_type} at {self.endpoint}")
+                return self
+            print(f"[LLM Backend] Task '{task}' routed to {backend_type} {routed.model_name or 'auto'} at {routed.endpoint}")
+        routed.task = task
+        return routed
+
+    def _routed(self, call, exclude: Sequence[str] = ()) -> Dict:
+        """Run ``call`` against an endpoint picked from the pool and record the outcome."""
+
+        with task_slot(self.task):
+            return self._routed_call(call, exclude)
+
+    def _routed_call(self, call, exclude: Sequence[str]) -> Dict:
+        if self.pool is None:
+            return call()
+        # One acquire, so the breaker checked is the endpoint the request goes to
+        endpoint = self.pool.acquire(exclude)
+        breaker = get_breaker(endpoint)
+        if not breaker.available():
+            # Fail fast instead of waiting on a dead or overloaded server
+            self.endpoint = endpoint
+            error = f"Circuit open for {endpoint} (retry in {breaker.retry_after():.0f}s)"
+            self.pool.release(endpoint, False, 0.0, error)
+            return {
+                "success": False,
+                "response": "",
+                "error": error,
+                "circuit_open": True
+            }
+        started = time.perf_counter()
+        result: Dict = {"success": False, "error": "Request did not complete"}
+        try:
+            self._use_endpoint(endpoint)
+            result = call()
+            return result
+        finally:
+            self.pool.release(
+                endpoint,
+                bool(result.get("success")),
+                time.perf_counter() - started,
+                result.get("error"),
+            )
+
+    def _record_request(self, operation: str, started: float, result: Dict) -> Dict:
+        """Count one send_prompt/caption_image call and its latency in the metrics registry."""
+
+        LLM_REQUESTS.inc(
+            backend=self.backend_type,
+            model=self.model_name or "auto",
+            operation=operation,
+            outcome="success" if result.get("success") else "error",
+        )
+        LLM_LATENCY.observe(time.perf_counter() - started, backend=self.backend_type, operation=operation)
+        return result
+
     def caption_image(
         self,
         image_bytes: bytes,
         label: str,
         prompt: Optional[str] = None,
-        max_tokens: int = 320
+        max_tokens: int = 320,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        exclude: Sequence[str] = ()
     ) -> Dict:
         """Attempt to obtain a detailed caption from the backend for the provided image."""
 
+        started = time.perf_counter()
+        result = self._routed(
+            lambda: self._caption_image(image_bytes, label, prompt, max_tokens, stop, max_paragraphs),
+            exclude
+        )
+        return self._record_request("caption_image", started, result)
+
+    def _caption_image(
+        self,
+        image_bytes: bytes,
+        label: str,
+        prompt: Optional[str],
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None
+    ) -> Dict:
         detail_prompt = prompt or (
             "Describe this reference image in exhaustive detail, covering subjects, setting, lighting, colors, mood, and notable elements."
         )
@@ -225,10 +682,10 @@ class LLMBackend:
             }
 
         try:
-            if self.backend_type == "lm_studio":
-                result = self._caption_lm_studio(image_bytes, detail_prompt, max_tokens)
+            if self.backend_type in OPENAI_BACKENDS:
+                result = self._caption_lm_studio(image_bytes, detail_prompt, max_tokens, stop, max_paragraphs)
             elif self.backend_type == "ollama":
-                result = self._caption_ollama(image_bytes, detail_prompt, max_tokens)
+                result = self._caption_ollama(image_bytes, detail_prompt, max_tokens, stop, max_paragraphs)
             else:
                 raise ValueError(f"Unsupported backend for vision captioning: {self.backend_type}")
 
@@ -238,7 +695,7 @@ class LLMBackend:
             log_entry["success"] = result.get("success", False)
 
             if result.get("success") and result.get("response"):
-                caption_text = result.get("response", "").strip()
+                caption_text = apply_stops(result.get("response", ""), stop, max_paragraphs)
                 return {
                     "success": True,
                     "caption": caption_text,
@@ -265,7 +722,168 @@ class LLMBackend:
                 "log_entry": log_entry
             }
         
-    def send_prompt(self, system_prompt: str, user_prompt: str, max_tokens: int = 2000) -> Dict:
+    def _add_stops(self, payload: Dict, stop: Optional[Sequence[str]]) -> None:
+        """Put stop strings where this backend's API expects them."""
+
+        stops = normalize_stops(stop)
+        if not stops:
+            return
+        if self.backend_type == "ollama":
+            payload.setdefault("options", {})["stop"] = stops
+        else:
+            payload["stop"] = stops[:MAX_SERVER_STOPS]
+
+    def _paragraph_check(self, stop: Optional[Sequence[str]], max_paragraphs: Optional[int]):
+        """Streaming predicate for a paragraph limit (None when there is no limit)."""
+
+        if not max_paragraphs:
+            return None
+        return stop_check(stop, max_paragraphs)
+
+    def post_json(
+        self,
+        url: str,
+        payload: Dict,
+        headers: Optional[Dict] = None,
+        timeout=None,
+        until=None
+    ) -> Dict:
+        """
+        POST a JSON payload and return the decoded JSON response
+        
+        Every backend request goes through here so its bytes on the wire and
+        token usage are attributed to the active telemetry span. Without an
+        explicit ``timeout`` the read deadline is derived from the observed
+        throughput of this endpoint/model and the request size.
+        With ``until`` (a predicate over the text generated so far) the
+        response is streamed and the connection closed as soon as it returns
+        True, which makes the server stop decoding; the result is returned in
+        the non-streaming response shape.
+        Raises requests exceptions like requests.post/raise_for_status.
+        """
+        if until is not None:
+            payload = dict(payload, stream=True)
+        body = json.dumps(payload).encode("utf-8")
+        request_headers = {"Content-Type": "application/json"}
+        if headers:
+            request_headers.update(headers)
+        
+        breaker = self._breaker()
+        if breaker is not None and not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit open for {self.endpoint} (retry in {breaker.retry_after():.0f}s)")
+        if timeout is None:
+            timeout = generation_timeout(self.endpoint, self.model_name, payload)
+        started = time.perf_counter()
+        try:
+            response = requests.post(
+                url, data=body, headers=request_headers, timeout=timeout, stream=until is not None
+            )
+        except requests.exceptions.Timeout as exc:
+            if breaker is not None:
+                breaker.record(exc=exc)
+            print(f"[LLM Backend] No response from {self.endpoint} within {timeout}s")
+            raise
+        except Exception as exc:
+            if breaker is not None:
+                breaker.record(exc=exc)
+            raise
+        if breaker is not None:
+            breaker.record(status_code=response.status_code)
+        data = None
+        received = 0
+        try:
+            response.raise_for_status()
+            if until is None:
+                data = response.json()
+                received = len(response.content or b"")
+            else:
+                data, received = self._read_stream(response, until)
+            record_generation(self.endpoint, self.model_name, payload, data, time.perf_counter() - started)
+            return data
+        finally:
+            if until is None and not received:
+                received = len(response.content or b"")
+            prompt_tokens, completion_tokens = _usage_tokens(data)
+            record_llm_call(len(body), received, prompt_tokens, completion_tokens)
+
+    def _read_stream(self, response: requests.Response, until) -> Tuple[Dict, int]:
+        """Accumulate an SSE (OpenAI) or NDJSON (Ollama) stream until ``until`` is satisfied."""
+
+        text = ""
+        received = 0
+        final: Dict[str, Any] = {}
+        finish_reason = None
+        try:
+            for line in response.iter_lines():
+                received += len(line) + 1
+                line = line.strip()
+                if line.startswith(b"data:"):
+                    line = line[5:].strip()
+                if not line:
+                    continue
+                if line == b"[DONE]":
+                    break
+                chunk = json.loads(line)
+                if "choices" in chunk:
+                    choices = chunk.get("choices") or [{}]
+                    text += (choices[0].get("delta") or {}).get("content") or ""
+                    finish_reason = choices[0].get("finish_reason") or finish_reason
+                    if chunk.get("usage"):
+                        final["usage"] = chunk["usage"]
+                else:
+                    text += _ollama_text(chunk)
+                    if chunk.get("done"):
+                        final.update({key: value for key, value in chunk.items() if key not in ("response", "message")})
+                if until(text):
+                    finish_reason = "stop"
+                    print(f"[LLM Backend] Stopped generation early after {len(text)} characters")
+                    break
+        finally:
+            response.close()
+        if self.backend_type == "ollama":
+            if response.url.endswith("/api/chat"):
+                final["message"] = {"role": "assistant", "content": text}
+            else:
+                final["response"] = text
+            return final, received
+        final["choices"] = [{"message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}]
+        return final, received
+    
+    def get(self, url: str, timeout: float = 5, endpoint: Optional[str] = None) -> requests.Response:
+        """
+        GET through an endpoint's circuit breaker (used for model probes)
+        
+        ``endpoint`` defaults to the current one. ``timeout`` is the upper
+        bound; once the endpoint's probe latency is known the read deadline
+        shrinks toward it.
+        """
+        endpoint = endpoint or self.endpoint
+        breaker = get_breaker(endpoint, probe_url=self._probe_url(endpoint)) if self.pool is not None else None
+        if breaker is not None and not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit open for {endpoint} (retry in {breaker.retry_after():.0f}s)")
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, timeout=probe_timeout(endpoint, timeout))
+        except Exception as exc:
+            if breaker is not None:
+                breaker.record(exc=exc)
+            raise
+        if breaker is not None:
+            breaker.record(status_code=response.status_code)
+        record_probe(endpoint, time.perf_counter() - started)
+        return response
+    
+    def send_prompt(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int = 2000,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        exclude: Sequence[str] = (),
+        seed: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
         """
         Send prompt to LLM and get response
         
@@ -273,23 +891,161 @@ class LLMBackend:
             system_prompt: System instructions
             user_prompt: User's prompt to expand
             max_tokens: Maximum tokens in response
+            stop: Strings that end generation (not included in the response)
+            max_paragraphs: Stop once this many content paragraphs are complete
+            exclude: Endpoints to avoid if the pool has alternatives (failover)
+            seed: Sampling seed (forwarded to openai_compat servers only)
+            images: PNG images attached to the user message (HTTP backends
+                with image support; single-pass vision)
             
         Returns:
             Dict with 'success', 'response', and 'error' keys
         """
+        started = time.perf_counter()
+        result = self._routed(
+            lambda: self._send_prompt(system_prompt, user_prompt, max_tokens, stop, max_paragraphs, seed, images),
+            exclude
+        )
+        return self._record_request("send_prompt", started, result)
+    
+    def send_prompt_n(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        n: int,
+        max_tokens: int = 2000,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        seed: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
+        """
+        Generate ``n`` independent completions of one prompt
+        
+        openai_compat asks for all of them in a single /chat/completions call
+        (``"n": n``), so the server prefills the prompt once and decodes the
+        choices in parallel. Choices a server did not return (it rejected or
+        ignored ``n``) are filled with concurrent single requests seeded
+        ``seed + i``, which is also how every other backend is served.
+        
+        Returns:
+            Dict with 'success', 'responses' (texts in choice order),
+            'response' (the first text), 'error', 'mode' ("n_choices",
+            "n_choices+concurrent" or "concurrent") and 'server_choices'
+        """
+        started = time.perf_counter()
+        responses: List[str] = []
+        error: Optional[str] = None
+        if n > 1 and self.backend_type == "openai_compat" and not all(url in _NO_N_CHOICES for url in self.endpoints):
+            result = self._routed(
+                lambda: self._call_openai_n(system_prompt, user_prompt, n, max_tokens, stop, max_paragraphs, seed, images)
+            )
+            self._record_request("send_prompt_n", started, result)
+            if not result["success"]:
+                return {**result, "responses": [], "mode": "n_choices", "server_choices": 0}
+            responses = result.get("responses") or []
+        server_choices = len(responses)
+
+        missing = n - server_choices
+        if missing > 0:
+            for result in self._concurrent_prompts(
+                system_prompt, user_prompt, range(server_choices, n), max_tokens, stop, max_paragraphs, seed, images
+            ):
+                if result["success"]:
+                    responses.append(result["response"])
+                else:
+                    error = error or result["error"]
+
+        if not server_choices:
+            mode = "concurrent"
+        elif missing > 0:
+            mode = "n_choices+concurrent"
+        else:
+            mode = "n_choices"
+        return {
+            "success": bool(responses),
+            "response": responses[0] if responses else "",
+            "responses": responses,
+            "error": None if responses else error,
+            "mode": mode,
+            "server_choices": server_choices,
+        }
+
+    def _concurrent_prompts(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        offsets: Sequence[int],
+        max_tokens: int,
+        stop: Optional[Sequence[str]],
+        max_paragraphs: Optional[int],
+        seed: Optional[int],
+        images: Sequence[bytes] = ()
+    ) -> List[Dict]:
+        """One send_prompt per offset, in parallel; results in offset order."""
+
+        def run(offset: int) -> Dict:
+            # A shallow copy per thread: routing switches ``endpoint`` on the instance
+            worker = copy.copy(self)
+            return worker.send_prompt(
+                system_prompt,
+                user_prompt,
+                max_tokens,
+                stop,
+                max_paragraphs,
+                seed=None if seed is None else seed + offset,
+                images=images
+            )
+
+        offsets = list(offsets)
+        if len(offsets) == 1 or self.pool is None:
+            # Local (in-process) models run one generation at a time
+            return [run(offset) for offset in offsets]
+        with ThreadPoolExecutor(max_workers=len(offsets), thread_name_prefix="prompt-enhancer-n") as executor:
+            # Each worker runs in a copy of the caller's context so telemetry spans still apply
+            futures = [executor.submit(contextvars.copy_context().run, run, offset) for offset in offsets]
+            return [future.result() for future in futures]
+    
+    def _send_prompt(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        seed: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
+        if images and (self.backend_type not in HTTP_BACKENDS or not self.supports_images()):
+            return {
+                "success": False,
+                "response": "",
+                "error": "Model does not support image inputs."
+            }
         try:
-            if self.backend_type == "lm_studio":
-                return self._call_lm_studio(system_prompt, user_prompt, max_tokens)
+            if self.backend_type in OPENAI_BACKENDS:
+                result = self._call_lm_studio(system_prompt, user_prompt, max_tokens, stop, max_paragraphs, seed, images)
             elif self.backend_type == "ollama":
-                return self._call_ollama(system_prompt, user_prompt, max_tokens)
+                result = self._call_ollama(system_prompt, user_prompt, max_tokens, stop, max_paragraphs, images)
             elif self.backend_type == "qwen3_vl":
-                return self._call_qwen3_vl(system_prompt, user_prompt, max_tokens)
+                result = self._call_qwen3_vl(system_prompt, user_prompt, max_tokens, stop, max_paragraphs)
+            elif self.backend_type == "none":
+                # Nodes expand deterministically instead; never reached in normal use
+                return {
+                    "success": False,
+                    "response": "",
+                    "error": "No LLM configured (llm_backend=none)"
+                }
             else:
                 return {
                     "success": False,
                     "response": "",
                     "error": f"Unknown backend type: {self.backend_type}"
                 }
+            if result.get("success"):
+                # Servers may ignore stops (or only honour four); apply them uniformly
+                result["response"] = apply_stops(result.get("response", ""), stop, max_paragraphs)
+            return result
         except Exception as e:
             return {
                 "success": False,
@@ -297,33 +1053,126 @@ class LLMBackend:
                 "error": f"LLM Backend Error: {str(e)}"
             }
     
-    def _call_lm_studio(self, system_prompt: str, user_prompt: str, max_tokens: int) -> Dict:
-        """Call LM Studio API (OpenAI-compatible)"""
-        url = f"{self.endpoint}/chat/completions"
-        
+    def _chat_payload(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        seed: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
+        """Non-streaming /chat/completions body for the OpenAI-compatible backends."""
+
+        user_content: Any = user_prompt
+        if images:
+            user_content = [{"type": "text", "text": user_prompt}] + [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/png;base64,{base64.b64encode(image).decode('utf-8')}"}
+                }
+                for image in images
+            ]
         payload = {
             "model": self.model_name,
             "messages": [
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
+                {"role": "user", "content": user_content}
             ],
             "temperature": self.temperature,
             "max_tokens": max_tokens,
             "stream": False
         }
-        
-        headers = {
-            "Content-Type": "application/json"
+        if self.backend_type == "openai_compat":
+            # llama.cpp server: reuse the KV cache of the shared (system) prefix; LM Studio doesn't take it
+            payload["cache_prompt"] = True
+            if seed is not None:
+                payload["seed"] = seed
+        self._add_stops(payload, stop)
+        return payload
+
+    def _call_openai_n(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        n: int,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        seed: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
+        """One /chat/completions call asking for ``n`` choices (not streamed)."""
+
+        url = f"{self.endpoint}/chat/completions"
+        payload = self._chat_payload(system_prompt, user_prompt, max_tokens, stop, seed, images)
+        payload["n"] = n
+        try:
+            data = self.post_json(url, payload)
+        except requests.exceptions.HTTPError as exc:
+            status = exc.response.status_code if exc.response is not None else None
+            if status not in (400, 422) or not _n_rejected(exc.response):
+                # Context length, a rejected field, ...: report it and keep n-choices for this endpoint
+                detail = (exc.response.text or "")[:300].strip() if exc.response is not None else ""
+                error = f"OpenAI-compatible server Error: {str(exc)}" + (f" - {detail}" if detail else "")
+                return {"success": False, "response": "", "error": error}
+            # The server validates the body and refuses "n"; the endpoint itself is healthy
+            print(f"[LLM Backend] {self.endpoint} rejected n={n}, using concurrent requests")
+            _NO_N_CHOICES.add(self.endpoint)
+            return {"success": True, "response": "", "responses": [], "error": None, "n_unsupported": True}
+        except requests.exceptions.Timeout:
+            return {"success": False, "response": "", "error": "Request timed out. LLM took too long to respond."}
+        except requests.exceptions.ConnectionError:
+            return {
+                "success": False,
+                "response": "",
+                "error": f"Cannot connect to OpenAI-compatible server at {self.endpoint}. Is it running?"
+            }
+        except Exception as e:
+            return {"success": False, "response": "", "error": f"OpenAI-compatible server Error: {str(e)}"}
+
+        choices = sorted(
+            (choice for choice in data.get("choices") or [] if isinstance(choice, dict)),
+            key=lambda choice: choice.get("index", 0)
+        )
+        responses = []
+        for choice in choices:
+            # Paragraph limits and stops are applied afterwards (n choices are not streamed)
+            text = apply_stops(((choice.get("message") or {}).get("content") or ""), stop, max_paragraphs).strip()
+            if text:
+                responses.append(text)
+        if len(choices) < n and self.endpoint not in _NO_N_CHOICES:
+            print(f"[LLM Backend] {self.endpoint} returned {len(choices)} of {n} choices, filling with concurrent requests")
+            _NO_N_CHOICES.add(self.endpoint)
+        return {
+            "success": bool(responses),
+            "response": responses[0] if responses else "",
+            "responses": responses,
+            "error": None if responses else "OpenAI-compatible server returned no usable choices",
+            "n_unsupported": len(choices) < n,
         }
+
+    def _call_lm_studio(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        seed: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
+        """Call LM Studio API (OpenAI-compatible; also serves openai_compat)"""
+        url = f"{self.endpoint}/chat/completions"
+        label = _SERVER_LABELS[self.backend_type]
+        payload = self._chat_payload(system_prompt, user_prompt, max_tokens, stop, seed, images)
+        self.ensure_resident("text")
         
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=120)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = self.post_json(url, payload, until=self._paragraph_check(stop, max_paragraphs))
             
             # Debug logging
-            print(f"[LLM Backend] LM Studio response keys: {list(data.keys())}")
+            print(f"[LLM Backend] {label} response keys: {list(data.keys())}")
             
             # Check if response has expected structure
             if 'choices' not in data:
@@ -332,18 +1181,18 @@ class LLMBackend:
                     error_text = error_msg.get('message', str(error_msg))
                 else:
                     error_text = str(error_msg) if error_msg else "Unknown error - response missing 'choices' field"
-                print(f"[LLM Backend] LM Studio error response: {data}")
+                print(f"[LLM Backend] {label} error response: {data}")
                 return {
                     "success": False,
                     "response": "",
-                    "error": f"LM Studio API Error: {error_text}"
+                    "error": f"{label} API Error: {error_text}"
                 }
             
             if not data['choices'] or len(data['choices']) == 0:
                 return {
                     "success": False,
                     "response": "",
-                    "error": "LM Studio returned empty choices array"
+                    "error": f"{label} returned empty choices array"
                 }
             
             content = data['choices'][0]['message']['content']
@@ -363,26 +1212,34 @@ class LLMBackend:
             return {
                 "success": False,
                 "response": "",
-                "error": f"Cannot connect to LM Studio at {self.endpoint}. Is it running?"
+                "error": f"Cannot connect to {label} at {self.endpoint}. Is it running?"
             }
         except KeyError as e:
             return {
                 "success": False,
                 "response": "",
-                "error": f"LM Studio returned unexpected response structure (missing {str(e)})"
+                "error": f"{label} returned unexpected response structure (missing {str(e)})"
             }
         except Exception as e:
             return {
                 "success": False,
                 "response": "",
-                "error": f"LM Studio Error: {str(e)}"
+                "error": f"{label} Error: {str(e)}"
             }
 
-    def _caption_lm_studio(self, image_bytes: bytes, prompt: str, max_tokens: int) -> Dict:
+    def _caption_lm_studio(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None
+    ) -> Dict:
         """Call LM Studio for multimodal captioning."""
 
         url = f"{self.endpoint}/chat/completions"
         image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+        self.ensure_resident("vision")
 
         payload = {
             "model": self.model_name,
@@ -414,16 +1271,10 @@ class LLMBackend:
             "max_tokens": max_tokens,
             "stream": False
         }
-
-        headers = {
-            "Content-Type": "application/json"
-        }
+        self._add_stops(payload, stop)
 
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=120)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self.post_json(url, payload, until=self._paragraph_check(stop, max_paragraphs))
             
             # Check if response has expected structure
             if 'choices' not in data:
@@ -477,29 +1328,70 @@ class LLMBackend:
                 "error": f"LM Studio vision error: {str(e)}"
             }
     
-    def _call_ollama(self, system_prompt: str, user_prompt: str, max_tokens: int) -> Dict:
-        """Call Ollama API"""
-        url = f"{self.endpoint}/api/generate"
-        
-        # Combine system and user prompts for Ollama
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
+    def _call_ollama(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None,
+        images: Sequence[bytes] = ()
+    ) -> Dict:
+        """
+        Call Ollama API
         
-        payload = {
-            "model": self.model_name,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": self.temperature,
-                "num_predict": max_tokens
-            }
+        Uses /api/chat so the system prompt is a separate, byte-stable message
+        at the front of the context: Ollama then reuses the cached prefix and
+        only evaluates the user message. Servers without /api/chat fall back to
+        /api/generate with the prompts concatenated. ``images`` ride on the
+        user message (or the generate request).
+        """
+        options = {
+            "temperature": self.temperature,
+            "num_predict": max_tokens
         }
+        if self.endpoint in _OLLAMA_LEGACY:
+            url = f"{self.endpoint}/api/generate"
+            payload = {
+                "model": self.model_name,
+                "prompt": f"{system_prompt}\n\n{user_prompt}",
+                "stream": False,
+                "options": options
+            }
+        else:
+            url = f"{self.endpoint}/api/chat"
+            payload = {
+                "model": self.model_name,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                "stream": False,
+                "options": options
+            }
+        if images:
+            encoded = [base64.b64encode(image).decode("utf-8") for image in images]
+            if "messages" in payload:
+                payload["messages"][1]["images"] = encoded
+            else:
+                payload["images"] = encoded
+        payload.update(self.keep_alive_fields("text"))
+        self._add_stops(payload, stop)
+        self.ensure_resident("text")
         
         try:
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            
-            data = response.json()
-            content = data.get('response', '')
+            try:
+                data = self.post_json(url, payload, until=self._paragraph_check(stop, max_paragraphs))
+            except requests.exceptions.HTTPError as exc:
+                if exc.response is None or exc.response.status_code != 404 or self.endpoint in _OLLAMA_LEGACY:
+                    raise
+                if _ollama_model_missing(exc.response):
+                    # /api/chat exists; the model does not. Never downgrade the endpoint for that
+                    raise
+                print(f"[LLM Backend] {self.endpoint} has no /api/chat, using /api/generate")
+                _OLLAMA_LEGACY.add(self.endpoint)
+                return self._call_ollama(system_prompt, user_prompt, max_tokens, stop, max_paragraphs, images)
+            content = _ollama_text(data)
             
             return {
                 "success": True,
@@ -525,7 +1417,14 @@ class LLMBackend:
                 "error": f"Ollama Error: {str(e)}"
             }
 
-    def _caption_ollama(self, image_bytes: bytes, prompt: str, max_tokens: int) -> Dict:
+    def _caption_ollama(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None
+    ) -> Dict:
         """Call Ollama for multimodal captioning."""
 
         url = f"{self.endpoint}/api/generate"
@@ -536,18 +1435,18 @@ class LLMBackend:
             "prompt": prompt,
             "images": [image_b64],
             "stream": False,
+            **self.keep_alive_fields("vision"),
             "options": {
                 "temperature": self.temperature,
                 "num_predict": max_tokens
             }
         }
+        self._add_stops(payload, stop)
+        self.ensure_resident("vision")
 
         try:
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-
-            data = response.json()
-            content = data.get('response', '')
+            data = self.post_json(url, payload, until=self._paragraph_check(stop, max_paragraphs))
+            content = _ollama_text(data)
 
             return {
                 "success": True,
@@ -573,7 +1472,14 @@ class LLMBackend:
                 "error": f"Ollama vision error: {str(e)}"
             }
     
-    def _call_qwen3_vl(self, system_prompt: str, user_prompt: str, max_tokens: int) -> Dict:
+    def _call_qwen3_vl(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        stop: Optional[Sequence[str]] = None,
+        max_paragraphs: Optional[int] = None
+    ) -> Dict:
         """Call local Qwen3-VL model for text generation (no image)"""
         try:
             from .qwen3_vl_backend import generate_text_with_qwen3_vl
@@ -612,9 +1518,12 @@ class LLMBackend:
                 prompt=full_prompt,
                 model_spec=model_spec,
                 max_new_tokens=max_tokens,
-                temperature=self.temperature
+                temperature=self.temperature,
+                stop=stop,
+                max_paragraphs=max_paragraphs
             )
             
+            record_llm_call()
             if result.get("success"):
                 return {
                     "success": True,
@@ -641,19 +1550,37 @@ class LLMBackend:
                 "error": f"Qwen3-VL Error: {str(e)}"
             }
     
+    def _test_pool_connection(self) -> Dict:
+        """Probe endpoints until one answers; the first reachable one becomes current."""
+
+        label = _SERVER_LABELS.get(self.backend_type, self.backend_type)
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                url = self._probe_url(self.endpoint)
+                response = self.get(url, timeout=5)
+                response.raise_for_status()
+                return {"success": True, "message": f"{label} connected"}
+            except Exception as e:
+                last_error = e
+                tried.append(self.endpoint)
+            if self.pool is None or len(tried) >= len(self.pool):
+                break
+            self._use_endpoint(self.pool.select(exclude=tried))
+        message = f"Connection failed: {str(last_error)}"
+        status = self.breaker_status()
+        if status:
+            message += f" | {status}"
+        return {"success": False, "message": message}
+
     def test_connection(self) -> Dict:
         """Test if LLM backend is accessible"""
         try:
-            if self.backend_type == "lm_studio":
-                url = f"{self.endpoint}/models"
-                response = requests.get(url, timeout=5)
-                response.raise_for_status()
-                return {"success": True, "message": "LM Studio connected"}
-            elif self.backend_type == "ollama":
-                url = f"{self.endpoint}/api/tags"
-                response = requests.get(url, timeout=5)
-                response.raise_for_status()
-                return {"success": True, "message": "Ollama connected"}
+            if self.backend_type in HTTP_BACKENDS:
+                return self._test_pool_connection()
+            elif self.backend_type == "none":
+                return {"success": True, "message": "No LLM - deterministic expansion"}
             elif self.backend_type == "qwen3_vl":
                 # Test Qwen3-VL by checking if we can import it
                 try:
@@ -0,0 +1,380 @@
+"""
+In-process metrics registry
+
+Counters, gauges and histograms keyed by label values, exported either as a
+plain dict (``snapshot()``) or in the Prometheus text exposition format
+(``render_prometheus()``). When running inside ComfyUI the package registers
+``/prompt_enhancer/metrics`` (text) and ``/prompt_enhancer/metrics.json``
+(snapshot) on the ComfyUI aiohttp server; see :func:`register_routes`.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+DEFAULT_LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0
+)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, values))
+        if extra:
+            pairs.extend(extra.items())
+        if not pairs:
+            return ""
+        body = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+        return "{" + body + "}"
+
+
+class Counter(_Metric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, Optional[Dict[str, str]], float]]:
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in sorted(self._values.items())]
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [
+                {**dict(zip(self.labels, key)), "value": value}
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(_Metric):
+    """Point-in-time value, either set explicitly or computed at read time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: object) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def set_callback(self, callback: Callable[[], Dict[LabelValues, float]]) -> None:
+        self._callback = callback
+
+    def _current(self) -> Dict[LabelValues, float]:
+        if self._callback is not None:
+            try:
+                return dict(self._callback())
+            except Exception as exc:
+                print(f"[Metrics] Gauge callback for {self.name} failed: {exc}")
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> List[Tuple[str, LabelValues, Optional[Dict[str, str]], float]]:
+        return [(self.name, key, None, value) for key, value in sorted(self._current().items())]
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        return [
+            {**dict(zip(self.labels, key)), "value": value}
+            for key, value in sorted(self._current().items())
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[position] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def samples(self) -> List[Tuple[str, LabelValues, Optional[Dict[str, str]], float]]:
+        rows = []
+        with self._lock:
+            for key in sorted(self._counts):
+                running = 0
+                for bound, count in zip(self.buckets + (float("inf"),), self._counts[key]):
+                    running += count
+                    rows.append((f"{self.name}_bucket", key, {"le": _format_bound(bound)}, running))
+                rows.append((f"{self.name}_sum", key, None, self._sums[key]))
+                rows.append((f"{self.name}_count", key, None, running))
+        return rows
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        result = []
+        with self._lock:
+            for key in sorted(self._counts):
+                counts = self._counts[key]
+                total = sum(counts)
+                result.append({
+                    **dict(zip(self.labels, key)),
+                    "count": total,
+                    "sum": self._sums[key],
+                    "mean": self._sums[key] / total if total else 0.0,
+                    "p50": _bucket_quantile(self.buckets, counts, 0.5),
+                    "p95": _bucket_quantile(self.buckets, counts, 0.95),
+                })
+        return result
+
+
+class MetricsRegistry:
+    """Named collection of metrics; ``get-or-create`` semantics per name."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))  # type: ignore[return-value]
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> Gauge:
+        gauge = self._register(Gauge(name, help_text, labels, callback))
+        if callback is not None:
+            gauge.set_callback(callback)  # type: ignore[union-attr]
+        return gauge  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))  # type: ignore[return-value]
+
+    def metrics(self) -> Iterable[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, key, extra, value in metric.samples():
+                lines.append(f"{sample_name}{metric._format_labels(key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, object]:
+        data: Dict[str, object] = {
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "metrics": {
+                metric.name: {"type": metric.kind, "help": metric.help, "values": metric.snapshot()}
+                for metric in self.metrics()
+            },
+        }
+        data["cache_hit_ratios"] = cache_hit_ratios()
+        return data
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _bucket_quantile(buckets: Sequence[float], counts: Sequence[int], quantile: float) -> Optional[float]:
+    """Upper bucket bound containing the requested quantile (None if empty)."""
+
+    total = sum(counts)
+    if not total:
+        return None
+    target = quantile * total
+    running = 0
+    for bound, count in zip(tuple(buckets) + (float("inf"),), counts):
+        running += count
+        if running >= target:
+            return bound if bound != float("inf") else buckets[-1]
+    return buckets[-1]
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_REQUESTS = REGISTRY.counter(
+    "prompt_enhancer_llm_requests_total",
+    "Backend requests by backend, model, operation and outcome.",
+    ("backend", "model", "operation", "outcome"),
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "prompt_enhancer_llm_request_seconds",
+    "Backend request latency in seconds.",
+    ("backend", "operation"),
+)
+LLM_RETRIES = REGISTRY.counter(
+    "prompt_enhancer_llm_retries_total",
+    "Main-LLM retry attempts after a failed or empty response.",
+    ("backend",),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "prompt_enhancer_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss).",
+    ("cache", "result"),
+)
+NODE_RUNS = REGISTRY.counter(
+    "prompt_enhancer_node_runs_total",
+    "Node executions by node name.",
+    ("node",),
+)
+NODE_LATENCY = REGISTRY.histogram(
+    "prompt_enhancer_node_seconds",
+    "End-to-end node execution time in seconds.",
+    ("node",),
+)
+
+
+_CACHE_INFO_SOURCES: Dict[str, Callable[[], Tuple[float, float, float]]] = {}
+
+
+def _cache_info_values() -> Dict[LabelValues, float]:
+    values: Dict[LabelValues, float] = {}
+    for cache, source in list(_CACHE_INFO_SOURCES.items()):
+        hits, misses, size = source()
+        values[(cache, "hits")] = float(hits)
+        values[(cache, "misses")] = float(misses)
+        values[(cache, "size")] = float(size)
+    return values
+
+
+CACHE_INFO = REGISTRY.gauge(
+    "prompt_enhancer_cache_info",
+    "Hits, misses and current size reported by in-memory caches.",
+    ("cache", "field"),
+    callback=_cache_info_values,
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count one lookup against a cache that reports hits explicitly."""
+
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def register_cache_info(cache: str, source: Callable[[], Tuple[float, float, float]]) -> None:
+    """Register a ``() -> (hits, misses, size)`` reader, e.g. for ``lru_cache``."""
+
+    _CACHE_INFO_SOURCES[cache] = source
+
+
+def cache_hit_ratios() -> Dict[str, Dict[str, float]]:
+    """Hits, misses and hit ratio for every cache seen so far."""
+
+    ratios: Dict[str, Dict[str, float]] = {}
+    for row in CACHE_REQUESTS.snapshot():
+        entry = ratios.setdefault(str(row["cache"]), {"hits": 0.0, "misses": 0.0, "ratio": 0.0})
+        entry["hits" if row["result"] == "hit" else "misses"] += float(row["value"])  # type: ignore[arg-type]
+    for (cache, field), value in _cache_info_values().items():
+        if field in ("hits", "misses"):
+            entry = ratios.setdefault(cache, {"hits": 0.0, "misses": 0.0, "ratio": 0.0})
+            entry[field] += value
+    for entry in ratios.values():
+        lookups = entry["hits"] + entry["misses"]
+        entry["ratio"] = round(entry["hits"] / lookups, 4) if lookups else 0.0
+    return ratios
+
+
+def snapshot() -> Dict[str, object]:
+    """Programmatic view of every metric in the default registry."""
+
+    return REGISTRY.snapshot()
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition of the default registry."""
+
+    return REGISTRY.render_prometheus()
+
+
+def register_routes(routes, prefix: str = "/prompt_enhancer") -> None:
+    """
+    Mount the metrics endpoints on an aiohttp ``RouteTableDef``
+    (e.g. ``PromptServer.instance.routes`` inside ComfyUI).
+    """
+    from aiohttp import web
+
+    @routes.get(f"{prefix}/metrics")
+    async def _metrics_text(request):
+        return web.Response(
+            text=render_prometheus(),
+            content_type="text/plain",
+            charset="utf-8",
+            headers={"X-Prometheus-Format": "0.0.4"},
+        )
+
+    @routes.get(f"{prefix}/metrics.json")
+    async def _metrics_json(request):
+        return web.json_response(snapshot())
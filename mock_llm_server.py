@@ -0,0 +1,879 @@
+"""
+Mock LM Studio / Ollama server for offline testing and benchmarking
+
+A stdlib-only stand-in for the HTTP endpoints LLMBackend talks to:
+
+- LM Studio (OpenAI-compatible): ``GET /v1/models``, ``POST /v1/chat/completions``
+  (plain text and multimodal ``image_url`` / ``input_image`` content) and the
+  REST model list ``GET /api/v0/models`` with ``type`` and load ``state``
+- Ollama: ``GET /api/tags``, ``GET /api/ps``, ``POST /api/generate`` and
+  ``POST /api/chat`` (with ``images``; an empty request only loads the model)
+
+Responses are deterministic for a given seed and request, and can be scripted
+with regex rules. Latency is modelled as time-to-first-token drawn from a
+configurable distribution plus prompt and completion token throughput. Errors
+(HTTP status, hangs, malformed JSON, empty completions) can be injected at a
+configurable rate, and ``"stream": true`` is answered with SSE (LM Studio) or
+NDJSON (Ollama) chunks. Stop strings (``stop`` / ``options.stop``) truncate the
+reply, and a client that disconnects mid-stream cancels the generation.
+
+Models are resident after first use: a request for a model that is not loaded
+first waits ``load_seconds``, Ollama requests unload their model once their
+``keep_alive`` (default 5m) lapses, and at most ``max_loaded_models`` stay
+loaded (least recently used evicted first, 0 = unlimited).
+
+Chat completions honour ``n`` (up to ``max_choices`` choices, decoded in
+parallel, so the reply takes as long as its longest choice) and ``seed``;
+``max_choices=1`` behaves like a server that ignores ``n``.
+
+Like llama.cpp-based servers, each model keeps the KV cache of its previous
+prompt: only the part after the longest shared prefix is charged prefill time,
+and the reused tokens are reported (``prompt_tokens_details.cached_tokens``
+for OpenAI, a smaller ``prompt_eval_count`` for Ollama, and the
+``cached_prompt_tokens`` counter).
+
+Run standalone::
+
+    python mock_llm_server.py --port 1234 --latency lognormal:-1.5,0.4 --tokens-per-second 80
+
+then point a node at ``http://127.0.0.1:1234/v1`` (LM Studio) or
+``http://127.0.0.1:1234`` (Ollama). From Python::
+
+    with MockLLMServer(MockConfig(error_rate=0.1)) as server:
+        backend = LLMBackend("lm_studio", server.lm_studio_endpoint, None)
+
+``GET /__mock__/stats`` returns request counters; ``POST /__mock__/reset``
+clears them.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+DEFAULT_MODELS = ["mock-text-7b", "mock-vision-7b"]
+
+_VOCABULARY = (
+    "cinematic golden hour light drifts across a quiet harbor while the camera glides "
+    "forward through soft haze, revealing weathered boats, rippling reflections and a "
+    "lone figure in a red coat; shallow depth of field, warm amber highlights, cool teal "
+    "shadows, gentle film grain, slow dolly movement, volumetric fog, dramatic rim light, "
+    "textured stone, distant mountains, drifting clouds, subtle lens flare, intimate "
+    "framing, muted palette, crisp detail, atmospheric perspective, calm mood"
+).replace(",", "").replace(";", "").split()
+
+
+class LatencyModel:
+    """
+    Time-to-first-token distribution parsed from a short spec
+
+    ``fixed:S``, ``uniform:LO,HI``, ``normal:MEAN,STD``, ``lognormal:MU,SIGMA``
+    (all in seconds; ``lognormal`` parameters are of the underlying normal).
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, raw = (spec or "fixed:0").partition(":")
+        kind = kind.strip().lower()
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+        params = [float(value) for value in raw.split(",") if value.strip()] if raw else []
+        expected = 1 if kind == "fixed" else 2
+        if len(params) != expected:
+            raise ValueError(f"Latency '{kind}' needs {expected} parameter(s), got {len(params)}")
+        self.kind = kind
+        self.params = params
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        else:
+            value = rng.lognormvariate(*self.params)
+        return max(0.0, value)
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of a :class:`MockLLMServer`."""
+
+    models: List[str] = field(default_factory=lambda: list(DEFAULT_MODELS))
+    response_tokens: int = 180
+    latency: str = "fixed:0"
+    prefill_tokens_per_second: float = 0.0
+    tokens_per_second: float = 0.0
+    prefix_cache: bool = True
+    error_rate: float = 0.0
+    error_status: int = 500
+    hang_rate: float = 0.0
+    hang_seconds: float = 30.0
+    malformed_rate: float = 0.0
+    empty_rate: float = 0.0
+    seed: int = 0
+    max_choices: int = 8
+    load_seconds: float = 0.0
+    max_loaded_models: int = 0
+    rules: List[Dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def from_script(cls, path: str, **overrides: Any) -> "MockConfig":
+        """
+        Load a JSON script: config keys at the top level plus an optional
+        ``rules`` list. Each rule may set ``match`` (regex over the prompt text),
+        ``api`` ("openai"/"ollama"), ``images`` (bool), ``model``, and then
+        ``response`` or ``responses`` (cycled), ``status``, ``error`` or ``delay``.
+        """
+        with open(path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        data.update({key: value for key, value in overrides.items() if value is not None})
+        known = {name for name in cls.__dataclass_fields__}
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise ValueError(f"Unknown mock config keys: {', '.join(unknown)}")
+        return cls(**data)
+
+
+@dataclass
+class _Request:
+    api: str
+    model: str
+    system: str
+    prompt: str
+    images: int
+    max_tokens: int
+    stream: bool
+    stop: List[str] = field(default_factory=list)
+    chat: bool = False
+    cached: int = 0
+    n: int = 1
+    seed: Optional[int] = None
+    keep_alive: Any = None
+    load_only: bool = False
+
+
+@dataclass
+class _Reply:
+    status: int = 200
+    text: str = ""
+    error: Optional[str] = None
+    delay: float = 0.0
+    hang: bool = False
+    malformed: bool = False
+    # Texts of choices 2..n of a chat completion with "n"
+    extra: List[str] = field(default_factory=list)
+
+
+def _stop_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    return [str(item) for item in value or [] if item]
+
+
+def _truncate_at_stop(text: str, stops: List[str]) -> str:
+    positions = [text.find(stop) for stop in stops if stop in text]
+    return text[:min(positions)] if positions else text
+
+
+def keep_alive_seconds(value: Any) -> float:
+    """Ollama ``keep_alive`` (seconds or a duration like ``1h30m``) in seconds; negative = forever."""
+
+    if value is None or value == "":
+        return 300.0
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = str(value).strip().lower()
+        try:
+            seconds = float(text)
+        except ValueError:
+            units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+            parts = re.findall(r"(-?[\d.]+)(ms|h|m|s)", text)
+            if not parts:
+                return 300.0
+            seconds = sum(float(number) * units[unit] for number, unit in parts)
+    return float("inf") if seconds < 0 else seconds
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (whitespace words) used for usage fields and pacing."""
+
+    return len(text.split()) if text else 0
+
+
+def _synthesize(request: _Request, target: int, seed: int, choice: int = 0) -> str:
+    key = f"{seed}|{request.model}|{request.system}|{request.prompt}"
+    if request.seed is not None or choice:
+        key += f"|{request.seed}|{choice}"
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    rng = random.Random(int.from_bytes(digest[:8], "big"))
+    subject = " ".join(request.prompt.split()[:8]).strip(" ,.") or "the scene"
+    words = ["A", "vivid", "depiction", "of"] + subject.split()
+    if request.images:
+        words += ["matching", "the", "reference", "image"]
+    while len(words) < target:
+        sentence = rng.sample(_VOCABULARY, k=min(len(_VOCABULARY), rng.randint(6, 12)))
+        words.append(sentence[0] + ",")
+        words.extend(sentence[1:])
+    text = " ".join(words[:max(1, target)]).rstrip(",")
+    return text + "."
+
+
+class _MockState:
+    """Shared mutable state for handler threads."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.latency = LatencyModel(config.latency)
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.rules: List[Dict[str, Any]] = []
+        self.rule_cursors: List[int] = []
+        self.set_rules(config.rules)
+        self.counters: Dict[str, Any] = {}
+        # Previous prompt per model (the simulated KV cache survives stats resets)
+        self.prefixes: Dict[str, List[str]] = {}
+        # Loaded models -> (expiry on the monotonic clock, last use), like the cache
+        self.loaded: Dict[str, Tuple[float, float]] = {}
+        self.reset()
+
+    def set_rules(self, rules: List[Dict[str, Any]]) -> None:
+        compiled = [dict(rule, _pattern=re.compile(rule["match"], re.I | re.S) if rule.get("match") else None)
+                    for rule in rules]
+        with self.lock:
+            self.rules = compiled
+            self.rule_cursors = [0] * len(compiled)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters = {
+                "requests": {},
+                "injected": {"error": 0, "hang": 0, "malformed": 0, "empty": 0},
+                "bytes_received": 0,
+                "bytes_sent": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "images": 0,
+                "cancelled": 0,
+                "cached_prompt_tokens": 0,
+                "model_loads": 0,
+                "model_evictions": 0,
+            }
+
+    def count(self, path: str, received: int) -> None:
+        with self.lock:
+            self.counters["requests"][path] = self.counters["requests"].get(path, 0) + 1
+            self.counters["bytes_received"] += received
+
+    def add(self, key: str, amount: int) -> None:
+        with self.lock:
+            self.counters[key] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return json.loads(json.dumps(self.counters))
+
+    def plan(self, request: _Request) -> _Reply:
+        """Decide what to answer: scripted rule, injected fault or synthetic text."""
+
+        config = self.config
+        with self.lock:
+            rule_index = self._match_rule(request)
+            roll = self.rng.random()
+            delay = self.latency.sample(self.rng)
+            if rule_index is not None:
+                rule = self.rules[rule_index]
+                responses = rule.get("responses") or [rule.get("response", "")]
+                texts = []
+                for _ in range(self.choices(request)):
+                    texts.append(responses[self.rule_cursors[rule_index] % len(responses)])
+                    self.rule_cursors[rule_index] += 1
+                return _Reply(
+                    status=int(rule.get("status", 200)),
+                    text=texts[0],
+                    error=rule.get("error"),
+                    delay=float(rule.get("delay", delay)),
+                    extra=texts[1:],
+                )
+
+            threshold = 0.0
+            for kind, rate in (("error", config.error_rate), ("hang", config.hang_rate),
+                               ("malformed", config.malformed_rate), ("empty", config.empty_rate)):
+                threshold += rate
+                if roll < threshold:
+                    self.counters["injected"][kind] += 1
+                    if kind == "error":
+                        return _Reply(status=config.error_status, error="Injected mock failure", delay=delay)
+                    if kind == "hang":
+                        return _Reply(hang=True, delay=config.hang_seconds)
+                    if kind == "malformed":
+                        return _Reply(malformed=True, delay=delay)
+                    return _Reply(text="", delay=delay)
+
+        target = min(request.max_tokens or config.response_tokens, config.response_tokens)
+        texts = [_synthesize(request, target, config.seed, choice) for choice in range(self.choices(request))]
+        return _Reply(text=texts[0], delay=delay, extra=texts[1:])
+
+    def choices(self, request: _Request) -> int:
+        """Choices to return: ``n`` for non-streamed chat completions, capped by ``max_choices``."""
+
+        if request.api != "openai" or request.stream:
+            return 1
+        return max(1, min(request.n, self.config.max_choices))
+
+    def _match_rule(self, request: _Request) -> Optional[int]:
+        haystack = f"{request.system}\n{request.prompt}"
+        for index, rule in enumerate(self.rules):
+            if rule.get("api") and rule["api"] != request.api:
+                continue
+            if "images" in rule and bool(rule["images"]) != bool(request.images):
+                continue
+            if rule.get("model") and rule["model"] != request.model:
+                continue
+            pattern = rule["_pattern"]
+            if pattern is not None and not pattern.search(haystack):
+                continue
+            return index
+        return None
+
+    def cached_tokens(self, request: _Request) -> int:
+        """Tokens shared with this model's previous prompt (then remember this one)."""
+
+        words = (request.system + "\n" + request.prompt).split()
+        with self.lock:
+            previous = self.prefixes.get(request.model, [])
+            self.prefixes[request.model] = words
+        if not self.config.prefix_cache or request.images:
+            return 0
+        shared = 0
+        for old, new in zip(previous, words):
+            if old != new:
+                break
+            shared += 1
+        # The last prompt token is always re-evaluated
+        return min(shared, max(0, len(words) - 1))
+
+    def load(self, request: _Request) -> float:
+        """Make the request's model resident; returns the load time to simulate (0 if warm)."""
+
+        now = time.monotonic()
+        # OpenAI-compatible servers keep a loaded model until another one replaces it
+        lifetime = keep_alive_seconds(request.keep_alive) if request.api == "ollama" else float("inf")
+        with self.lock:
+            for name, (expires, _) in list(self.loaded.items()):
+                if expires <= now:
+                    del self.loaded[name]
+            warm = request.model in self.loaded
+            if not warm:
+                limit = self.config.max_loaded_models
+                while limit > 0 and len(self.loaded) >= limit:
+                    oldest = min(self.loaded, key=lambda name: self.loaded[name][1])
+                    del self.loaded[oldest]
+                    self.counters["model_evictions"] += 1
+                self.counters["model_loads"] += 1
+            if lifetime <= 0:
+                self.loaded.pop(request.model, None)
+            else:
+                self.loaded[request.model] = (now + lifetime, now)
+        return 0.0 if warm else self.config.load_seconds
+
+    def running(self) -> List[Tuple[str, float]]:
+        """Resident models and their remaining seconds (inf when pinned)."""
+
+        now = time.monotonic()
+        with self.lock:
+            return [(name, expires - now) for name, (expires, _) in self.loaded.items() if expires > now]
+
+    def prefill_seconds(self, prompt_tokens: int) -> float:
+        rate = self.config.prefill_tokens_per_second
+        return prompt_tokens / rate if rate > 0 else 0.0
+
+    def token_seconds(self) -> float:
+        rate = self.config.tokens_per_second
+        return 1.0 / rate if rate > 0 else 0.0
+
+
+def _message_text(content: Any) -> Tuple[str, int]:
+    """Flatten OpenAI message content into text and an image count."""
+
+    if isinstance(content, str):
+        return content, 0
+    if not isinstance(content, list):
+        return "", 0
+    texts: List[str] = []
+    images = 0
+    for part in content:
+        if not isinstance(part, dict):
+            continue
+        kind = part.get("type")
+        if kind in ("text", "input_text"):
+            texts.append(str(part.get("text", "")))
+        elif kind in ("image_url", "input_image", "image"):
+            images += 1
+    return "\n".join(texts), images
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    @property
+    def state(self) -> _MockState:
+        return self.server.mock_state  # type: ignore[attr-defined]
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if getattr(self.server, "verbose", False):
+            print(f"[Mock LLM] {self.address_string()} {format % args}")
+
+    # -- routing -------------------------------------------------------------
+
+    def do_GET(self) -> None:
+        path = self._path()
+        self.state.count(f"GET {path}", 0)
+        if path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [self._openai_model(name) for name in self.state.config.models]})
+        elif path == "/api/tags":
+            self._send_json(200, {"models": [self._ollama_model(name) for name in self.state.config.models]})
+        elif path == "/api/v0/models":
+            loaded = {name for name, _ in self.state.running()}
+            self._send_json(200, {"object": "list", "data": [
+                self._lm_studio_model(name, name in loaded) for name in self.state.config.models
+            ]})
+        elif path == "/api/ps":
+            self._send_json(200, {"models": [self._ollama_running(name, left) for name, left in self.state.running()]})
+        elif path == "/__mock__/stats":
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self) -> None:
+        path = self._path()
+        body = self._read_body()
+        self.state.count(f"POST {path}", len(body))
+        if path == "/__mock__/reset":
+            self.state.reset()
+            self._send_json(200, {"reset": True})
+            return
+        try:
+            payload = json.loads(body.decode("utf-8") or "{}")
+        except ValueError:
+            self._send_json(400, {"error": "Request body is not valid JSON"})
+            return
+
+        if path == "/v1/chat/completions":
+            self._handle(self._parse_openai(payload))
+        elif path == "/api/generate":
+            self._handle(self._parse_ollama(payload))
+        elif path == "/api/chat":
+            self._handle(self._parse_ollama_chat(payload))
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def _path(self) -> str:
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        # Tolerate an Ollama endpoint configured with a trailing /v1
+        if path.startswith("/v1/api/"):
+            path = path[3:]
+        return path
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    # -- request parsing -----------------------------------------------------
+
+    def _parse_openai(self, payload: Dict[str, Any]) -> _Request:
+        system_parts: List[str] = []
+        user_parts: List[str] = []
+        images = 0
+        for message in payload.get("messages") or []:
+            text, count = _message_text(message.get("content"))
+            images += count
+            (system_parts if message.get("role") == "system" else user_parts).append(text)
+        return _Request(
+            api="openai",
+            model=str(payload.get("model") or self.state.config.models[0]),
+            system="\n".join(system_parts),
+            prompt="\n".join(user_parts),
+            images=images,
+            max_tokens=int(payload.get("max_tokens") or 0),
+            stream=bool(payload.get("stream")),
+            stop=_stop_list(payload.get("stop")),
+            n=int(payload.get("n") or 1),
+            seed=int(payload["seed"]) if payload.get("seed") is not None else None,
+        )
+
+    def _parse_ollama(self, payload: Dict[str, Any]) -> _Request:
+        options = payload.get("options") or {}
+        return _Request(
+            api="ollama",
+            model=str(payload.get("model") or self.state.config.models[0]),
+            system=str(payload.get("system") or ""),
+            prompt=str(payload.get("prompt") or ""),
+            images=len(payload.get("images") or []),
+            max_tokens=int(options.get("num_predict") or 0),
+            # Ollama streams unless told otherwise
+            stream=payload.get("stream", True) is not False,
+            stop=_stop_list(options.get("stop")),
+            keep_alive=payload.get("keep_alive"),
+            load_only=not payload.get("prompt") and not payload.get("system") and not payload.get("images"),
+        )
+
+    def _parse_ollama_chat(self, payload: Dict[str, Any]) -> _Request:
+        options = payload.get("options") or {}
+        system_parts: List[str] = []
+        user_parts: List[str] = []
+        images = 0
+        for message in payload.get("messages") or []:
+            images += len(message.get("images") or [])
+            text = str(message.get("content") or "")
+            (system_parts if message.get("role") == "system" else user_parts).append(text)
+        return _Request(
+            api="ollama",
+            model=str(payload.get("model") or self.state.config.models[0]),
+            system="\n".join(system_parts),
+            prompt="\n".join(user_parts),
+            images=images,
+            max_tokens=int(options.get("num_predict") or 0),
+            stream=payload.get("stream", True) is not False,
+            stop=_stop_list(options.get("stop")),
+            chat=True,
+            keep_alive=payload.get("keep_alive"),
+            load_only=not payload.get("messages"),
+        )
+
+    # -- replies -------------------------------------------------------------
+
+    def _handle(self, request: _Request) -> None:
+        state = self.state
+        if request.load_only:
+            time.sleep(state.load(request))
+            body = self._ollama_body(request, "", 0, 0, done=True)
+            body["done_reason"] = "unload" if keep_alive_seconds(request.keep_alive) <= 0 else "load"
+            self._send_json(200, body)
+            return
+        load_delay = state.load(request)
+        reply = state.plan(request)
+        prompt_tokens = count_tokens(request.system) + count_tokens(request.prompt) + 256 * request.images
+        request.cached = cached = state.cached_tokens(request)
+        state.add("images", request.images)
+        state.add("cached_prompt_tokens", cached)
+
+        time.sleep(load_delay + reply.delay + state.prefill_seconds(prompt_tokens - cached))
+        if reply.hang:
+            self.close_connection = True
+            return
+        if reply.status >= 400 or reply.error:
+            message = reply.error or f"Mock error {reply.status}"
+            error = {"message": message, "type": "mock_error"} if request.api == "openai" else message
+            self._send_json(reply.status if reply.status >= 400 else 500, {"error": error})
+            return
+        if reply.malformed:
+            self._send_bytes(200, b'{"choices": [', "application/json")
+            return
+
+        text = _truncate_at_stop(reply.text, request.stop)
+        completion_tokens = count_tokens(text)
+        state.add("prompt_tokens", prompt_tokens)
+        if request.stream:
+            self._stream(request, text, prompt_tokens)
+            return
+
+        texts = [text] + [_truncate_at_stop(extra, request.stop) for extra in reply.extra]
+        choice_tokens = [count_tokens(choice) for choice in texts]
+        state.add("completion_tokens", sum(choice_tokens))
+
+        # Choices share the prefill and decode in parallel
+        time.sleep(max(choice_tokens) * state.token_seconds())
+        if request.api == "openai":
+            self._send_json(200, self._openai_body(request, texts, prompt_tokens, sum(choice_tokens)))
+        else:
+            self._send_json(200, self._ollama_body(request, text, prompt_tokens, completion_tokens, done=True))
+
+    def _stream(self, request: _Request, text: str, prompt_tokens: int) -> None:
+        openai = request.api == "openai"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if openai else "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        pause = self.state.token_seconds()
+        words = text.split(" ") if text else []
+        for index, word in enumerate(words):
+            piece = word if index == 0 else " " + word
+            if openai:
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "model": request.model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                data = f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+            else:
+                chunk = {"model": request.model, "done": False}
+                if request.chat:
+                    chunk["message"] = {"role": "assistant", "content": piece}
+                else:
+                    chunk["response"] = piece
+                data = (json.dumps(chunk) + "\n").encode("utf-8")
+            try:
+                self._write_chunk(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client hung up: a real server stops decoding here
+                self.state.add("completion_tokens", index)
+                self.state.add("cancelled", 1)
+                self.close_connection = True
+                return
+            time.sleep(pause)
+        self.state.add("completion_tokens", len(words))
+
+        if openai:
+            final = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "model": request.model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": self._usage(prompt_tokens, len(words), request.cached),
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        else:
+            final = self._ollama_body(request, "", prompt_tokens, len(words), done=True)
+            self._write_chunk((json.dumps(final) + "\n").encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+        self.state.add("bytes_sent", len(data))
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int, cached: int = 0) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _openai_body(self, request: _Request, texts: List[str], prompt_tokens: int,
+                     completion_tokens: int) -> Dict[str, Any]:
+        choices = []
+        for index, text in enumerate(texts):
+            finish = "length" if request.max_tokens and count_tokens(text) >= request.max_tokens else "stop"
+            choices.append({
+                "index": index,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": finish,
+            })
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.model,
+            "choices": choices,
+            "usage": self._usage(prompt_tokens, completion_tokens, request.cached),
+        }
+
+    def _ollama_body(self, request: _Request, text: str, prompt_tokens: int,
+                     completion_tokens: int, done: bool) -> Dict[str, Any]:
+        rate = self.state.config.tokens_per_second
+        eval_ns = int(completion_tokens / rate * 1e9) if rate > 0 else 0
+        # Ollama only counts the prompt tokens it actually evaluated
+        evaluated = prompt_tokens - request.cached
+        prompt_eval_ns = int(self.state.prefill_seconds(evaluated) * 1e9)
+        body: Dict[str, Any] = {
+            "model": request.model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        if request.chat:
+            body["message"] = {"role": "assistant", "content": text}
+        else:
+            body["response"] = text
+        body.update({
+            "done": done,
+            "done_reason": "stop",
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": prompt_eval_ns,
+            "eval_count": completion_tokens,
+            "eval_duration": eval_ns,
+            "total_duration": prompt_eval_ns + eval_ns,
+        })
+        return body
+
+    @staticmethod
+    def _openai_model(name: str) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"id": name, "object": "model", "owned_by": "mock"}
+        if "vision" in name.lower() or "vl" in name.lower().split("-"):
+            entry["capabilities"] = ["vision"]
+        return entry
+
+    @staticmethod
+    def _lm_studio_model(name: str, loaded: bool) -> Dict[str, Any]:
+        vision = "vision" in name.lower() or "vl" in name.lower().split("-")
+        return {
+            "id": name,
+            "object": "model",
+            "type": "vlm" if vision else "llm",
+            "publisher": "mock",
+            "arch": "mock",
+            "compatibility_type": "gguf",
+            "quantization": "Q4_K_M",
+            "state": "loaded" if loaded else "not-loaded",
+            "max_context_length": 8192,
+        }
+
+    def _ollama_running(self, name: str, seconds_left: float) -> Dict[str, Any]:
+        entry = self._ollama_model(name)
+        # Pinned models report a far-future expiry, like Ollama
+        expires = time.time() + min(seconds_left, 10 * 365 * 86400)
+        entry.update({
+            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expires)),
+            "size_vram": entry["size"],
+        })
+        return entry
+
+    @staticmethod
+    def _ollama_model(name: str) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "model": name,
+            "size": 4_000_000_000,
+            "digest": hashlib.sha1(name.encode("utf-8")).hexdigest(),
+            "details": {"family": "mock", "parameter_size": "7B", "quantization_level": "Q4_K_M"},
+        }
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        self._send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.state.add("bytes_sent", len(body))
+
+
+class MockLLMServer:
+    """Threaded mock server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1",
+                 port: int = 0, verbose: bool = False):
+        self.config = config or MockConfig()
+        self._state = _MockState(self.config)
+        self._httpd = ThreadingHTTPServer((host, port), _MockHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock_state = self._state  # type: ignore[attr-defined]
+        self._httpd.verbose = verbose  # type: ignore[attr-defined]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def lm_studio_endpoint(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def ollama_endpoint(self) -> str:
+        return self.url
+
+    def start(self) -> "MockLLMServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm-server", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._state.stats()
+
+    def reset_stats(self) -> None:
+        self._state.reset()
+
+    def set_rules(self, rules: List[Dict[str, Any]]) -> None:
+        """Replace the scripted response rules (same format as ``MockConfig.rules``)."""
+
+        self._state.set_rules(rules)
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline mock LM Studio / Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--script", help="JSON file with config keys and scripted response rules")
+    parser.add_argument("--model", action="append", dest="models", help="Model name to advertise (repeatable)")
+    parser.add_argument("--response-tokens", type=int, help="Length of synthesized completions")
+    parser.add_argument("--latency", help="Time-to-first-token distribution, e.g. lognormal:-1.5,0.4")
+    parser.add_argument("--prefill-tokens-per-second", type=float, help="Prompt processing rate (0 = instant)")
+    parser.add_argument("--tokens-per-second", type=float, help="Decode rate (0 = instant)")
+    parser.add_argument("--error-rate", type=float, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int)
+    parser.add_argument("--hang-rate", type=float, help="Fraction of requests that stall and drop the connection")
+    parser.add_argument("--hang-seconds", type=float)
+    parser.add_argument("--malformed-rate", type=float, help="Fraction of requests answered with truncated JSON")
+    parser.add_argument("--empty-rate", type=float, help="Fraction of requests answered with empty content")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--max-choices", type=int, help="Most choices returned for 'n' (1 = ignore 'n')")
+    parser.add_argument("--load-seconds", type=float, help="Time to load a model that is not resident")
+    parser.add_argument("--max-loaded-models", type=int, help="Resident models before LRU eviction (0 = unlimited)")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _build_parser().parse_args(argv)
+    overrides = {
+        key: getattr(args, key)
+        for key in (
+            "models", "response_tokens", "latency", "prefill_tokens_per_second", "tokens_per_second",
+            "error_rate", "error_status", "hang_rate", "hang_seconds", "malformed_rate", "empty_rate", "seed",
+            "max_choices", "load_seconds", "max_loaded_models",
+        )
+    }
+    if args.script:
+        config = MockConfig.from_script(args.script, **overrides)
+    else:
+        config = MockConfig(**{key: value for key, value in overrides.items() if value is not None})
+    LatencyModel(config.latency)  # validate before binding the port
+
+    server = MockLLMServer(config, host=args.host, port=args.port, verbose=args.verbose)
+    print(f"[Mock LLM] LM Studio endpoint: {server.lm_studio_endpoint}")
+    print(f"[Mock LLM] Ollama endpoint:    {server.ollama_endpoint}")
+    print(f"[Mock LLM] Models: {', '.join(config.models)} | latency {config.latency} | "
+          f"{config.tokens_per_second or 'instant'} tok/s")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Model residency: Ollama keep_alive, load preflight and keep-warm pings, and
+LM Studio loaded-model selection
+
+Ollama unloads a model after its ``keep_alive`` window, and a text and a vision
+model sharing one GPU evict each other, so the next node execution pays a
+multi-second cold load inside the user-visible request. Three controls:
+
+- ``keep_alive`` is sent per role when configured: text generation uses
+  ``PROMPT_ENHANCER_KEEP_ALIVE`` and captioning uses
+  ``PROMPT_ENHANCER_VISION_KEEP_ALIVE`` (falling back to the former); an
+  ``LLMBackend(..., keep_alive=...)`` argument overrides both. Ollama accepts
+  durations such as ``30m``, ``-1`` (pin until unloaded) and ``0``. When none
+  is set the field is left out and the server's default (5 minutes unless
+  ``OLLAMA_KEEP_ALIVE`` says otherwise) applies, so the VRAM is free for the
+  diffusion model that usually runs next.
+- Before its first request a backend asks ``/api/ps`` whether the model is
+  resident and, if not, loads it with an empty request. The load is timed on
+  its own, and the outcome ("warm" or "cold load N.Ns") is reported in the
+  node status.
+- With ``PROMPT_ENHANCER_KEEP_WARM`` set to an interval in seconds, a daemon
+  thread re-sends that load request for every model used in the last
+  ``PROMPT_ENHANCER_KEEP_WARM_IDLE`` seconds (default 3600), reloading a model
+  that was evicted in the meantime before the next execution needs it.
+
+``PROMPT_ENHANCER_OLLAMA_PREFLIGHT=0`` disables the preflight.
+
+LM Studio lists every downloaded model in ``/v1/models``; with JIT loading a
+request for one that is not loaded swaps multi-GB weights. Its REST endpoint
+``/api/v0/models`` also reports ``state`` (loaded / not-loaded) and ``type``
+(llm / vlm), fetched at most every few seconds per endpoint. Auto-detecting
+backends prefer a loaded model suited to their role (text or vision) and keep
+that choice per (endpoint, role) while it stays loaded, so text and vision
+calls stop displacing each other. A request that would still load another
+model is logged as a swap, counted in ``prompt_enhancer_model_swaps_total``
+and shown in the node status.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from .circuit_breaker import get_breaker
+from .metrics import REGISTRY
+
+
+KEEP_ALIVE_ENV = "PROMPT_ENHANCER_KEEP_ALIVE"
+VISION_KEEP_ALIVE_ENV = "PROMPT_ENHANCER_VISION_KEEP_ALIVE"
+PREFLIGHT_ENV = "PROMPT_ENHANCER_OLLAMA_PREFLIGHT"
+KEEP_WARM_ENV = "PROMPT_ENHANCER_KEEP_WARM"
+KEEP_WARM_IDLE_ENV = "PROMPT_ENHANCER_KEEP_WARM_IDLE"
+
+DEFAULT_KEEP_WARM_IDLE_SECONDS = 3600.0
+# Loading a large model from disk can take minutes on a cold machine
+LOAD_TIMEOUT_SECONDS = 300.0
+PING_TIMEOUT_SECONDS = 120.0
+# LM Studio model state is re-read at most this often per endpoint
+MODEL_STATE_TTL_SECONDS = 5.0
+
+MODEL_PREFLIGHTS = REGISTRY.counter(
+    "prompt_enhancer_model_preflight_total",
+    "Model residency checks before the first request, by backend and result (warm/cold/unknown).",
+    ("backend", "result"),
+)
+MODEL_LOAD_SECONDS = REGISTRY.histogram(
+    "prompt_enhancer_model_load_seconds",
+    "Time spent loading a non-resident model before the first request.",
+    ("backend",),
+)
+MODEL_SWAPS = REGISTRY.counter(
+    "prompt_enhancer_model_swaps_total",
+    "Requests for a model that was not loaded while another one was (JIT swaps), by backend and role.",
+    ("backend", "role"),
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+
+def keep_alive(role: str = "text") -> Optional[str]:
+    """Configured keep_alive for ``role`` ("text" or "vision"), None to use the server default."""
+
+    value = ""
+    if role == "vision":
+        value = os.environ.get(VISION_KEEP_ALIVE_ENV, "").strip()
+    return value or os.environ.get(KEEP_ALIVE_ENV, "").strip() or None
+
+
+def preflight_enabled() -> bool:
+    return os.environ.get(PREFLIGHT_ENV, "").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _base_name(name: str) -> str:
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+def find_resident(ps_payload: Any, model: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The ``/api/ps`` entry for ``model`` ("llama3" matches "llama3:latest"), or None."""
+
+    if not model or not isinstance(ps_payload, dict):
+        return None
+    wanted = _base_name(model)
+    for entry in ps_payload.get("models") or []:
+        if not isinstance(entry, dict):
+            continue
+        for key in ("name", "model"):
+            name = entry.get(key)
+            if isinstance(name, str) and _base_name(name) == wanted:
+                return entry
+    return None
+
+
+def format_residency(record: Optional[Dict[str, Any]]) -> str:
+    """Status fragment for one preflight record ('' when nothing was checked)."""
+
+    if not record or record.get("state") not in ("warm", "cold", "swap"):
+        return ""
+    if record["state"] == "warm":
+        return f"{record['model']}: warm"
+    if record["state"] == "swap":
+        replaced = ", ".join(record.get("replaces") or []) or "another model"
+        return f"{record['model']}: swapped in (JIT; loaded: {replaced})"
+    return f"{record['model']}: cold load {record['load_seconds']:.1f}s"
+
+
+def lm_studio_state_url(endpoint: str) -> str:
+    """``/api/v0/models`` next to an OpenAI-style ``.../v1`` endpoint."""
+
+    base = endpoint.rstrip("/")
+    if base.endswith("/v1"):
+        base = base[:-3]
+    return f"{base}/api/v0/models"
+
+
+_MODEL_STATE: Dict[str, Tuple[float, Optional[List[Dict[str, Any]]]]] = {}
+_STATE_UNSUPPORTED: set = set()
+_RESIDENT_CHOICES: Dict[Tuple[str, str], str] = {}
+_STATE_LOCK = threading.Lock()
+
+
+def model_state(endpoint: str, fetch: Callable[[str], Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    LM Studio model entries (``id``, ``type``, ``state``) for ``endpoint``
+
+    ``fetch(url)`` returns the decoded JSON. Results are reused for
+    ``MODEL_STATE_TTL_SECONDS``; servers without the endpoint (404) are
+    remembered and return None from then on.
+    """
+    now = time.monotonic()
+    with _STATE_LOCK:
+        if endpoint in _STATE_UNSUPPORTED:
+            return None
+        cached = _MODEL_STATE.get(endpoint)
+        if cached is not None and now - cached[0] < MODEL_STATE_TTL_SECONDS:
+            return cached[1]
+    entries: Optional[List[Dict[str, Any]]] = None
+    try:
+        payload = fetch(lm_studio_state_url(endpoint))
+        data = payload.get("data") if isinstance(payload, dict) else None
+        if isinstance(data, list):
+            entries = [entry for entry in data if isinstance(entry, dict) and entry.get("id")]
+    except requests.exceptions.HTTPError as exc:
+        if exc.response is not None and exc.response.status_code == 404:
+            with _STATE_LOCK:
+                _STATE_UNSUPPORTED.add(endpoint)
+            return None
+    except Exception:
+        entries = None
+    with _STATE_LOCK:
+        _MODEL_STATE[endpoint] = (now, entries)
+    return entries
+
+
+def mark_loaded(endpoint: str, model: str) -> None:
+    """Note that a request just made LM Studio load ``model`` (JIT)."""
+
+    with _STATE_LOCK:
+        cached = _MODEL_STATE.get(endpoint)
+        if not cached or not cached[1]:
+            return
+        for entry in cached[1]:
+            if entry.get("id") == model:
+                entry["state"] = "loaded"
+
+
+def loaded_models(entries: Optional[List[Dict[str, Any]]]) -> List[str]:
+    return [entry["id"] for entry in entries or [] if entry.get("state") == "loaded"]
+
+
+def choose_loaded_model(entries: Optional[List[Dict[str, Any]]], endpoint: str, role: str) -> Optional[Dict[str, Any]]:
+    """
+    Model entry a backend in ``role`` should use on ``endpoint``
+
+    The previous choice for (endpoint, role) wins while it is still loaded.
+    Otherwise text prefers a loaded ``llm`` then a loaded ``vlm``; vision
+    takes a loaded ``vlm`` or, failing that, the first downloaded one (which
+    LM Studio will have to load). None means "no better idea than the list".
+    """
+    candidates = [entry for entry in entries or [] if entry.get("type") != "embeddings"]
+    loaded = [entry for entry in candidates if entry.get("state") == "loaded"]
+    with _STATE_LOCK:
+        previous = _RESIDENT_CHOICES.get((endpoint, role))
+    for entry in loaded:
+        if entry["id"] == previous and (role != "vision" or entry.get("type") == "vlm"):
+            return entry
+    kinds = ("vlm",) if role == "vision" else ("llm", "vlm")
+    for kind in kinds:
+        for entry in loaded:
+            if entry.get("type") == kind:
+                return entry
+    if role == "vision":
+        for entry in candidates:
+            if entry.get("type") == "vlm":
+                return entry
+    return None
+
+
+def remember_choice(endpoint: str, role: str, model: str) -> None:
+    with _STATE_LOCK:
+        _RESIDENT_CHOICES[(endpoint, role)] = model
+
+
+class KeepWarm:
+    """Daemon thread re-sending load requests for recently used models."""
+
+    def __init__(self):
+        self._targets: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, endpoint: str, model: str, keep_alive_value: Optional[str]) -> None:
+        """Record a use of ``model`` on ``endpoint``; starts the thread when enabled."""
+
+        interval = _env_float(KEEP_WARM_ENV, 0.0)
+        if interval <= 0 or not model:
+            return
+        with self._lock:
+            target = self._targets.setdefault((endpoint, model), {"next_ping": time.monotonic() + interval})
+            target.update(last_used=time.monotonic(), keep_alive=keep_alive_value)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prompt-enhancer-keep-warm", daemon=True)
+                self._thread.start()
+
+    def targets(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        with self._lock:
+            return {key: dict(value) for key, value in self._targets.items()}
+
+    def _run(self) -> None:
+        while True:
+            interval = _env_float(KEEP_WARM_ENV, 0.0)
+            if interval <= 0:
+                self._wake.wait(60.0)
+                continue
+            idle_limit = _env_float(KEEP_WARM_IDLE_ENV, DEFAULT_KEEP_WARM_IDLE_SECONDS)
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                for key, target in list(self._targets.items()):
+                    if now - target["last_used"] > idle_limit:
+                        del self._targets[key]
+                    elif now >= target["next_ping"]:
+                        target["next_ping"] = now + interval
+                        due.append((key, target["keep_alive"]))
+                wait = min([target["next_ping"] for target in self._targets.values()] or [now + interval]) - now
+            for (endpoint, model), keep_alive_value in due:
+                self._ping(endpoint, model, keep_alive_value)
+            self._wake.wait(max(1.0, wait))
+
+    @staticmethod
+    def _ping(endpoint: str, model: str, keep_alive_value: Optional[str]) -> None:
+        if not get_breaker(endpoint).available():
+            return
+        payload = {"model": model}
+        if keep_alive_value:
+            payload["keep_alive"] = keep_alive_value
+        try:
+            response = requests.post(
+                f"{endpoint}/api/generate",
+                json=payload,
+                timeout=PING_TIMEOUT_SECONDS,
+            )
+            response.raise_for_status()
+        except Exception as exc:
+            print(f"[LLM Backend] Keep-warm ping for {model} at {endpoint} failed: {exc}")
+
+
+_KEEP_WARM = KeepWarm()
+
+
+def get_keep_warm() -> KeepWarm:
+    return _KEEP_WARM
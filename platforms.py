@@ -3,7 +3,10 @@ Platform-specific configurations for image generation models
 Each platform has different prompting preferences and optimal formats
 """
 
-from typing import Optional, Sequence
+import os
+from typing import Optional, Sequence, Tuple
+
+from .clip_tokenizer import CHUNK_TOKENS, count_tokens, default_importance, pack_chunks, truncate_to_tokens
 
 PLATFORMS = {
     "flux": {
@@ -311,6 +314,8 @@ PLATFORMS = {
         "optimal_length": "extended (≤120 tokens ~90 words)",
         "max_words": 90,
         "max_tokens": 120,
+        "max_paragraphs": 1,
+        "tokenizer": "clip",
     "quality_emphasis": True,
         "length_guidance": "Stay under ~120 tokens (~90 words) while front-loading essential quality and scene descriptors.",
         "detail_expectation": "Pack quick-hit descriptors for subject, environment, lighting, and mood without wasting tokens.",
@@ -340,6 +345,8 @@ PLATFORMS = {
         "optimal_length": "extended (≤150 tokens ~110 words)",
         "max_words": 110,
         "max_tokens": 150,
+        "max_paragraphs": 1,
+        "tokenizer": "clip",
     "quality_emphasis": True,
         "length_guidance": "Aim for up to 150 tokens (~110 words) with dense, front-loaded details.",
         "detail_expectation": "Even within token limits, pack the prompt with intricate, high-impact descriptors.",
@@ -369,6 +376,8 @@ PLATFORMS = {
         "optimal_length": "extended (~150-200 words)",
         "max_words": 200,
         "max_tokens": 280,
+        "max_paragraphs": 1,
+        "tokenizer": "clip",
     "quality_emphasis": True,
         "length_guidance": "Generate 150-200 words with rich descriptive detail after the required score tags.",
         "detail_expectation": "Provide comprehensive character, outfit, environment, and lighting descriptions in natural language.",
@@ -407,6 +416,8 @@ PLATFORMS = {
         "optimal_length": "extended (~150 tags/words)",
         "max_words": 150,
         "max_tokens": 210,
+        "max_paragraphs": 1,
+        "tokenizer": "clip",
     "quality_emphasis": True,
         "length_guidance": "Provide around 150 detailed tags covering quality, anatomy, clothing, and atmosphere.",
         "detail_expectation": "Go beyond basics—describe micro-details, accessories, background storytelling, and lighting tags.",
@@ -497,6 +508,60 @@ def get_platform_config(platform_name: str) -> dict:
     return PLATFORMS.get(platform_name, PLATFORMS["flux"])
 
 
+# Trailing commentary models append after the prompt; generation stops at the first one
+STOP_SEQUENCES = ["| Settings:", "\nSettings:", "\n\nNote:", "\n\n---", "\n\nExplanation:", "\n\n**Note"]
+
+
+def get_stop_settings(platform_name: Optional[str] = None, max_paragraphs: Optional[int] = None) -> dict:
+    """
+    Stop sequences and paragraph limit for a platform, as keyword arguments
+    for LLMBackend.send_prompt / caption_image
+    
+    Tag-style platforms take a single paragraph; ``max_paragraphs`` overrides
+    the platform default (video prompts pass it for continuous paragraphs).
+    """
+    config = PLATFORMS.get(platform_name, {}) if platform_name else {}
+    return {
+        "stop": list(STOP_SEQUENCES),
+        "max_paragraphs": max_paragraphs or config.get("max_paragraphs"),
+    }
+
+
+CLIP_BREAK_ENV = "PROMPT_ENHANCER_CLIP_BREAK"
+
+
+def fit_clip_token_budget(
+    prompt: str,
+    platform_name: str,
+    use_break: Optional[bool] = None
+) -> Tuple[str, Optional[dict]]:
+    """
+    Fit a prompt to a CLIP-tokenized platform's ``max_tokens`` budget
+    
+    Counts real CLIP BPE tokens and drops the least important phrases
+    (keeping required tags and front-loaded content) when over budget. With
+    ``use_break`` (default from ``PROMPT_ENHANCER_CLIP_BREAK``) phrases are
+    also packed into 75-token chunks separated by ``BREAK``. Returns the
+    prompt unchanged and None for platforms without a CLIP tokenizer.
+    """
+    config = PLATFORMS.get(platform_name, {})
+    if config.get("tokenizer") != "clip" or not prompt:
+        return prompt, None
+    if use_break is None:
+        use_break = os.environ.get(CLIP_BREAK_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+    budget = int(config.get("max_tokens") or CHUNK_TOKENS)
+    if count_tokens(prompt) <= (budget if not use_break else CHUNK_TOKENS):
+        return prompt, None
+    fitted, meta = pack_chunks(
+        prompt,
+        max_tokens=budget,
+        use_break=use_break,
+        importance=default_importance(config.get("required_positive", [])),
+    )
+    meta["budget"] = budget
+    return fitted, meta
+
+
 def get_platform_list() -> list:
     """Get list of supported platform names"""
     return list(PLATFORMS.keys())
@@ -651,13 +716,8 @@ def _format_for_sdxl(description: str, changes: str, config: dict, quality: bool
     else:
         parts.append(description)
     
-    # Keep under ~75 tokens
-    result = ", ".join(parts)
-    tokens = result.split()
-    if len(tokens) > 75:
-        result = " ".join(tokens[:75])
-    
-    return result
+    # Keep within one CLIP chunk (75 BPE tokens)
+    return truncate_to_tokens(", ".join(parts), CHUNK_TOKENS)
 
 
 def get_negative_prompt_for_platform(
@@ -265,12 +265,20 @@ def get_preset(preset_name: str) -> dict:
 
 
 def get_random_elements(num_elements: int = 5) -> dict:
-    """Get random elements for the random preset"""
+    """
+    Get random elements for the random preset
+    
+    A wildcard file named after a pool (e.g. wildcards/lenses.txt) replaces
+    the built-in list for that category.
+    """
     import random
+    from .wildcards import get_default_library
     
+    library = get_default_library()
     selected = {}
     for category, options in RANDOM_POOLS.items():
         if random.random() > 0.5:  # 50% chance to include each category
+            options = library.get(category) or options
             selected[category] = random.choice(options)
     
     return selected
@@ -0,0 +1,354 @@
+"""
+Append-only prompt archive written by a background thread
+
+Every saved generation becomes one JSON line in a segment file under
+``<output_dir>/archive/``. Nodes only enqueue the record (microseconds); a
+daemon writer per output directory drains the queue in batches, appends them
+with a single write, rotates the segment once it exceeds the size limit and
+gzips rotated segments. Pending records are flushed when the process exits.
+
+Record ids are time-ordered and collision-free (timestamp with microseconds +
+process id + random suffix), so concurrent runs and several ComfyUI processes
+sharing an output directory never overwrite each other. Segment names carry
+the process id for the same reason.
+
+The old one-``.txt``-per-run export is kept as an optional renderer: set
+``PROMPT_ENHANCER_TEXT_EXPORT=1`` to also write it (from the writer thread),
+or render archived records later::
+
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.prompt_archive export output/txt2img_prompts
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.prompt_archive tail output/video_prompts -n 5
+
+Environment variables: ``PROMPT_ENHANCER_TEXT_EXPORT`` (``1`` to keep writing
+per-run text files), ``PROMPT_ENHANCER_ARCHIVE_SEGMENT_MB`` (rotation size,
+default 16).
+"""
+
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+TEXT_EXPORT_ENV = "PROMPT_ENHANCER_TEXT_EXPORT"
+SEGMENT_MB_ENV = "PROMPT_ENHANCER_ARCHIVE_SEGMENT_MB"
+
+ARCHIVE_SUBDIR = "archive"
+SEGMENT_PREFIX = "prompts-"
+DEFAULT_SEGMENT_MB = 16.0
+BATCH_SIZE = 256
+BATCH_WAIT_SECONDS = 0.25
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _segment_bytes() -> int:
+    try:
+        megabytes = float(os.environ.get(SEGMENT_MB_ENV, "") or DEFAULT_SEGMENT_MB)
+    except ValueError:
+        megabytes = DEFAULT_SEGMENT_MB
+    return max(1, int(megabytes * 1024 * 1024))
+
+
+def new_record_id(now: Optional[datetime] = None) -> str:
+    """Sortable, collision-free id: ``YYYYmmddTHHMMSSffffff-<pid>-<random>``."""
+
+    now = now or datetime.now()
+    return f"{now:%Y%m%dT%H%M%S%f}-{os.getpid():x}-{uuid.uuid4().hex[:8]}"
+
+
+def archive_dir(output_dir: str) -> str:
+    return os.path.join(output_dir, ARCHIVE_SUBDIR)
+
+
+class ArchiveWriter:
+    """Queue + daemon thread appending records to rotating JSONL segments."""
+
+    def __init__(self, output_dir: str, segment_bytes: Optional[int] = None):
+        self.output_dir = output_dir
+        self.directory = archive_dir(output_dir)
+        self.segment_bytes = segment_bytes or _segment_bytes()
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._handle = None
+        self._path: Optional[str] = None
+        self._size = 0
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="prompt-enhancer-archive", daemon=True)
+        self._thread.start()
+
+    @property
+    def current_path(self) -> str:
+        """Segment the next batch will be appended to."""
+
+        with self._lock:
+            if self._path is None:
+                self._path = self._new_segment_path()
+            return self._path
+
+    def add_listener(self, listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Call ``listener(records)`` on the writer thread after each batch is written."""
+
+        self._listeners.append(listener)
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        if self._closed:
+            raise RuntimeError("Prompt archive is closed")
+        self._queue.put(record)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted record is written (True) or ``timeout`` passes."""
+
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put({"__flush__": done})
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _new_segment_path(self) -> str:
+        # Microsecond stamp keeps segments in write order when sorted by name
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S%f")
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{stamp}-{os.getpid():x}.jsonl")
+
+    def _open_segment(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            if self._path is None:
+                self._path = self._new_segment_path()
+            path = self._path
+        self._handle = open(path, "ab")
+        self._size = self._handle.tell()
+
+    def _rotate(self) -> None:
+        finished = self._path
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        with self._lock:
+            self._path = None
+        if finished and os.path.exists(finished):
+            compress_segment(finished)
+
+    def _write_batch(self, records: List[Dict[str, Any]]) -> None:
+        if self._handle is None:
+            self._open_segment()
+        payload = b"".join(
+            (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8") for record in records
+        )
+        self._handle.write(payload)
+        self._handle.flush()
+        self._size += len(payload)
+        if self._size >= self.segment_bytes:
+            self._rotate()
+        if _env_flag(TEXT_EXPORT_ENV):
+            for record in records:
+                try:
+                    export_text(record, self.output_dir)
+                except OSError as exc:
+                    print(f"[Prompt Archive] Text export failed for {record.get('id')}: {exc}")
+        for listener in list(self._listeners):
+            try:
+                listener(records)
+            except Exception as exc:
+                print(f"[Prompt Archive] Listener failed: {exc}")
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch: List[Dict[str, Any]] = []
+            waiters: List[threading.Event] = []
+            while True:
+                if item is None:
+                    stopping = True
+                elif "__flush__" in item:
+                    waiters.append(item["__flush__"])
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=BATCH_WAIT_SECONDS if batch and not waiters else 0.0)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as exc:
+                    print(f"[Prompt Archive] Failed to write {len(batch)} record(s) to {self._path}: {exc}")
+            for waiter in waiters:
+                waiter.set()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def compress_segment(path: str) -> str:
+    """Gzip a finished segment in place (``.jsonl`` -> ``.jsonl.gz``)."""
+
+    target = path + ".gz"
+    temp = target + ".tmp"
+    with open(path, "rb") as source, gzip.open(temp, "wb", compresslevel=6) as sink:
+        shutil.copyfileobj(source, sink)
+    os.replace(temp, target)
+    os.remove(path)
+    return target
+
+
+_WRITERS: Dict[str, ArchiveWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_archive(output_dir: str) -> ArchiveWriter:
+    """Process-wide writer for ``output_dir`` (started on first use)."""
+
+    key = os.path.abspath(output_dir)
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(key)
+        if writer is None:
+            writer = ArchiveWriter(output_dir)
+            _WRITERS[key] = writer
+        return writer
+
+
+def close_archives(timeout: float = 10.0) -> None:
+    """Flush and stop every writer (registered with ``atexit``)."""
+
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+        _WRITERS.clear()
+    for writer in writers:
+        writer.close(timeout)
+
+
+atexit.register(close_archives)
+
+
+def archive_record(
+    positive_prompt: str,
+    negative_prompt: str,
+    breakdown: str,
+    metadata: Dict,
+    filename_base: str,
+    output_dir: str,
+) -> Dict[str, Any]:
+    """Queue one generation for the archive and return its record."""
+
+    now = datetime.now()
+    record = {
+        "id": new_record_id(now),
+        "created": now.isoformat(timespec="microseconds"),
+        "filename_base": filename_base,
+        "positive_prompt": positive_prompt or "",
+        "negative_prompt": negative_prompt or "",
+        "breakdown": breakdown or "",
+        "metadata": metadata or {},
+    }
+    get_archive(output_dir).submit(record)
+    return record
+
+
+def segment_paths(output_dir: str) -> List[str]:
+    """Archive segments of ``output_dir``, oldest first (compressed and active)."""
+
+    directory = archive_dir(output_dir)
+    if not os.path.isdir(directory):
+        return []
+    names = [
+        name for name in os.listdir(directory)
+        if name.startswith(SEGMENT_PREFIX) and (name.endswith(".jsonl") or name.endswith(".jsonl.gz"))
+    ]
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def read_segment(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A partially written last line after a crash
+                continue
+
+
+def iter_records(output_dir: str) -> Iterator[Dict[str, Any]]:
+    """Every archived record of ``output_dir`` in write order per segment."""
+
+    for path in segment_paths(output_dir):
+        yield from read_segment(path)
+
+
+def export_text(record: Dict[str, Any], output_dir: str) -> str:
+    """Write the legacy human-readable ``.txt`` for one record; returns its path."""
+
+    from .utils import format_prompt_file, sanitize_filename
+
+    os.makedirs(output_dir, exist_ok=True)
+    created = record.get("created") or ""
+    try:
+        stamp = datetime.fromisoformat(created).strftime("%Y%m%d_%H%M%S")
+    except ValueError:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = str(record.get("id", "")).rsplit("-", 1)[-1] or uuid.uuid4().hex[:8]
+    filename = f"{sanitize_filename(record.get('filename_base') or 'prompt')}_{stamp}_{suffix}.txt"
+    path = os.path.join(output_dir, filename)
+    content = format_prompt_file(
+        record.get("positive_prompt", ""),
+        record.get("negative_prompt", ""),
+        record.get("breakdown", ""),
+        record.get("metadata") or {},
+    )
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(content)
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or export the prompt archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Render archived records as the legacy .txt files")
+    export.add_argument("output_dir")
+    export.add_argument("--to", default=None, help="Directory for the .txt files (default: output_dir)")
+    tail = commands.add_parser("tail", help="Print the most recent records")
+    tail.add_argument("output_dir")
+    tail.add_argument("-n", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        count = 0
+        for record in iter_records(args.output_dir):
+            export_text(record, args.to or args.output_dir)
+            count += 1
+        print(f"[Prompt Archive] Exported {count} record(s)")
+        return 0
+
+    for record in deque(iter_records(args.output_dir), maxlen=max(1, args.n)):
+        sys.stdout.write(f"{record.get('id')}  {record.get('positive_prompt', '')[:120]}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Prompt assembly that states long repeated spans only once
+
+Reference-analysis prompts are built from fields that largely repeat the vision
+caption: the summary is ``"<label>: <caption>"``, the caption is the first
+detail line and every category note embeds it. Sent verbatim, a 150-token
+caption can be prefilled five or six times per call, which on small local
+models is most of the request's latency.
+
+:class:`PromptAssembler` collects the prompt as sections of lines. Spans
+registered with :meth:`PromptAssembler.define` are written out once by
+:meth:`PromptAssembler.canonical`; anywhere else they are replaced by a short
+reference (``see caption``). Lines left with nothing but a label after the
+replacement, and lines already emitted, are dropped, as are sections that end
+up empty. The naive (verbatim) size is tracked alongside so every call can
+report how many input tokens were saved.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Same ~4 characters per token heuristic the adaptive timeouts use
+CHARS_PER_TOKEN = 4
+MIN_SPAN_CHARS = 24
+
+_LABEL_ONLY_RE = re.compile(r"^[\s\-•*]*(?:[\w .'/()-]{0,40}:\s*){0,2}[\s|;,.:-]*(?:see \w+)?[\s|;,.:-]*$", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptAssembler:
+    """Line-oriented prompt builder that de-duplicates defined spans and repeated lines."""
+
+    def __init__(self, min_span_chars: int = MIN_SPAN_CHARS):
+        self.min_span_chars = min_span_chars
+        self._spans: List[Tuple[str, str]] = []
+        self._texts: Dict[str, str] = {}
+        self._sections: List[Tuple[Optional[str], List[str]]] = [(None, [])]
+        self._naive: List[str] = []
+        self._seen: set = set()
+
+    def define(self, name: str, text: Optional[str]) -> bool:
+        """Register ``text`` as a span to state once and reference as ``see <name>``."""
+
+        text = (text or "").strip()
+        if not text:
+            return False
+        self._texts[name] = text
+        if len(text) < self.min_span_chars or any(span == text for _, span in self._spans):
+            return False
+        self._spans.append((name, text))
+        # Longest spans first so a caption is not split by a shorter span inside it
+        self._spans.sort(key=lambda item: len(item[1]), reverse=True)
+        return True
+
+    def section(self, header: Optional[str] = None) -> "PromptAssembler":
+        """Start a section; its header is only written if a line survives below it."""
+
+        self._sections.append((header, []))
+        self._naive.append("")
+        if header:
+            self._naive.append(header)
+        return self
+
+    def canonical(self, header: str, name: str) -> "PromptAssembler":
+        """Write the defined span ``name`` verbatim under ``header``."""
+
+        text = self._texts.get(name)
+        if text is None:
+            return self
+        self.section(header)
+        self._naive.append(text)
+        self._sections[-1][1].append(text)
+        self._seen.add(self._key(text))
+        return self
+
+    def line(self, text: Optional[str], prefix: str = "") -> "PromptAssembler":
+        """Add one line (``prefix`` such as ``"- "`` is kept out of the de-duplication)."""
+
+        if text is None:
+            return self
+        text = str(text)
+        self._naive.append(prefix + text)
+        reduced = self._reduce(text)
+        if reduced is None:
+            return self
+        key = self._key(reduced)
+        if key in self._seen:
+            return self
+        self._seen.add(key)
+        self._sections[-1][1].append(prefix + reduced)
+        return self
+
+    def lines(self, texts, prefix: str = "") -> "PromptAssembler":
+        for text in texts:
+            self.line(text, prefix)
+        return self
+
+    def _reduce(self, text: str) -> Optional[str]:
+        stripped = text.strip()
+        if not stripped:
+            return None
+        reduced = stripped
+        for name, span in self._spans:
+            if span in reduced:
+                if reduced == span:
+                    return None
+                reduced = reduced.replace(span, f"see {name}")
+        if reduced != stripped and _LABEL_ONLY_RE.match(reduced):
+            return None
+        return reduced
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def render(self) -> str:
+        out: List[str] = []
+        for header, body in self._sections:
+            if not body:
+                continue
+            if out:
+                out.append("")
+            if header:
+                out.append(header)
+            out.extend(body)
+        return "\n".join(out)
+
+    def naive_render(self) -> str:
+        """What the prompt would have been without de-duplication."""
+
+        return "\n".join(self._naive).strip()
+
+    def stats(self) -> Dict[str, float]:
+        """Estimated input tokens with and without de-duplication."""
+
+        naive = estimate_tokens(self.naive_render())
+        tokens = estimate_tokens(self.render())
+        saved = max(0, naive - tokens)
+        return {
+            "input_tokens": tokens,
+            "naive_input_tokens": naive,
+            "input_tokens_saved": saved,
+            "saved_ratio": round(saved / naive, 3) if naive else 0.0,
+        }
@@ -5,16 +5,19 @@ Fixed auto mode + shows detected tier
 
 import os
 import re
-import random
 from typing import Tuple
 from .llm_backend import LLMBackend
+from .deterministic_engine import DeterministicExpander
 from .expansion_engine import PromptExpander
+from .platforms import get_stop_settings
+from .telemetry import span, traced_node, timing_metadata, timing_status
 from .utils import (
     save_prompts_to_file,
     parse_keywords,
     format_breakdown,
     validate_positive_keywords
 )
+from .variation_diversity import enforce_diversity, format_diversity_report, perturbed_temperature
 
 
 class AIVideoPromptExpander:
@@ -25,6 +28,7 @@ class AIVideoPromptExpander:
     
     def __init__(self):
         self.expander = PromptExpander()
+        self.deterministic = DeterministicExpander()
         self.type = "prompt_expansion"
         self.output_dir = "output/video_prompts"
         self._emphasis_store = []  # Store for emphasis syntax preservation
@@ -72,13 +76,17 @@ class AIVideoPromptExpander:
                 "llm_backend": ([
                     "lm_studio",
                     "ollama",
-                    "qwen3_vl"
+                    "openai_compat",
+                    "qwen3_vl",
+                    "none"
                 ], {
                     "default": "lm_studio",
                     "tooltip": (
                         "lm_studio: Uses currently loaded model in LM Studio\n"
                         "ollama: Uses currently loaded model in Ollama\n"
-                        "qwen3_vl: Auto-detects local Qwen3-VL model (no API server needed)"
+                        "openai_compat: Any OpenAI-compatible server (vLLM, llama.cpp server, TGI); variations come from one request\n"
+                        "qwen3_vl: Auto-detects local Qwen3-VL model (no API server needed)\n"
+                        "none: No model - fast deterministic expansion from presets and phrase banks"
                     )
                 }),
                 
@@ -127,6 +135,16 @@ class AIVideoPromptExpander:
                     "default": "video_prompt",
                     "multiline": False
                 })
+            },
+            "optional": {
+                "wildcard_mode": (["random", "enumerate", "stratified"], {
+                    "default": "random",
+                    "tooltip": (
+                        "random: roll wildcards once for all variations\n"
+                        "enumerate: each variation takes the next combination in order\n"
+                        "stratified: each variation takes a distinct combination spread across all options"
+                    )
+                }),
             }
         }
     
@@ -144,6 +162,7 @@ class AIVideoPromptExpander:
     CATEGORY = "Eric Prompt Enhancers"
     OUTPUT_NODE = True
     
+    @traced_node("video_expander")
     def expand_prompt(
         self,
         basic_prompt: str,
@@ -157,16 +176,16 @@ class AIVideoPromptExpander:
         negative_keywords: str,
         num_variations: int,
         save_to_file: bool,
-        filename_base: str
+        filename_base: str,
+        wildcard_mode: str = "random"
     ) -> Tuple[str, str, str, str, str, str]:
         """Main processing function"""
         
         try:
-            # Process alternations first (before LLM)
-            basic_prompt = self._process_alternations(basic_prompt)
-            
-            # Preserve emphasis syntax before LLM processing
-            basic_prompt = self._preserve_emphasis_syntax(basic_prompt)
+            # Process wildcards and alternations first (before LLM)
+            variation_prompts = self.expander.wildcard_variations(basic_prompt, wildcard_mode, num_variations)
+            if wildcard_mode == "random":
+                basic_prompt = variation_prompts[0]
             
             pos_kw_list = parse_keywords(positive_keywords)
             neg_kw_list = parse_keywords(negative_keywords)
@@ -177,42 +196,106 @@ class AIVideoPromptExpander:
                 endpoint=api_endpoint,
                 model_name=None,  # Auto-detect for all backends
                 temperature=temperature
-            )
+            ).for_task("main_expand")
             
             conn_test = llm.test_connection()
             if not conn_test["success"]:
                 error_msg = f"LLM Connection Failed: {conn_test['message']}"
                 return (basic_prompt, "", "", "", f"ERROR: {error_msg}", f"❌ {error_msg}")
             
-            positive_prompts = []
-            breakdowns = []
-            
-            for var_num in range(num_variations):
+            def build_variation(variation_prompt: str, variation_seed):
+                # Preserve emphasis syntax before LLM processing
+                variation_prompt = self._preserve_emphasis_syntax(variation_prompt)
+                
                 system_prompt, user_prompt, breakdown_dict = self.expander.expand_prompt(
-                    basic_prompt=basic_prompt,
+                    basic_prompt=variation_prompt,
                     preset=preset,
                     tier=expansion_tier,
                     mode=mode,
                     positive_keywords=pos_kw_list,
-                    variation_seed=var_num if num_variations > 1 else None
+                    variation_seed=variation_seed
                 )
+                return variation_prompt, system_prompt, user_prompt, breakdown_dict
+            
+            def finish_variation(enhanced_prompt: str) -> str:
+                # Restore emphasis syntax after LLM processing
+                enhanced_prompt = self._restore_emphasis_syntax(enhanced_prompt or "")
+                
+                if len(enhanced_prompt) >= 20 and pos_kw_list:
+                    keywords_present, missing = validate_positive_keywords(pos_kw_list, enhanced_prompt)
+                    if missing:
+                        enhanced_prompt += f" {', '.join(missing)}"
                 
-                response = llm.send_prompt(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    max_tokens=3000
+                return enhanced_prompt
+            
+            def expand_variation(var_num: int, variation_prompt: str, variation_seed):
+                variation_prompt, system_prompt, user_prompt, breakdown_dict = build_variation(
+                    variation_prompt, variation_seed
                 )
                 
+                if llm.backend_type == "none":
+                    enhanced_prompt, breakdown_dict["deterministic"] = self.deterministic.expand_video(
+                        variation_prompt,
+                        preset,
+                        breakdown_dict["detected_tier"],
+                        mode,
+                        variation_seed=variation_seed
+                    )
+                    response = {"success": True, "response": enhanced_prompt, "error": None}
+                else:
+                    with span("expand", variation=var_num + 1):
+                        response = llm.send_prompt(
+                            system_prompt=system_prompt,
+                            user_prompt=user_prompt,
+                            max_tokens=3000,
+                            seed=variation_seed,
+                            **get_stop_settings()
+                        )
+                    
+                    if not response["success"]:
+                        return response, "", breakdown_dict
+                    
+                    parsed = self.expander.parse_llm_response(response["response"])
+                    enhanced_prompt = parsed["prompt"]
+                
+                return response, finish_variation(enhanced_prompt), breakdown_dict
+            
+            def expand_n_choices():
+                # One prompt, n sampled choices: the server prefills it once
+                _, system_prompt, user_prompt, breakdown_dict = build_variation(variation_prompts[0], None)
+                with span("expand", variations=len(variation_prompts)):
+                    response = llm.send_prompt_n(
+                        system_prompt=system_prompt,
+                        user_prompt=user_prompt,
+                        n=len(variation_prompts),
+                        max_tokens=3000,
+                        seed=0,
+                        **get_stop_settings()
+                    )
+                if not response["success"]:
+                    return [(response, "", breakdown_dict)]
+                breakdown_dict["n_choices"] = {"mode": response["mode"], "server_choices": response["server_choices"]}
+                return [
+                    (response, finish_variation(self.expander.parse_llm_response(text)["prompt"]), dict(breakdown_dict))
+                    for text in response["responses"]
+                ]
+            
+            positive_prompts = []
+            breakdowns = []
+            
+            if llm.backend_type == "openai_compat" and len(variation_prompts) > 1 and len(set(variation_prompts)) == 1:
+                outputs = expand_n_choices()
+            else:
+                outputs = (
+                    expand_variation(var_num, variation_prompt, var_num if len(variation_prompts) > 1 else None)
+                    for var_num, variation_prompt in enumerate(variation_prompts)
+                )
+            
+            for response, enhanced_prompt, breakdown_dict in outputs:
                 if not response["success"]:
                     error_msg = response["error"]
                     return (basic_prompt, "", "", "", f"ERROR: {error_msg}", f"❌ {error_msg}")
                 
-                parsed = self.expander.parse_llm_response(response["response"])
-                enhanced_prompt = parsed["prompt"]
-                
-                # Restore emphasis syntax after LLM processing
-                enhanced_prompt = self._restore_emphasis_syntax(enhanced_prompt)
-                
                 # Validate we got output
                 if not enhanced_prompt or len(enhanced_prompt) < 20:
                     return (
@@ -224,14 +307,28 @@ class AIVideoPromptExpander:
                         f"❌ LLM response too short - check your model"
                     )
                 
-                if pos_kw_list:
-                    keywords_present, missing = validate_positive_keywords(pos_kw_list, enhanced_prompt)
-                    if missing:
-                        enhanced_prompt += f" {', '.join(missing)}"
-                
                 positive_prompts.append(enhanced_prompt)
                 breakdowns.append(breakdown_dict)
             
+            def regenerate(index: int, attempt: int):
+                # Perturb seed and temperature; a failed retry keeps the original
+                base_temperature = llm.temperature
+                llm.temperature = perturbed_temperature(base_temperature, attempt)
+                try:
+                    response, enhanced_prompt, _ = expand_variation(
+                        index,
+                        variation_prompts[index],
+                        self.expander.regeneration_seed(index, attempt)
+                    )
+                finally:
+                    llm.temperature = base_temperature
+                if not response["success"] or len(enhanced_prompt) < 20:
+                    return None
+                return enhanced_prompt
+            
+            positive_prompts, diversity = enforce_diversity(positive_prompts, regenerate, history_name="video_expander")
+            breakdowns[0]["diversity"] = diversity
+            
             while len(positive_prompts) < 3:
                 positive_prompts.append("")
             
@@ -253,7 +350,9 @@ class AIVideoPromptExpander:
                     "model": llm.model_name or "auto-detected",
                     "temperature": temperature,
                     "variation_num": num_variations,
-                    "original_prompt": basic_prompt
+                    "wildcard_mode": wildcard_mode,
+                    "original_prompt": basic_prompt,
+                    "timings": timing_metadata()
                 }
                 
                 save_result = save_prompts_to_file(
@@ -278,7 +377,13 @@ class AIVideoPromptExpander:
             else:
                 tier_display = f"Tier: {expansion_tier}"
             
-            status = f"✅ Generated {num_variations} variation(s) | {tier_display} | Preset: {preset} | {file_status}"
+            status = f"✅ Generated {len(breakdowns)} variation(s) | {tier_display} | Preset: {preset} | {file_status} | {timing_status()}"
+            breaker_note = llm.breaker_status()
+            if breaker_note:
+                status += f" | {breaker_note}"
+            residency_note = llm.residency_status()
+            if residency_note:
+                status += f" | {residency_note}"
             
             return (
                 positive_prompts[0],
@@ -332,35 +437,22 @@ class AIVideoPromptExpander:
         if breakdowns[0].get('preset_focus'):
             lines.append(f"Focus Areas: {', '.join(breakdowns[0]['preset_focus'])}")
         
-        lines.append("\n" + "=" * 60)
+        if breakdowns[0].get('deterministic'):
+            words = ", ".join(str(b['deterministic']['words']) for b in breakdowns if b.get('deterministic'))
+            lines.append(f"\nExpansion Engine: deterministic (llm_backend=none), words per variation: {words}")
         
-        return "\n".join(lines)
-    
-    def _process_alternations(self, text: str) -> str:
-        """
-        Process alternation syntax {option1|option2|option3}
-        Replaces with randomly chosen option
-        """
-        # Pattern to match {option1|option2|option3}
-        pattern = r'\{([^{}]+)\}'
+        if breakdowns[0].get('n_choices'):
+            n_choices = breakdowns[0]['n_choices']
+            lines.append(
+                f"\nVariation Requests: {n_choices['mode']} "
+                f"({n_choices['server_choices']} of {len(breakdowns)} choices from one server call)"
+            )
         
-        def replace_alternation(match):
-            options = match.group(1).split('|')
-            # Strip whitespace from each option
-            options = [opt.strip() for opt in options]
-            return random.choice(options)
+        lines.extend(format_diversity_report(breakdowns[0].get('diversity')))
         
-        # Keep replacing until no more alternations found (handles nested cases)
-        max_iterations = 10  # Prevent infinite loops
-        iteration = 0
-        while '{' in text and '|' in text and iteration < max_iterations:
-            new_text = re.sub(pattern, replace_alternation, text)
-            if new_text == text:  # No more changes
-                break
-            text = new_text
-            iteration += 1
+        lines.append("\n" + "=" * 60)
         
-        return text
+        return "\n".join(lines)
     
     def _preserve_emphasis_syntax(self, text: str) -> str:
         """
@@ -5,16 +5,28 @@ Provides dropdown menus for all Wan 2.2 elements
 
 import os
 import re
-import random
-from typing import Tuple
+from typing import List, Optional, Tuple
 from .llm_backend import LLMBackend
+from .deterministic_engine import DeterministicExpander
 from .expansion_engine import PromptExpander
+from .platforms import get_stop_settings
+from .single_pass_vision import (
+    ATTACHED_IMAGE_NOTE,
+    SINGLE_PASS_REQUESTS,
+    VISION_PASS_OPTIONS,
+    caption_instructions,
+    single_pass_eligible,
+    single_pass_stop_settings,
+    split_response
+)
+from .telemetry import span, timed_stage, traced_node, timing_metadata, timing_status
 from .utils import (
     save_prompts_to_file,
     parse_keywords,
     format_breakdown,
     validate_positive_keywords
 )
+from .variation_diversity import enforce_diversity, format_diversity_report, perturbed_temperature
 
 
 class AIVideoPromptExpanderAdvanced:
@@ -24,6 +36,7 @@ class AIVideoPromptExpanderAdvanced:
     
     def __init__(self):
         self.expander = PromptExpander()
+        self.deterministic = DeterministicExpander()
         self.type = "prompt_expansion_advanced"
         self.output_dir = "output/video_prompts"
         self._emphasis_store = []  # Store for emphasis syntax preservation
@@ -408,13 +421,17 @@ class AIVideoPromptExpanderAdvanced:
                 "llm_backend": ([
                     "lm_studio",
                     "ollama",
-                    "qwen3_vl"
+                    "openai_compat",
+                    "qwen3_vl",
+                    "none"
                 ], {
                     "default": "lm_studio",
                     "tooltip": (
                         "lm_studio: Uses currently loaded model in LM Studio\n"
                         "ollama: Uses currently loaded model in Ollama\n"
-                        "qwen3_vl: Auto-detects local Qwen3-VL model (no API server needed)"
+                        "openai_compat: Any OpenAI-compatible server (vLLM, llama.cpp server, TGI); variations come from one request\n"
+                        "qwen3_vl: Auto-detects local Qwen3-VL model (no API server needed)\n"
+                        "none: No model - fast deterministic expansion from presets and phrase banks"
                     )
                 }),
                 
@@ -462,6 +479,22 @@ class AIVideoPromptExpanderAdvanced:
                 "reference_image": ("IMAGE", {
                     "tooltip": "Optional: Provide an image to analyze and incorporate into the prompt using Qwen3-VL"
                 }),
+                "vision_pass": (VISION_PASS_OPTIONS, {
+                    "default": "auto",
+                    "tooltip": (
+                        "auto: if the LLM itself accepts images (LM Studio/Ollama/OpenAI-compatible VLM), send the reference image "
+                        "with the expansion request and take vision_caption from its reply (one request instead of two)\n"
+                        "two_pass: always caption with Qwen3-VL first, then expand"
+                    )
+                }),
+                "wildcard_mode": (["random", "enumerate", "stratified"], {
+                    "default": "random",
+                    "tooltip": (
+                        "random: roll wildcards once for all variations\n"
+                        "enumerate: each variation takes the next combination in order\n"
+                        "stratified: each variation takes a distinct combination spread across all options"
+                    )
+                }),
             }
         }
     
@@ -480,6 +513,7 @@ class AIVideoPromptExpanderAdvanced:
     CATEGORY = "Eric Prompt Enhancers"
     OUTPUT_NODE = True
     
+    @traced_node("video_expander_advanced")
     def expand_prompt(
         self,
         basic_prompt: str,
@@ -510,7 +544,9 @@ class AIVideoPromptExpanderAdvanced:
         num_variations: int,
         save_to_file: bool,
         filename_base: str,
-        reference_image=None  # Optional image input
+        reference_image=None,  # Optional image input
+        wildcard_mode: str = "random",
+        vision_pass: str = "auto"
     ) -> Tuple[str, str, str, str, str, str, str]:
         """
         Main processing function with aesthetic controls
@@ -526,39 +562,10 @@ class AIVideoPromptExpanderAdvanced:
             }
             temperature = temperature_map.get(creativity_mode, 0.7)
             
-            # Process alternations first (before LLM)
-            basic_prompt = self._process_alternations(basic_prompt)
-            
-            # Preserve emphasis syntax before LLM processing
-            basic_prompt = self._preserve_emphasis_syntax(basic_prompt)
-            
-            # === PASS 1: Vision Analysis (if image provided) ===
-            vision_caption = ""
-            mode = "text-to-video"  # Default
-            
-            if reference_image is not None:
-                try:
-                    print(f"[Advanced Node] PASS 1: Analyzing reference image with Qwen3-VL...")
-                    
-                    # Get comprehensive image caption (no mode filtering yet)
-                    vision_caption = self._process_reference_image(reference_image)
-                    
-                    if vision_caption:
-                        mode = "image-to-video"
-                        print(f"[Advanced Node] ✓ Vision analysis complete: {len(vision_caption)} chars")
-                        print(f"[Advanced Node] Caption preview: {vision_caption[:200]}...")
-                    else:
-                        print(f"[Advanced Node] ⚠ Vision analysis returned empty - continuing without image context")
-                        
-                except Exception as e:
-                    print(f"[Advanced Node] ⚠ Warning: Could not process image: {e}")
-                    print(f"[Advanced Node] Continuing with text-only mode...")
-                    # Continue without image context - graceful degradation
-            
-            elif reference_mode != "recreate_exact":
-                # User set a reference_mode but didn't attach image - warn but continue
-                print(f"[Advanced Node] ⚠ Warning: reference_mode is '{reference_mode}' but no image attached")
-                print(f"[Advanced Node] Continuing in text-only mode...")
+            # Process wildcards and alternations first (before LLM)
+            variation_prompts = self.expander.wildcard_variations(basic_prompt, wildcard_mode, num_variations)
+            if wildcard_mode == "random":
+                basic_prompt = variation_prompts[0]
             
             # Parse keywords
             pos_kw_list = parse_keywords(positive_keywords)
@@ -572,13 +579,16 @@ class AIVideoPromptExpanderAdvanced:
                 visual_style, visual_effect, character_emotion
             )
             
+            vision_caption = ""
+            mode = "text-to-video"  # Default
+            
             # Initialize LLM backend (model_name auto-detected)
             llm = LLMBackend(
                 backend_type=llm_backend,
                 endpoint=api_endpoint,
                 model_name=None,  # Auto-detect for all backends
                 temperature=temperature
-            )
+            ).for_task("main_expand")
             
             # Test connection
             conn_test = llm.test_connection()
@@ -594,14 +604,49 @@ class AIVideoPromptExpanderAdvanced:
                     vision_caption if vision_caption else "No image provided"
                 )
             
+            # === PASS 1: Vision Analysis (if image provided) ===
+            # Single-pass: the LLM reads the image itself and returns the caption
+            # with the expansion, saving the separate caption generation
+            reference_images: List[bytes] = []
+            single_pass_captions: List[str] = []
+            if reference_image is not None and single_pass_eligible(llm, vision_pass):
+                image_bytes = self._reference_image_bytes(reference_image)
+                if image_bytes:
+                    reference_images.append(image_bytes)
+                    mode = "image-to-video"
+                    print(f"[Advanced Node] PASS 1: skipped, {llm.model_name} reads the reference image directly (single-pass)")
+            
+            if reference_image is not None and not reference_images:
+                try:
+                    print(f"[Advanced Node] PASS 1: Analyzing reference image with Qwen3-VL...")
+                    
+                    # Get comprehensive image caption (no mode filtering yet)
+                    vision_caption = self._process_reference_image(reference_image)
+                    
+                    if vision_caption:
+                        mode = "image-to-video"
+                        print(f"[Advanced Node] ✓ Vision analysis complete: {len(vision_caption)} chars")
+                        print(f"[Advanced Node] Caption preview: {vision_caption[:200]}...")
+                    else:
+                        print(f"[Advanced Node] ⚠ Vision analysis returned empty - continuing without image context")
+                        
+                except Exception as e:
+                    print(f"[Advanced Node] ⚠ Warning: Could not process image: {e}")
+                    print(f"[Advanced Node] Continuing with text-only mode...")
+                    # Continue without image context - graceful degradation
+            
+            elif reference_image is None and reference_mode != "recreate_exact":
+                # User set a reference_mode but didn't attach image - warn but continue
+                print(f"[Advanced Node] ⚠ Warning: reference_mode is '{reference_mode}' but no image attached")
+                print(f"[Advanced Node] Continuing in text-only mode...")
+            
             # === PASS 2: Smart LLM Expansion ===
             print(f"[Advanced Node] PASS 2: Expanding prompt with LLM...")
             
-            # Generate variations
-            positive_prompts = []
-            breakdowns = []
-            
-            for var_num in range(num_variations):
+            def build_variation(variation_prompt: str, variation_seed):
+                # Preserve emphasis syntax before LLM processing
+                variation_prompt = self._preserve_emphasis_syntax(variation_prompt)
+                
                 # Build expansion prompts with:
                 # - User's basic prompt
                 # - Vision caption (if available)
@@ -610,28 +655,123 @@ class AIVideoPromptExpanderAdvanced:
                 # - Creativity mode
                 # - Shot structure
                 system_prompt, user_prompt, breakdown_dict = self.expander.expand_prompt(
-                    basic_prompt=basic_prompt,
+                    basic_prompt=variation_prompt,
                     preset=preset,
                     tier=detail_level,  # Map detail_level to tier
                     mode=mode,
                     positive_keywords=pos_kw_list,
-                    variation_seed=var_num if num_variations > 1 else None,
+                    variation_seed=variation_seed,
                     aesthetic_controls=aesthetic_controls,
                     shot_structure=shot_structure,
                     creativity_mode=creativity_mode,
-                    vision_caption=vision_caption,  # Pass 1 result
+                    # Pass 1 result, or a pointer to the attached image in single-pass
+                    vision_caption=vision_caption or (ATTACHED_IMAGE_NOTE if reference_images else ""),
                     reference_mode=reference_mode   # How to apply vision caption
                 )
+                if reference_images:
+                    user_prompt += "\n\n" + caption_instructions(["The reference image"])
+                return variation_prompt, system_prompt, user_prompt, breakdown_dict
+            
+            def parse_expansion(text: str) -> str:
+                if reference_images:
+                    captions, text = split_response(text, len(reference_images), stop_settings)
+                    single_pass_captions.extend(captions)
+                return self.expander.parse_llm_response(text)["prompt"]
+            
+            def finish_variation(enhanced_prompt: str) -> str:
+                # Restore emphasis syntax after LLM processing
+                enhanced_prompt = self._restore_emphasis_syntax(enhanced_prompt)
                 
-                # Call LLM with longer max_tokens for detailed output
-                response = llm.send_prompt(
-                    system_prompt=system_prompt,
-                    user_prompt=user_prompt,
-                    max_tokens=3000  # Increased for more detail
+                # Ensure positive keywords are included
+                if pos_kw_list:
+                    keywords_present, missing = validate_positive_keywords(pos_kw_list, enhanced_prompt)
+                    if missing:
+                        enhanced_prompt += f" {', '.join(missing)}"
+                
+                return enhanced_prompt
+            
+            stop_settings = get_stop_settings(
+                max_paragraphs=1 if shot_structure == "continuous_paragraph" else None
+            )
+            request_stop_settings = (
+                single_pass_stop_settings(stop_settings, len(reference_images)) if reference_images else stop_settings
+            )
+            
+            def expand_variation(var_num: int, variation_prompt: str, variation_seed):
+                variation_prompt, system_prompt, user_prompt, breakdown_dict = build_variation(
+                    variation_prompt, variation_seed
                 )
                 
+                if llm.backend_type == "none":
+                    enhanced_prompt, breakdown_dict["deterministic"] = self.deterministic.expand_video(
+                        variation_prompt,
+                        preset,
+                        breakdown_dict["detected_tier"],
+                        mode,
+                        aesthetic_controls=aesthetic_controls,
+                        variation_seed=variation_seed,
+                        shot_structure=shot_structure,
+                        vision_caption=vision_caption
+                    )
+                    response = {"success": True, "response": enhanced_prompt, "error": None}
+                else:
+                    # Call LLM with longer max_tokens for detailed output
+                    with span("expand", variation=var_num + 1):
+                        response = llm.send_prompt(
+                            system_prompt=system_prompt,
+                            user_prompt=user_prompt,
+                            max_tokens=3000,  # Increased for more detail
+                            seed=variation_seed,
+                            images=reference_images,
+                            **request_stop_settings
+                        )
+                    
+                    if not response["success"]:
+                        return response, "", breakdown_dict
+                    
+                    # Parse response
+                    enhanced_prompt = parse_expansion(response["response"])
+                
+                return response, finish_variation(enhanced_prompt), breakdown_dict
+            
+            def expand_n_choices():
+                # One prompt, n sampled choices: the server prefills it once
+                _, system_prompt, user_prompt, breakdown_dict = build_variation(variation_prompts[0], None)
+                with span("expand", variations=len(variation_prompts)):
+                    response = llm.send_prompt_n(
+                        system_prompt=system_prompt,
+                        user_prompt=user_prompt,
+                        n=len(variation_prompts),
+                        max_tokens=3000,
+                        seed=0,
+                        images=reference_images,
+                        **request_stop_settings
+                    )
+                if not response["success"]:
+                    return [(response, "", breakdown_dict)]
+                breakdown_dict["n_choices"] = {"mode": response["mode"], "server_choices": response["server_choices"]}
+                return [
+                    (response, finish_variation(parse_expansion(text)), dict(breakdown_dict))
+                    for text in response["responses"]
+                ]
+            
+            # Generate variations
+            positive_prompts = []
+            breakdowns = []
+            
+            if llm.backend_type == "openai_compat" and len(variation_prompts) > 1 and len(set(variation_prompts)) == 1:
+                outputs = expand_n_choices()
+            else:
+                outputs = (
+                    expand_variation(var_num, variation_prompt, var_num if len(variation_prompts) > 1 else None)
+                    for var_num, variation_prompt in enumerate(variation_prompts)
+                )
+            
+            for response, enhanced_prompt, breakdown_dict in outputs:
                 if not response["success"]:
                     error_msg = response["error"]
+                    if reference_images:
+                        SINGLE_PASS_REQUESTS.inc(node="video_expander_advanced", outcome="failed")
                     print(f"[Advanced Node] LLM expansion failed: {error_msg}")
                     print(f"[Advanced Node] Full response: {response}")
                     return (
@@ -644,22 +784,36 @@ class AIVideoPromptExpanderAdvanced:
                         vision_caption if vision_caption else "No image provided"
                     )
                 
-                # Parse response
-                parsed = self.expander.parse_llm_response(response["response"])
-                enhanced_prompt = parsed["prompt"]
-                
-                # Restore emphasis syntax after LLM processing
-                enhanced_prompt = self._restore_emphasis_syntax(enhanced_prompt)
-                
-                # Ensure positive keywords are included
-                if pos_kw_list:
-                    keywords_present, missing = validate_positive_keywords(pos_kw_list, enhanced_prompt)
-                    if missing:
-                        enhanced_prompt += f" {', '.join(missing)}"
-                
                 positive_prompts.append(enhanced_prompt)
                 breakdowns.append(breakdown_dict)
             
+            def regenerate(index: int, attempt: int):
+                # Perturb seed and temperature; a failed retry keeps the original
+                llm.temperature = perturbed_temperature(temperature, attempt)
+                try:
+                    response, enhanced_prompt, _ = expand_variation(
+                        index,
+                        variation_prompts[index],
+                        self.expander.regeneration_seed(index, attempt)
+                    )
+                finally:
+                    llm.temperature = temperature
+                return enhanced_prompt if response["success"] and enhanced_prompt else None
+            
+            positive_prompts, diversity = enforce_diversity(positive_prompts, regenerate, history_name="video_expander_advanced")
+            breakdowns[0]["diversity"] = diversity
+            
+            if reference_images:
+                # The first variation that described the image supplies vision_caption
+                vision_caption = next((caption for caption in single_pass_captions if caption), "")
+                breakdowns[0]["single_pass"] = {"model": llm.model_name, "caption_chars": len(vision_caption)}
+                SINGLE_PASS_REQUESTS.inc(
+                    node="video_expander_advanced",
+                    outcome="captioned" if vision_caption else "no_caption"
+                )
+                if not vision_caption:
+                    print("[Advanced Node] ⚠ Single-pass reply had no CAPTION section")
+            
             # Pad to 3 variations
             while len(positive_prompts) < 3:
                 positive_prompts.append("")
@@ -691,9 +845,12 @@ class AIVideoPromptExpanderAdvanced:
                     "creativity_mode": creativity_mode,
                     "temperature": temperature,
                     "variation_num": num_variations,
+                    "wildcard_mode": wildcard_mode,
                     "original_prompt": basic_prompt,
                     "aesthetic_controls": aesthetic_controls,
-                    "had_image_reference": reference_image is not None
+                    "had_image_reference": reference_image is not None,
+                    "vision_pass": "single_pass" if reference_images else "two_pass",
+                    "timings": timing_metadata()
                 }
                 
                 save_result = save_prompts_to_file(
@@ -716,7 +873,15 @@ class AIVideoPromptExpanderAdvanced:
             controls_summary = self._summarize_controls(aesthetic_controls)
             mode_display = f"Mode: {mode}" + (" (with image)" if reference_image is not None else "")
             vision_status = f" | Vision: {len(vision_caption)} chars" if vision_caption else ""
-            status = f"✅ Generated {num_variations} variation(s) | {operation_mode} | Detail: {detail_level} | Preset: {preset}\n{mode_display}{vision_status}\n{controls_summary}\n{file_status}"
+            if reference_images:
+                vision_status = f" | Vision: single-pass ({len(vision_caption)} chars caption)"
+            status = f"✅ Generated {len(breakdowns)} variation(s) | {operation_mode} | Detail: {detail_level} | Preset: {preset}\n{mode_display}{vision_status}\n{controls_summary}\n{file_status}\n{timing_status()}"
+            breaker_note = llm.breaker_status()
+            if breaker_note:
+                status += f"\n{breaker_note}"
+            residency_note = llm.residency_status()
+            if residency_note:
+                status += f"\n{residency_note}"
             
             return (
                 positive_prompts[0],
@@ -836,38 +1001,29 @@ class AIVideoPromptExpanderAdvanced:
                 label = key.replace("_", " ").title()
                 lines.append(f"  - {label}: {value}")
         
-        lines.append("\n" + "=" * 70)
+        if breakdowns[0].get('deterministic'):
+            words = ", ".join(str(b['deterministic']['words']) for b in breakdowns if b.get('deterministic'))
+            lines.append(f"\nExpansion Engine: deterministic (llm_backend=none), words per variation: {words}")
         
-        return "\n".join(lines)
-    
-    def _process_alternations(self, text: str) -> str:
-        """
-        Process alternation syntax {option1|option2|option3}
-        Replaces with randomly chosen option
-        """
-        import re
-        import random
+        if breakdowns[0].get('n_choices'):
+            n_choices = breakdowns[0]['n_choices']
+            lines.append(
+                f"\nVariation Requests: {n_choices['mode']} "
+                f"({n_choices['server_choices']} of {len(breakdowns)} choices from one server call)"
+            )
         
-        # Pattern to match {option1|option2|option3}
-        pattern = r'\{([^{}]+)\}'
+        if breakdowns[0].get('single_pass'):
+            single_pass = breakdowns[0]['single_pass']
+            lines.append(
+                f"\nVision Pass: single-pass ({single_pass['model']} read the image with the expansion request, "
+                f"caption {single_pass['caption_chars']} chars)"
+            )
         
-        def replace_alternation(match):
-            options = match.group(1).split('|')
-            # Strip whitespace from each option
-            options = [opt.strip() for opt in options]
-            return random.choice(options)
+        lines.extend(format_diversity_report(breakdowns[0].get('diversity')))
         
-        # Keep replacing until no more alternations found (handles nested cases)
-        max_iterations = 10  # Prevent infinite loops
-        iteration = 0
-        while '{' in text and '|' in text and iteration < max_iterations:
-            new_text = re.sub(pattern, replace_alternation, text)
-            if new_text == text:  # No more changes
-                break
-            text = new_text
-            iteration += 1
+        lines.append("\n" + "=" * 70)
         
-        return text
+        return "\n".join(lines)
     
     def _preserve_emphasis_syntax(self, text: str) -> str:
         """
@@ -996,6 +1152,25 @@ class AIVideoPromptExpanderAdvanced:
         
         return mode_instructions.get(reference_mode, mode_instructions["recreate_exact"])
     
+    def _reference_image_bytes(self, image_tensor) -> Optional[bytes]:
+        """First image of a ComfyUI IMAGE batch as PNG bytes (single-pass vision)."""
+        try:
+            import io
+            import torch
+            import numpy as np
+            from PIL import Image
+            
+            if not isinstance(image_tensor, torch.Tensor):
+                return None
+            img_np = (np.clip(image_tensor[0].cpu().numpy(), 0.0, 1.0) * 255).astype(np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(img_np).save(buffer, format="PNG")
+            return buffer.getvalue()
+        except Exception as e:
+            print(f"[Advanced Node] Error encoding image: {e}")
+            return None
+    
+    @timed_stage("vision")
     def _process_reference_image(self, image_tensor):
         """
         PASS 1: Comprehensive Vision Analysis using Qwen3-VL
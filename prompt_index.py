@@ -0,0 +1,511 @@
+"""
+SQLite FTS5 index over the prompt archive
+
+Each output directory's archive (see ``prompt_archive``) gets an
+``archive/index.sqlite3`` next to its segments. The archive writer thread
+feeds every written batch to the index in one transaction, so the index
+stays current without the node waiting on it. Existing archives and the
+legacy one-``.txt``-per-run files can be indexed after the fact.
+
+Indexed per record: id, time, node type, platform, preset, model, backend,
+seed, original input, positive/negative prompt, settings and vision
+captions. Text columns go into an FTS5 table; attributes are plain columns
+with B-tree indexes, so filtered searches and exact-input lookups stay in
+the millisecond range at millions of records.
+
+Duplicates are recognised by a hash of the positive + negative prompt: every
+run is recorded, but only the first copy of a given text enters the
+full-text index and search results report how many copies exist.
+
+Usage from the ComfyUI root::
+
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.prompt_index search output/txt2img_prompts "harbor dusk" --platform flux
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.prompt_index previous output/txt2img_prompts "a cat on a windowsill"
+    python -m custom_nodes.Local_LLM_Prompt_Enhancer.prompt_index sync output/video_prompts --text-files
+
+Set ``PROMPT_ENHANCER_PROMPT_INDEX=off`` to stop indexing new records.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .prompt_archive import ArchiveWriter, archive_dir, get_archive, read_segment, segment_paths
+
+
+INDEX_ENV = "PROMPT_ENHANCER_PROMPT_INDEX"
+INDEX_FILENAME = "index.sqlite3"
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    created TEXT,
+    type TEXT,
+    platform TEXT,
+    preset TEXT,
+    model TEXT,
+    backend TEXT,
+    seed INTEGER,
+    input_hash TEXT,
+    content_hash TEXT,
+    original_prompt TEXT,
+    positive_prompt TEXT,
+    negative_prompt TEXT,
+    settings TEXT,
+    captions TEXT,
+    canonical INTEGER NOT NULL DEFAULT 1,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS prompts_input ON prompts (input_hash, created);
+CREATE INDEX IF NOT EXISTS prompts_content ON prompts (content_hash);
+CREATE INDEX IF NOT EXISTS prompts_platform ON prompts (platform, created);
+CREATE INDEX IF NOT EXISTS prompts_preset ON prompts (preset, created);
+CREATE INDEX IF NOT EXISTS prompts_model ON prompts (model, created);
+CREATE INDEX IF NOT EXISTS prompts_seed ON prompts (seed);
+CREATE INDEX IF NOT EXISTS prompts_created ON prompts (created);
+CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5 (
+    positive_prompt, negative_prompt, original_prompt, settings, captions,
+    content='prompts', content_rowid='rowid'
+);
+CREATE TABLE IF NOT EXISTS indexed_sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+"""
+
+_FILTERS = ("type", "platform", "preset", "model", "backend", "seed")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def input_hash(original_prompt: Optional[str]) -> str:
+    """Hash of the user's input text (case and whitespace insensitive)."""
+
+    return hashlib.sha1(_normalize(original_prompt).encode("utf-8")).hexdigest()
+
+
+def content_hash(positive_prompt: Optional[str], negative_prompt: Optional[str]) -> str:
+    return hashlib.sha1(f"{_normalize(positive_prompt)}\0{_normalize(negative_prompt)}".encode("utf-8")).hexdigest()
+
+
+def _original_input(metadata: Dict[str, Any]) -> str:
+    for key in ("original_prompt", "change_request", "motion_input"):
+        value = metadata.get(key)
+        if value:
+            return str(value)
+    return ""
+
+
+def _captions(metadata: Dict[str, Any]) -> str:
+    captions = [str(value) for value in metadata.get("vision_captions") or [] if value]
+    if metadata.get("image_description"):
+        captions.append(str(metadata["image_description"]))
+    return "\n".join(captions)
+
+
+def _settings(metadata: Dict[str, Any]) -> str:
+    settings = metadata.get("settings") or metadata.get("aesthetic_controls") or {}
+    if isinstance(settings, dict):
+        return ", ".join(f"{key}={value}" for key, value in settings.items() if value not in (None, ""))
+    return str(settings)
+
+
+def _seed(metadata: Dict[str, Any]) -> Optional[int]:
+    for key in ("random_seed_used", "seed", "variation_seed"):
+        try:
+            if metadata.get(key) is not None:
+                return int(metadata[key])
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def record_row(record: Dict[str, Any], source: Optional[str] = None) -> Dict[str, Any]:
+    """Flatten an archive record into index columns."""
+
+    metadata = record.get("metadata") or {}
+    original = _original_input(metadata)
+    positive = record.get("positive_prompt") or ""
+    negative = record.get("negative_prompt") or ""
+    return {
+        "id": str(record.get("id")),
+        "created": record.get("created"),
+        "type": metadata.get("type") or metadata.get("mode"),
+        "platform": metadata.get("platform"),
+        "preset": metadata.get("preset"),
+        "model": metadata.get("model") or metadata.get("expansion_model"),
+        "backend": metadata.get("backend"),
+        "seed": _seed(metadata),
+        "input_hash": input_hash(original) if original else None,
+        "content_hash": content_hash(positive, negative),
+        "original_prompt": original,
+        "positive_prompt": positive,
+        "negative_prompt": negative,
+        "settings": _settings(metadata),
+        "captions": _captions(metadata),
+        "source": source,
+    }
+
+
+def fts_query(text: str) -> str:
+    """Quote each word so user input cannot break FTS5 query syntax (prefix ``word*`` kept)."""
+
+    terms = []
+    for word in re.findall(r"[\w'*-]+", text):
+        prefix = word.endswith("*")
+        word = word.strip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class PromptIndex:
+    """One SQLite database (WAL mode) indexing one output directory's archive."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread: the writer thread inserts, callers read
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add_records(self, records: Iterable[Dict[str, Any]], source: Optional[str] = None) -> int:
+        """Index archive records (already indexed ids are skipped); returns how many were added."""
+
+        connection = self._connection()
+        added = 0
+        with connection:
+            for record in records:
+                if not record.get("id"):
+                    continue
+                row = record_row(record, source)
+                if connection.execute("SELECT 1 FROM prompts WHERE id = ?", (row["id"],)).fetchone():
+                    continue
+                row["canonical"] = int(connection.execute(
+                    "SELECT 1 FROM prompts WHERE content_hash = ? LIMIT 1", (row["content_hash"],)
+                ).fetchone() is None)
+                cursor = connection.execute(
+                    "INSERT INTO prompts (id, created, type, platform, preset, model, backend, seed, input_hash, "
+                    "content_hash, original_prompt, positive_prompt, negative_prompt, settings, captions, canonical, source) "
+                    "VALUES (:id, :created, :type, :platform, :preset, :model, :backend, :seed, :input_hash, "
+                    ":content_hash, :original_prompt, :positive_prompt, :negative_prompt, :settings, :captions, "
+                    ":canonical, :source)",
+                    row,
+                )
+                added += 1
+                rowid = cursor.lastrowid
+                if row["canonical"]:
+                    connection.execute(
+                        "INSERT INTO prompts_fts (rowid, positive_prompt, negative_prompt, original_prompt, settings, captions) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (rowid, row["positive_prompt"], row["negative_prompt"], row["original_prompt"],
+                         row["settings"], row["captions"]),
+                    )
+        return added
+
+    def _where(self, filters: Dict[str, Any], clauses: List[str], params: List[Any], alias: str = "p") -> None:
+        for column in _FILTERS:
+            value = filters.get(column)
+            if value is not None:
+                clauses.append(f"{alias}.{column} = ?")
+                params.append(value)
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        limit: int = 20,
+        raw_query: bool = False,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
+        """Newest matches for ``text`` (FTS5) and/or attribute filters, one row per distinct prompt."""
+
+        clauses: List[str] = []
+        params: List[Any] = []
+        if text:
+            query = text if raw_query else fts_query(text)
+            if not query:
+                return []
+            sql = (
+                "SELECT p.*, (SELECT COUNT(*) FROM prompts c WHERE c.content_hash = p.content_hash) AS copies "
+                "FROM prompts_fts JOIN prompts p ON p.rowid = prompts_fts.rowid WHERE prompts_fts MATCH ?"
+            )
+            params.append(query)
+            order = " ORDER BY prompts_fts.rowid DESC"
+        else:
+            # Only first copies are canonical; walking (filter, created) indexes keeps this fast
+            sql = (
+                "SELECT p.*, (SELECT COUNT(*) FROM prompts c WHERE c.content_hash = p.content_hash) AS copies "
+                "FROM prompts p WHERE p.canonical = 1"
+            )
+            order = " ORDER BY p.created DESC"
+        self._where(filters, clauses, params)
+        if clauses:
+            sql += " AND " + " AND ".join(clauses)
+        sql += order + " LIMIT ?"
+        params.append(int(limit))
+        return [dict(row) for row in self._connection().execute(sql, params)]
+
+    def previous_expansion(self, original_prompt: str, **filters: Any) -> Optional[Dict[str, Any]]:
+        """Most recent record whose input text equals ``original_prompt`` (normalized)."""
+
+        clauses = ["p.input_hash = ?"]
+        params: List[Any] = [input_hash(original_prompt)]
+        self._where(filters, clauses, params)
+        row = self._connection().execute(
+            "SELECT p.* FROM prompts p WHERE " + " AND ".join(clauses) + " ORDER BY p.created DESC, p.rowid DESC LIMIT 1",
+            params,
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM prompts WHERE id = ?", (record_id,)).fetchone()
+        return dict(row) if row else None
+
+    def duplicates(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Prompts generated more than once, most copies first."""
+
+        rows = self._connection().execute(
+            "SELECT content_hash, COUNT(*) AS copies, MIN(created) AS first, MAX(created) AS last, "
+            "MIN(positive_prompt) AS positive_prompt FROM prompts GROUP BY content_hash HAVING copies > 1 "
+            "ORDER BY copies DESC LIMIT ?",
+            (int(limit),),
+        )
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        return int(self._connection().execute("SELECT COUNT(*) FROM prompts").fetchone()[0])
+
+    def _source_unchanged(self, path: str) -> bool:
+        stat = os.stat(path)
+        row = self._connection().execute(
+            "SELECT size, mtime_ns FROM indexed_sources WHERE path = ?", (path,)
+        ).fetchone()
+        return row is not None and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns
+
+    def _mark_source(self, path: str) -> None:
+        stat = os.stat(path)
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO indexed_sources (path, size, mtime_ns) VALUES (?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns),
+            )
+
+    def sync_archive(self, output_dir: str) -> int:
+        """Index archive segments not seen (or changed) since the last sync."""
+
+        added = 0
+        for path in segment_paths(output_dir):
+            if self._source_unchanged(path):
+                continue
+            added += self.add_records(read_segment(path), source=os.path.basename(path))
+            self._mark_source(path)
+        return added
+
+    def import_text_files(self, output_dir: str) -> int:
+        """Index legacy ``.txt`` prompt files written before the archive existed."""
+
+        added = 0
+        if not os.path.isdir(output_dir):
+            return 0
+        for name in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, name)
+            if not name.endswith(".txt") or not os.path.isfile(path) or self._source_unchanged(path):
+                continue
+            record = parse_text_file(path)
+            if record:
+                added += self.add_records([record], source=name)
+            self._mark_source(path)
+        return added
+
+
+_SECTION_RE = re.compile(r"^=+\s*$")
+
+
+def parse_text_file(path: str) -> Optional[Dict[str, Any]]:
+    """Rebuild an archive-style record from a legacy prompt ``.txt`` file."""
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as handle:
+            lines = handle.read().splitlines()
+    except OSError:
+        return None
+
+    sections: Dict[str, List[str]] = {}
+    current: Optional[str] = None
+    generated = None
+    for line in lines:
+        if _SECTION_RE.match(line):
+            current = None
+            continue
+        if line.startswith("Generated: "):
+            generated = line[len("Generated: "):].strip()
+            continue
+        if current is None and line.endswith(":") and line.upper() == line and line.strip():
+            current = line[:-1]
+            sections[current] = []
+            continue
+        if current is not None:
+            sections[current].append(line)
+
+    def text(name: str) -> str:
+        return "\n".join(sections.get(name, [])).strip()
+
+    if "POSITIVE PROMPT" not in sections:
+        return None
+    metadata: Dict[str, Any] = {}
+    labels = {"Preset": "preset", "Model": "model", "LLM Backend": "backend", "Mode": "mode",
+              "Expansion Tier": "tier", "Temperature": "temperature"}
+    for line in sections.get("METADATA", []):
+        key, _, value = line.partition(": ")
+        value = value.strip()
+        if key in labels and value and value != "N/A":
+            metadata[labels[key]] = value
+    original = text("ORIGINAL INPUT")
+    if original and original != "N/A":
+        metadata["original_prompt"] = original
+    created = None
+    if generated:
+        created = generated.replace(" ", "T")
+    digest = hashlib.sha1(os.path.basename(path).encode("utf-8")).hexdigest()[:8]
+    return {
+        "id": f"txt-{digest}-{os.path.splitext(os.path.basename(path))[0]}",
+        "created": created,
+        "positive_prompt": text("POSITIVE PROMPT"),
+        "negative_prompt": text("NEGATIVE PROMPT"),
+        "breakdown": text("BREAKDOWN"),
+        "metadata": metadata,
+    }
+
+
+_INDEXES: Dict[str, PromptIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_index(output_dir: str) -> PromptIndex:
+    """Process-wide index for ``output_dir``."""
+
+    key = os.path.abspath(output_dir)
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = PromptIndex(os.path.join(archive_dir(output_dir), INDEX_FILENAME))
+            _INDEXES[key] = index
+        return index
+
+
+_ATTACHED: set = set()
+
+
+def attach_index(output_dir: str) -> None:
+    """Index every batch the archive writer for ``output_dir`` writes (once per process)."""
+
+    if os.environ.get(INDEX_ENV, "").strip().lower() in ("0", "off", "false", "no"):
+        return
+    key = os.path.abspath(output_dir)
+    with _INDEXES_LOCK:
+        if key in _ATTACHED:
+            return
+        _ATTACHED.add(key)
+    writer: ArchiveWriter = get_archive(output_dir)
+    pending_sync = [True]
+
+    def index_batch(records: List[Dict[str, Any]]) -> None:
+        index = get_index(output_dir)
+        if pending_sync[0]:
+            # Catch up on segments written before this process (or with indexing off)
+            pending_sync[0] = False
+            index.sync_archive(output_dir)
+        index.add_records(records, source=os.path.basename(writer.current_path))
+
+    writer.add_listener(index_batch)
+
+
+def _print_rows(rows: Sequence[Dict[str, Any]]) -> None:
+    for row in rows:
+        copies = row.get("copies")
+        suffix = f"  (x{copies})" if copies and copies > 1 else ""
+        attributes = " ".join(
+            f"{column}={row[column]}" for column in ("type", "platform", "preset", "model", "seed") if row.get(column) is not None
+        )
+        sys.stdout.write(f"{row.get('id')}  {row.get('created') or ''}  {attributes}{suffix}\n")
+        sys.stdout.write(f"    {(row.get('positive_prompt') or '')[:200]}\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Search the prompt archive index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="Full-text and attribute search")
+    search.add_argument("output_dir")
+    search.add_argument("text", nargs="?", default=None)
+    search.add_argument("--raw", action="store_true", help="Pass the text to FTS5 unchanged (AND/OR/NEAR...)")
+    search.add_argument("-n", "--limit", type=int, default=20)
+
+    previous = commands.add_parser("previous", help="Most recent expansion of this exact input")
+    previous.add_argument("output_dir")
+    previous.add_argument("text")
+
+    for sub in (search, previous):
+        for column in _FILTERS:
+            sub.add_argument(f"--{column}", type=int if column == "seed" else str, default=None)
+
+    sync = commands.add_parser("sync", help="Index archive segments (and optionally legacy .txt files)")
+    sync.add_argument("output_dir")
+    sync.add_argument("--text-files", action="store_true")
+
+    duplicates = commands.add_parser("duplicates", help="Prompts generated more than once")
+    duplicates.add_argument("output_dir")
+    duplicates.add_argument("-n", "--limit", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    index = get_index(args.output_dir)
+
+    if args.command == "sync":
+        added = index.sync_archive(args.output_dir)
+        if args.text_files:
+            added += index.import_text_files(args.output_dir)
+        print(f"[Prompt Index] Indexed {added} new record(s); {index.count()} total")
+        return 0
+
+    if args.command == "duplicates":
+        for row in index.duplicates(args.limit):
+            sys.stdout.write(f"x{row['copies']}  {row['first']} .. {row['last']}  {(row['positive_prompt'] or '')[:160]}\n")
+        return 0
+
+    filters = {column: getattr(args, column) for column in _FILTERS}
+    if args.command == "previous":
+        row = index.previous_expansion(args.text, **filters)
+        if row is None:
+            print("[Prompt Index] No previous expansion for this input")
+            return 1
+        _print_rows([row])
+        return 0
+
+    _print_rows(index.search(args.text, limit=args.limit, raw_query=args.raw, **filters))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,11 +26,14 @@ import re
 import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Sequence
 
 import folder_paths
 from PIL import Image
 
+from .metrics import REGISTRY, record_cache
+from .stop_sequences import apply_stops, stop_check
+
 
 try:  # Optional heavy dependencies – only required when Qwen is used.
     from transformers import (  # type: ignore
@@ -46,6 +49,12 @@ except ImportError:  # pragma: no cover - handled gracefully at runtime
     Qwen3VLForConditionalGeneration = None  # type: ignore[assignment]
     BitsAndBytesConfig = None  # type: ignore[assignment]
 
+try:
+    from transformers import StoppingCriteria, StoppingCriteriaList  # type: ignore
+except ImportError:  # pragma: no cover - handled gracefully at runtime
+    StoppingCriteria = object  # type: ignore[assignment,misc]
+    StoppingCriteriaList = None  # type: ignore[assignment]
+
 try:
     from huggingface_hub import snapshot_download  # type: ignore
 except ImportError:  # pragma: no cover - handled gracefully
@@ -78,6 +87,59 @@ _MODEL_CACHE: Dict[Qwen3VLConfig, Dict[str, Any]] = {}
 _CACHE_LOCK = threading.Lock()
 
 
+def _loaded_model_values() -> Dict[tuple, float]:
+    with _CACHE_LOCK:
+        configs = list(_MODEL_CACHE)
+    return {(config.model_id, config.quantization or "none"): 1.0 for config in configs}
+
+
+REGISTRY.gauge(
+    "prompt_enhancer_qwen_models_loaded",
+    "Qwen3-VL models currently resident in the in-process model cache.",
+    ("model_id", "quantization"),
+    callback=_loaded_model_values,
+)
+
+
+class _TextStoppingCriteria(StoppingCriteria):  # type: ignore[misc]
+    """Stop ``generate`` once the decoded continuation hits a stop string or paragraph limit.
+
+    Past ``window`` new tokens the check only runs every eighth step so
+    re-decoding the answer stays cheap for long generations.
+    """
+
+    def __init__(self, processor: Any, input_length: int, done, window: int = 256):
+        self.processor = processor
+        self.input_length = input_length
+        self.done = done
+        self.window = window
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        generated = input_ids[0, self.input_length:]
+        if generated.shape[-1] == 0:
+            return False
+        if generated.shape[-1] > self.window and generated.shape[-1] % 8:
+            return False
+        text = self.processor.batch_decode(
+            generated[None, :], skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )[0]
+        return self.done(text)
+
+
+def _stopping_criteria(
+    processor: Any,
+    input_length: int,
+    stop: Optional[Sequence[str]],
+    max_paragraphs: Optional[int],
+):
+    """``StoppingCriteriaList`` for the requested stops, or None."""
+
+    done = stop_check(stop, max_paragraphs)
+    if done is None or StoppingCriteriaList is None:
+        return None
+    return StoppingCriteriaList([_TextStoppingCriteria(processor, input_length, done)])
+
+
 def caption_with_qwen3_vl(
     image: Image.Image,
     prompt: str,
@@ -86,6 +148,8 @@ def caption_with_qwen3_vl(
     backend_hint: Optional[str] = None,
     max_new_tokens: int = 512,
     temperature: float = 0.7,
+    stop: Optional[Sequence[str]] = None,
+    max_paragraphs: Optional[int] = None,
 ) -> Dict[str, Any]:
     """Generate a detailed caption for ``image`` using a local Qwen3-VL model.
 
@@ -109,6 +173,9 @@ def caption_with_qwen3_vl(
         Generation length cap for the response.
     temperature:
         Sampling temperature. Values <=0.0 force greedy decoding.
+    stop / max_paragraphs:
+        Optional stop strings and paragraph limit; decoding ends as soon as
+        either is reached and the caption is trimmed accordingly.
 
     Returns
     -------
@@ -185,6 +252,10 @@ def caption_with_qwen3_vl(
     if generation_kwargs["do_sample"]:
         generation_kwargs["temperature"] = max(0.01, float(temperature))
 
+    stopping = _stopping_criteria(processor, inputs["input_ids"].shape[-1], stop, max_paragraphs)
+    if stopping is not None:
+        generation_kwargs["stopping_criteria"] = stopping
+
     try:
         if torch is None:
             raise Qwen3VLError("PyTorch is required for Qwen3-VL captioning.")
@@ -205,6 +276,7 @@ def caption_with_qwen3_vl(
     caption = (decoded[0] if decoded else "").strip()
     if "</think>" in caption:
         caption = caption.split("</think>")[-1].strip()
+    caption = apply_stops(caption, stop, max_paragraphs)
 
     return {"success": True, "caption": caption, "error": None}
 
@@ -264,7 +336,9 @@ def _get_or_load_model(config: Qwen3VLConfig) -> Dict[str, Any]:
     with _CACHE_LOCK:
         cached = _MODEL_CACHE.get(config)
         if cached:
+            record_cache("qwen_model", True)
             return cached
+    record_cache("qwen_model", False)
 
     model_path = _resolve_model_path(config.model_id)
 
@@ -362,6 +436,8 @@ def generate_text_with_qwen3_vl(
     backend_hint: Optional[str] = None,
     max_new_tokens: int = 2000,
     temperature: float = 0.7,
+    stop: Optional[Sequence[str]] = None,
+    max_paragraphs: Optional[int] = None,
 ) -> Dict[str, Any]:
     """Generate text using Qwen3-VL model (no image input - pure text generation).
     
@@ -377,13 +453,17 @@ def generate_text_with_qwen3_vl(
         Maximum tokens to generate.
     temperature:
         Sampling temperature (0.1-2.0).
+    stop:
+        Optional strings that end generation (excluded from the response).
+    max_paragraphs:
+        Optional limit on content paragraphs; generation stops once exceeded.
         
     Returns
     -------
     Dictionary with 'success' bool, 'response' text, and optional 'error'.
     """
     try:
-        config = _parse_model_spec(model_spec, backend_hint)
+        config = _parse_config(model_spec, backend_hint)
         state = _get_or_load_model(config)
         
         model = state["model"]
@@ -409,6 +489,8 @@ def generate_text_with_qwen3_vl(
             return_tensors="pt",
         )
         inputs = inputs.to(device)
+        input_len = inputs["input_ids"].shape[1]
+        stopping = _stopping_criteria(processor, input_len, stop, max_paragraphs)
         
         # Generate with temperature sampling
         with torch.no_grad():
@@ -417,10 +499,10 @@ def generate_text_with_qwen3_vl(
                 max_new_tokens=max_new_tokens,
                 temperature=temperature,
                 do_sample=(temperature > 0.0),  # Only sample if temperature > 0
+                stopping_criteria=stopping,
             )
         
         # Decode only the new tokens (skip input)
-        input_len = inputs["input_ids"].shape[1]
         generated_ids = output_ids[:, input_len:]
         response_text = processor.batch_decode(
             generated_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False
@@ -428,7 +510,7 @@ def generate_text_with_qwen3_vl(
         
         return {
             "success": True,
-            "response": response_text.strip(),
+            "response": apply_stops(response_text, stop, max_paragraphs),
             "error": None
         }
         
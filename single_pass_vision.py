@@ -0,0 +1,125 @@
+"""
+Single-pass multimodal expansion (caption and prompt in one request)
+
+When the model that expands the prompt can read images itself (``vision_backend``
+auto/inherit on a VLM served over HTTP), captioning the reference first and
+expanding second costs two full generations, and the second one only sees the
+image through the caption. In single-pass mode the reference image(s) are
+attached to the expansion request and the model is asked for a structured
+reply::
+
+    CAPTION: <two or three sentences describing the image>
+    PROMPT:
+    <the expansion the system prompt asks for>
+
+:func:`split_response` separates the sections: the captions feed the node's
+``vision_caption`` output and the prompt is parsed like any other expansion. A
+reply without a ``PROMPT:`` marker keeps everything but the caption lines as
+the prompt; a reply without captions leaves them empty and the node falls back
+to "no caption" in its output.
+
+The caption lines precede the prompt, so paragraph limits are raised by the
+number of images for the request (:func:`single_pass_stop_settings`) and then
+re-applied to the prompt section alone.
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .llm_backend import HTTP_BACKENDS
+from .metrics import REGISTRY
+from .stop_sequences import apply_stops
+
+
+VISION_PASS_OPTIONS = ["auto", "two_pass"]
+
+SINGLE_PASS_REQUESTS = REGISTRY.counter(
+    "prompt_enhancer_single_pass_total",
+    "Expansions that attached the reference image(s) instead of captioning first, by node and outcome (captioned/no_caption/failed).",
+    ("node", "outcome"),
+)
+
+# Stands in for the Pass 1 caption in prompts that embed one
+ATTACHED_IMAGE_NOTE = (
+    "The reference image is attached to this message. Read every detail you need "
+    "(subject, setting, lighting, palette, composition, style) directly from it."
+)
+
+_CAPTION_RE = re.compile(r"^[ \t>*_#-]*CAPTION(?:[ \t]+(\d+))?[ \t*_]*:[ \t*_]*", re.IGNORECASE | re.MULTILINE)
+_PROMPT_RE = re.compile(r"^[ \t>*_#-]*(?:EXPANDED[ \t]+)?PROMPT[ \t*_]*:[ \t*_]*", re.IGNORECASE | re.MULTILINE)
+
+
+def single_pass_eligible(llm, vision_pass: str = "auto") -> bool:
+    """True when ``llm`` can take the reference image(s) with the expansion itself."""
+
+    if (vision_pass or "auto").strip().lower() != "auto" or llm is None:
+        return False
+    return llm.backend_type in HTTP_BACKENDS and llm.supports_images()
+
+
+def caption_instructions(labels: Sequence[str]) -> str:
+    """User-prompt block asking for the CAPTION / PROMPT reply structure."""
+
+    if len(labels) == 1:
+        attached = f"REFERENCE IMAGE ATTACHED: {labels[0]} is attached to this message; look at it directly."
+        caption_lines = ["CAPTION: <two or three plain sentences describing the image: subjects, setting, lighting, palette>"]
+    else:
+        attached = (
+            f"REFERENCE IMAGES ATTACHED: {', '.join(labels)} are attached to this message in that order; "
+            "look at them directly."
+        )
+        caption_lines = [
+            f"CAPTION {index}: <two or three plain sentences describing {label}>"
+            for index, label in enumerate(labels, 1)
+        ]
+    return "\n".join(
+        [attached, "Reply in exactly this structure, each caption on a single line:"]
+        + caption_lines
+        + ["PROMPT:", "<the prompt requested above, and nothing else>"]
+    )
+
+
+def single_pass_stop_settings(stop_settings: Optional[Dict], image_count: int) -> Dict:
+    """Stop settings that leave room for the caption line(s) before the prompt."""
+
+    settings = dict(stop_settings or {})
+    if settings.get("max_paragraphs"):
+        settings["max_paragraphs"] = settings["max_paragraphs"] + image_count
+    return settings
+
+
+def split_response(
+    text: str,
+    image_count: int,
+    stop_settings: Optional[Dict] = None
+) -> Tuple[List[str], str]:
+    """
+    Split a single-pass reply into captions and prompt
+
+    Returns:
+        Tuple of (captions, prompt): one caption per image in attachment order
+        ('' where the model gave none) and the prompt section with the caller's
+        original stop settings applied
+    """
+    text = (text or "").strip()
+    prompt_match = _PROMPT_RE.search(text)
+    head, prompt = (text[:prompt_match.start()], text[prompt_match.end():]) if prompt_match else (text, "")
+
+    captions = [""] * image_count
+    markers = list(_CAPTION_RE.finditer(head))
+    for position, match in enumerate(markers):
+        end = markers[position + 1].start() if position + 1 < len(markers) else len(head)
+        body = head[match.end():end]
+        if not prompt_match:
+            # Without a PROMPT marker only the caption's own line belongs to it
+            body = body.split("\n", 1)[0]
+        index = int(match.group(1)) - 1 if match.group(1) else position
+        if 0 <= index < image_count and not captions[index]:
+            captions[index] = " ".join(body.split()).strip("*_ ")
+    if not prompt_match:
+        prompt = _CAPTION_RE.sub("\x00", head)
+        prompt = "\n".join(line for line in prompt.splitlines() if "\x00" not in line)
+
+    settings = stop_settings or {}
+    prompt = apply_stops(prompt.strip(), settings.get("stop"), settings.get("max_paragraphs"))
+    return captions, prompt.strip()
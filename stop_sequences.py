@@ -0,0 +1,138 @@
+"""
+Stop sequences and paragraph limits for early termination of generations
+
+Backends are told to stop decoding as soon as the prompt is complete: explicit
+stop strings go to the server (``stop`` for OpenAI-compatible servers,
+``options.stop`` for Ollama, a stopping criterion for local Qwen) and the same
+rules are applied to the returned text so every backend yields identical
+output.
+
+A paragraph limit cannot be expressed as a plain ``"\\n\\n"`` stop string
+because models often open with a preamble such as ``Here is the prompt:`` on
+its own line. Paragraphs are therefore counted here, ignoring preamble/header
+paragraphs (ending in a colon) and anything inside an unfinished ``<think>``
+block, and the HTTP backends stream the response and disconnect once the
+limit is exceeded.
+"""
+
+import re
+from typing import Callable, List, Optional, Sequence
+
+# OpenAI-compatible servers accept at most four stop strings
+MAX_SERVER_STOPS = 4
+
+_PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+
+
+def normalize_stops(stop: Optional[Sequence[str]]) -> List[str]:
+    """Deduplicate and drop empty entries (a bare string counts as one stop)."""
+
+    if not stop:
+        return []
+    if isinstance(stop, str):
+        stop = [stop]
+    stops: List[str] = []
+    for value in stop:
+        if value and value not in stops:
+            stops.append(value)
+    return stops
+
+
+def _answer_start(text: str) -> Optional[int]:
+    """Offset where the visible answer begins (None while still inside <think>)."""
+
+    if "</think>" in text:
+        return text.rindex("</think>") + len("</think>")
+    if text.lstrip().startswith("<think>"):
+        return None
+    return 0
+
+
+def find_stop(text: str, stops: Sequence[str], start: int = 0) -> Optional[int]:
+    """Index of the earliest stop string at or after ``start``."""
+
+    positions = [text.find(value, start) for value in stops]
+    positions = [pos for pos in positions if pos >= 0]
+    return min(positions) if positions else None
+
+
+def _paragraph_spans(text: str, start: int) -> List[tuple]:
+    spans = []
+    cursor = start
+    for match in _PARAGRAPH_BREAK_RE.finditer(text, start):
+        spans.append((cursor, match.start()))
+        cursor = match.end()
+    spans.append((cursor, len(text)))
+    return spans
+
+
+def _is_content(paragraph: str) -> bool:
+    paragraph = paragraph.strip()
+    return bool(paragraph) and not paragraph.endswith(":") and paragraph.strip("`") != ""
+
+
+def count_paragraphs(text: str) -> int:
+    """Number of content paragraphs in the visible answer."""
+
+    start = _answer_start(text)
+    if start is None:
+        return 0
+    return sum(1 for begin, end in _paragraph_spans(text, start) if _is_content(text[begin:end]))
+
+
+def apply_stops(
+    text: str,
+    stop: Optional[Sequence[str]] = None,
+    max_paragraphs: Optional[int] = None,
+) -> str:
+    """Trim ``text`` the way a server honouring the stops would have.
+
+    Reasoning blocks are dropped, the answer is cut at the first stop string,
+    and only the first ``max_paragraphs`` content paragraphs are kept.
+    """
+
+    if not text:
+        return text
+    start = _answer_start(text)
+    if start is None:
+        # Generation ended inside the reasoning block; nothing to salvage
+        return ""
+    text = text[start:]
+    stops = normalize_stops(stop)
+    cut = find_stop(text, stops)
+    if cut is not None:
+        text = text[:cut]
+    if max_paragraphs and max_paragraphs > 0:
+        seen = 0
+        for begin, end in _paragraph_spans(text, 0):
+            if _is_content(text[begin:end]):
+                seen += 1
+                if seen == max_paragraphs:
+                    text = text[:end]
+                    break
+    return text.strip()
+
+
+def stop_check(
+    stop: Optional[Sequence[str]] = None,
+    max_paragraphs: Optional[int] = None,
+) -> Optional[Callable[[str], bool]]:
+    """Predicate telling a streaming reader that the answer is complete.
+
+    Returns None when there is nothing to check.
+    """
+
+    stops = normalize_stops(stop)
+    if not stops and not max_paragraphs:
+        return None
+
+    def done(text: str) -> bool:
+        start = _answer_start(text)
+        if start is None:
+            return False
+        if stops and find_stop(text, stops, start) is not None:
+            return True
+        # A limit is exceeded only once the next paragraph has started
+        return bool(max_paragraphs) and count_paragraphs(text) > max_paragraphs
+
+    return done
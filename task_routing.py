@@ -0,0 +1,160 @@
+"""
+Task-based model routing and per-task concurrency limits
+
+A node run makes several kinds of requests: reference captions, directive
+analysis (~220 tokens), reference refinement (~240 tokens), optionally a
+creative brainstorm, and the final expansion the user actually sees. By default
+they all go to the node's own backend, so short sub-tasks occupy the large
+model's slots. A routing table maps each task to its own backend, endpoint and
+model, e.g. a 1-3B model for the sub-tasks, and bounds how many requests of
+that task may be in flight at once across the process.
+
+``PROMPT_ENHANCER_ROUTES`` holds the table as inline JSON or as the path of a
+JSON file (re-read when it changes)::
+
+    {
+      "directive_analysis": {"backend": "ollama", "endpoint": "http://localhost:11434",
+                             "model": "qwen2.5:1.5b", "max_concurrency": 4},
+      "refine": {"backend": "ollama", "endpoint": "http://localhost:11434",
+                 "model": "qwen2.5:1.5b", "max_concurrency": 4},
+      "main_expand": {"max_concurrency": 2}
+    }
+
+Tasks are listed in :data:`TASKS`. Entry fields are ``backend``, ``endpoint``,
+``model``, ``temperature`` and ``max_concurrency``; fields an entry leaves out
+come from the node's backend (a missing ``model`` on another server is
+auto-detected). ``max_concurrency`` of 0 or absent means unbounded. Tasks
+without an entry use the node's backend unchanged. Time spent waiting for a
+slot is recorded in ``prompt_enhancer_task_queue_seconds``.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from .metrics import REGISTRY
+
+
+ROUTES_ENV = "PROMPT_ENHANCER_ROUTES"
+
+TASKS = ("caption", "directive_analysis", "refine", "main_expand", "brainstorm")
+ROUTE_FIELDS = ("backend", "endpoint", "model", "temperature", "max_concurrency")
+
+TASK_QUEUE_SECONDS = REGISTRY.histogram(
+    "prompt_enhancer_task_queue_seconds",
+    "Time a request waited for a free slot under its task's max_concurrency.",
+    ("task",),
+)
+
+_ROUTES: Tuple[Any, Dict[str, Dict[str, Any]]] = (None, {})
+_SLOTS: Dict[str, Tuple[int, threading.BoundedSemaphore]] = {}
+_LOCK = threading.Lock()
+
+
+def _read_table(raw: str) -> Tuple[Any, Optional[str]]:
+    """(cache key, JSON text) for an inline table or a file path."""
+
+    if raw.startswith("{"):
+        return raw, raw
+    try:
+        mtime = os.path.getmtime(raw)
+    except OSError:
+        return (raw, None), None
+    with open(raw, "r", encoding="utf-8") as handle:
+        return (raw, mtime), handle.read()
+
+
+def _validate(table: Any) -> Dict[str, Dict[str, Any]]:
+    if not isinstance(table, dict):
+        raise ValueError("the routing table must be a JSON object")
+    routes: Dict[str, Dict[str, Any]] = {}
+    for task, entry in table.items():
+        if task not in TASKS:
+            print(f"[LLM Backend] Ignoring route for unknown task '{task}' (known: {', '.join(TASKS)})")
+            continue
+        if not isinstance(entry, dict):
+            print(f"[LLM Backend] Ignoring route for '{task}': expected an object")
+            continue
+        unknown = sorted(set(entry) - set(ROUTE_FIELDS))
+        if unknown:
+            print(f"[LLM Backend] Ignoring unknown route field(s) for '{task}': {', '.join(unknown)}")
+        route = {key: entry[key] for key in ROUTE_FIELDS if entry.get(key) not in (None, "")}
+        if "backend" in route:
+            route["backend"] = str(route["backend"]).strip().lower()
+        try:
+            route["max_concurrency"] = max(0, int(route.get("max_concurrency", 0)))
+        except (TypeError, ValueError):
+            print(f"[LLM Backend] Route '{task}': max_concurrency must be an integer, ignoring it")
+            route["max_concurrency"] = 0
+        routes[task] = route
+    return routes
+
+
+def load_routes() -> Dict[str, Dict[str, Any]]:
+    """Routing table from ``PROMPT_ENHANCER_ROUTES`` (empty when unset or invalid)."""
+
+    global _ROUTES
+    raw = os.environ.get(ROUTES_ENV, "").strip()
+    if not raw:
+        return {}
+    try:
+        key, text = _read_table(raw)
+    except OSError as exc:
+        print(f"[LLM Backend] Cannot read {ROUTES_ENV} file {raw}: {exc}")
+        return {}
+    with _LOCK:
+        if _ROUTES[0] == key:
+            return _ROUTES[1]
+    routes: Dict[str, Dict[str, Any]] = {}
+    if text is None:
+        print(f"[LLM Backend] {ROUTES_ENV} file {raw} does not exist, routing every task to the node's backend")
+    else:
+        try:
+            routes = _validate(json.loads(text))
+        except ValueError as exc:
+            print(f"[LLM Backend] Ignoring {ROUTES_ENV}: {exc}")
+    with _LOCK:
+        _ROUTES = (key, routes)
+    return routes
+
+
+def route_for(task: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Route entry for ``task``, or None when the task uses the node's backend."""
+
+    if not task:
+        return None
+    return load_routes().get(task)
+
+
+def _slot(task: str) -> Optional[threading.BoundedSemaphore]:
+    route = route_for(task)
+    limit = route.get("max_concurrency", 0) if route else 0
+    if limit <= 0:
+        return None
+    with _LOCK:
+        current = _SLOTS.get(task)
+        if current is None or current[0] != limit:
+            # A changed limit takes effect for new requests; holders of the old one finish as usual
+            current = (limit, threading.BoundedSemaphore(limit))
+            _SLOTS[task] = current
+        return current[1]
+
+
+@contextmanager
+def task_slot(task: Optional[str]):
+    """Hold one of ``task``'s concurrency slots for the duration of a request."""
+
+    semaphore = _slot(task) if task else None
+    if semaphore is None:
+        yield
+        return
+    started = time.perf_counter()
+    semaphore.acquire()
+    TASK_QUEUE_SECONDS.observe(time.perf_counter() - started, task=task)
+    try:
+        yield
+    finally:
+        semaphore.release()
@@ -0,0 +1,240 @@
+"""
+Lightweight stage timing for node executions
+
+A node entry point decorated with ``@traced_node("name")`` gets a fresh
+:class:`Trace`; helpers decorated with ``@timed_stage("stage")`` (or wrapped in
+``with span("stage"):``) record their wall time into it, and every backend
+request made while a span is open adds its token counts and bytes on the wire
+to that span. Outside a traced node all of this is a no-op.
+
+Set ``PROMPT_ENHANCER_TRACE_LOG`` to a file path to append one JSON line per
+node execution.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from .metrics import NODE_LATENCY, NODE_RUNS
+
+
+TRACE_LOG_ENV = "PROMPT_ENHANCER_TRACE_LOG"
+
+_ACTIVE_TRACE: contextvars.ContextVar = contextvars.ContextVar("prompt_enhancer_trace", default=None)
+_ACTIVE_SPAN: contextvars.ContextVar = contextvars.ContextVar("prompt_enhancer_span", default=None)
+_LOG_LOCK = threading.Lock()
+
+
+class Span:
+    """One timed stage plus the backend traffic that happened inside it."""
+
+    __slots__ = (
+        "name", "started", "elapsed", "calls", "prompt_tokens",
+        "completion_tokens", "bytes_sent", "bytes_received", "attrs",
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.attrs: Dict[str, Any] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "stage": self.name,
+            "seconds": round(self.elapsed, 4),
+            "llm_calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+        if self.attrs:
+            data.update(self.attrs)
+        return data
+
+
+class Trace:
+    """Ordered collection of spans for a single node execution."""
+
+    def __init__(self, node: str):
+        self.node = node
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now().isoformat(timespec="seconds")
+        self.spans: List[Span] = []
+        self._token = None
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        record = Span(name)
+        record.attrs.update(attrs)
+        token = _ACTIVE_SPAN.set(record)
+        try:
+            yield record
+        finally:
+            record.elapsed = time.perf_counter() - record.started
+            _ACTIVE_SPAN.reset(token)
+            self.spans.append(record)
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def stage_totals(self) -> Dict[str, Dict[str, Any]]:
+        """Aggregate spans by stage name, preserving first-seen order."""
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        for record in self.spans:
+            entry = totals.setdefault(record.name, {
+                "count": 0, "seconds": 0.0, "llm_calls": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "bytes_sent": 0, "bytes_received": 0,
+            })
+            entry["count"] += 1
+            entry["seconds"] += record.elapsed
+            entry["llm_calls"] += record.calls
+            entry["prompt_tokens"] += record.prompt_tokens
+            entry["completion_tokens"] += record.completion_tokens
+            entry["bytes_sent"] += record.bytes_sent
+            entry["bytes_received"] += record.bytes_received
+        return totals
+
+    def summary(self) -> str:
+        """Compact one-line timing summary for node status strings."""
+
+        parts = []
+        for name, entry in self.stage_totals().items():
+            text = f"{name} {entry['seconds']:.2f}s"
+            if entry["count"] > 1:
+                text += f"×{entry['count']}"
+            tokens = entry["prompt_tokens"] + entry["completion_tokens"]
+            if tokens:
+                text += f" ({tokens} tok)"
+            parts.append(text)
+        parts.append(f"total {self.total_seconds:.2f}s")
+        sent = sum(entry["bytes_sent"] for entry in self.stage_totals().values())
+        if sent:
+            parts.append(f"sent {_format_bytes(sent)}")
+        return "⏱ " + ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "node": self.node,
+            "timestamp": self.timestamp,
+            "total_seconds": round(self.total_seconds, 4),
+            "stages": [record.to_dict() for record in self.spans],
+        }
+
+    def emit_log(self) -> None:
+        path = os.environ.get(TRACE_LOG_ENV, "").strip()
+        if not path:
+            return
+        try:
+            line = json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+            with _LOG_LOCK:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(path, "a", encoding="utf-8") as handle:
+                    handle.write(line + "\n")
+        except Exception as exc:
+            print(f"[Telemetry] Failed to write trace log: {exc}")
+
+
+def _format_bytes(count: int) -> str:
+    if count < 1024:
+        return f"{count} B"
+    if count < 1024 * 1024:
+        return f"{count / 1024:.1f} KB"
+    return f"{count / (1024 * 1024):.1f} MB"
+
+
+def current_trace() -> Optional[Trace]:
+    """Return the trace of the node execution in progress, if any."""
+
+    return _ACTIVE_TRACE.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """Time a stage of the active trace (yields ``None`` when not tracing)."""
+
+    trace = _ACTIVE_TRACE.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attrs) as record:
+        yield record
+
+
+def timed_stage(name: str):
+    """Decorator form of :func:`span`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_node(node: str):
+    """Give each call of a node entry point its own :class:`Trace`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = Trace(node)
+            token = _ACTIVE_TRACE.set(trace)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _ACTIVE_TRACE.reset(token)
+                NODE_RUNS.inc(node=node)
+                NODE_LATENCY.observe(trace.total_seconds, node=node)
+                trace.emit_log()
+        return wrapper
+    return decorator
+
+
+def record_llm_call(
+    bytes_sent: int = 0,
+    bytes_received: int = 0,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+) -> None:
+    """Attribute one backend request to the innermost open span."""
+
+    record = _ACTIVE_SPAN.get()
+    if record is None:
+        return
+    record.calls += 1
+    record.bytes_sent += int(bytes_sent or 0)
+    record.bytes_received += int(bytes_received or 0)
+    record.prompt_tokens += int(prompt_tokens or 0)
+    record.completion_tokens += int(completion_tokens or 0)
+
+
+def timing_status() -> str:
+    """Summary of the active trace, or an empty string when not tracing."""
+
+    trace = _ACTIVE_TRACE.get()
+    return trace.summary() if trace is not None else ""
+
+
+def timing_metadata() -> Optional[Dict[str, Any]]:
+    """Serializable snapshot of the active trace for saved metadata."""
+
+    trace = _ACTIVE_TRACE.get()
+    return trace.to_dict() if trace is not None else None
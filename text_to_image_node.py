@@ -11,10 +11,32 @@ import io
 import random
 import re
 from typing import Tuple, Optional, Dict, List, Any, Union
+from .deterministic_engine import DeterministicExpander, analysis_to_phrases, settings_to_phrases
 from .llm_backend import LLMBackend
+from .metrics import LLM_RETRIES
+from .task_routing import route_for
 from .qwen3_vl_backend import caption_with_qwen3_vl
-from .platforms import get_platform_config, get_negative_prompt_for_platform
+from .prompt_assembly import PromptAssembler
+from .single_pass_vision import (
+    SINGLE_PASS_REQUESTS,
+    VISION_PASS_OPTIONS,
+    caption_instructions,
+    single_pass_eligible,
+    single_pass_stop_settings,
+    split_response
+)
+from .platforms import fit_clip_token_budget, get_platform_config, get_negative_prompt_for_platform, get_stop_settings
 from .utils import save_prompts_to_file, parse_keywords
+from .wildcards import expand_wildcards
+from .telemetry import timed_stage, traced_node, timing_metadata, timing_status
+
+
+# Batched directive replies: "[R1]" / "Reference 1:" section markers and FOCUS/GUIDANCE
+# fields, tolerating markdown emphasis around labels ("**FOCUS:** warm light")
+_BATCH_MARKER_RE = re.compile(
+    r"^[>*_#\s-]*(?:\[\s*R(\d+)\s*\]|R(?:eference)?[ \t]*(\d+)[ \t*_]*:?)[ \t*_]*(.*)$", re.IGNORECASE
+)
+_BATCH_FIELD_RE = re.compile(r"^[>*_#\s-]*(FOCUS|GUIDANCE)[ \t*_]*:[ \t*_]*(.*)$", re.IGNORECASE)
 
 
 class TextToImagePromptEnhancer:
@@ -32,6 +54,7 @@ class TextToImagePromptEnhancer:
     def __init__(self):
         self.type = "text_to_image_enhancement"
         self.output_dir = "output/txt2img_prompts"
+        self.deterministic = DeterministicExpander()
         
         # Wildcard options
         self.camera_angles = [
@@ -322,7 +345,8 @@ class TextToImagePromptEnhancer:
             }
         }
 
-        self.default_reference_analysis_method = "sequential_refine"
+        # "batched": one LLM call for all references, falling back to "sequential_refine"
+        self.default_reference_analysis_method = "batched"
         self.reference_guardrail_text = (
             "Blend reference guidance without repeating yourself. Do not mention source image dimensions, aspect ratios, "
             "or pixel resolutions under any circumstance."
@@ -430,13 +454,17 @@ class TextToImagePromptEnhancer:
                 "llm_backend": ([
                     "lm_studio",
                     "ollama",
-                    "qwen3_vl"
+                    "openai_compat",
+                    "qwen3_vl",
+                    "none"
                 ], {
                     "default": "lm_studio",
                     "tooltip": (
                         "lm_studio: Uses currently loaded model in LM Studio\n"
                         "ollama: Uses currently loaded model in Ollama\n"
-                        "qwen3_vl: Auto-detects local Qwen3-VL model (no API server needed)"
+                        "openai_compat: Any OpenAI-compatible server (vLLM, llama.cpp server, TGI)\n"
+                        "qwen3_vl: Auto-detects local Qwen3-VL model (no API server needed)\n"
+                        "none: No model - fast deterministic expansion from settings and phrase banks"
                     )
                 }),
                 
@@ -649,6 +677,14 @@ class TextToImagePromptEnhancer:
                     "multiline": True,
                     "placeholder": "Optional external caption for Reference 2"
                 }),
+                "vision_pass": (VISION_PASS_OPTIONS, {
+                    "default": "auto",
+                    "tooltip": (
+                        "auto: when vision_backend inherits a main LLM that reads images, attach the reference images to the "
+                        "expansion request and take vision_caption from its reply (no separate caption calls)\n"
+                        "two_pass: caption each reference first, then expand"
+                    )
+                }),
             }
         }
     
@@ -685,6 +721,7 @@ class TextToImagePromptEnhancer:
         except Exception:
             return float(time.time())
 
+    @traced_node("text_to_image")
     def enhance_prompt(
         self,
         text_prompt: str,
@@ -719,7 +756,8 @@ class TextToImagePromptEnhancer:
         reference_image_1: Optional[torch.Tensor] = None,
         reference_image_2: Optional[torch.Tensor] = None,
         reference_caption_override_1: str = "",
-        reference_caption_override_2: str = ""
+        reference_caption_override_2: str = "",
+        vision_pass: str = "auto"
     ) -> Tuple[str, str, str, str]:
         """Main processing function"""
         try:
@@ -737,8 +775,8 @@ class TextToImagePromptEnhancer:
         np.random.seed(seed_value % (2**32))
 
         try:
-            # STEP 0: Process alternations first (before LLM)
-            text_prompt = self._process_alternations(text_prompt)
+            # STEP 0: Process wildcards and alternations first (before LLM)
+            text_prompt, _ = expand_wildcards(text_prompt, seed=seed_value)
             
             # STEP 0.5: Protect emphasis syntax
             text_prompt = self._preserve_emphasis_syntax(text_prompt)
@@ -786,13 +824,18 @@ class TextToImagePromptEnhancer:
 
             reference_plan = self._prepare_reference_plan(directive_inputs)
 
-            # Initialize LLM backend (model_name auto-detected)
-            llm = LLMBackend(
+            # Initialize LLM backend (model_name auto-detected); the routing table
+            # may move the final expansion and each sub-task to other models
+            node_llm = LLMBackend(
                 backend_type=llm_backend,
                 endpoint=api_endpoint,
                 model_name=None,  # Auto-detect for all backends
                 temperature=temperature
             )
+            llm = node_llm.for_task("main_expand")
+            # llm_backend="none": no model calls anywhere, deterministic expansion instead
+            llm_disabled = llm.backend_type == "none"
+            reference_llm = None if llm_disabled else node_llm
 
             vision_backend_selection = (vision_backend or "inherit").strip().lower()
             if not vision_backend_selection:
@@ -808,11 +851,12 @@ class TextToImagePromptEnhancer:
             vision_init_warning: Optional[str] = None
 
             if vision_backend_selection in {"", "auto", "inherit"}:
-                if llm.supports_images():
-                    vision_llm = llm
+                caption_llm = node_llm.for_task("caption")
+                if caption_llm.supports_images():
+                    vision_llm = caption_llm
                     vision_backend_mode = "inherit"
                     vision_caption_enabled = True
-                    vision_model_used = getattr(llm, "model_name", "auto-detected")
+                    vision_model_used = getattr(caption_llm, "model_name", "auto-detected")
                 else:
                     vision_backend_mode = "disabled"
             elif vision_backend_selection == "disable":
@@ -824,8 +868,9 @@ class TextToImagePromptEnhancer:
                         backend_type=vision_backend_selection,
                         endpoint=vision_api_endpoint,
                         model_name=None,  # Auto-detect
-                        temperature=temperature
-                    )
+                        temperature=temperature,
+                        role="vision"
+                    ).for_task("caption")
                     if vision_llm.supports_images():
                         vision_backend_mode = vision_backend_selection
                         vision_caption_enabled = True
@@ -860,11 +905,32 @@ class TextToImagePromptEnhancer:
 
             analysis_backend_label = vision_backend_mode
             if analysis_backend_label == "inherit":
-                analysis_backend_label = f"inherit:{llm.backend_type}"
+                analysis_backend_label = f"inherit:{(vision_llm or llm).backend_type}"
 
             if not vision_caption_enabled:
                 vision_model_used = ""
 
+            # Single-pass: the main model reads the images with the expansion request
+            # and returns their captions, replacing the caption and directive calls
+            single_pass_labels: List[str] = []
+            single_pass_images: List[bytes] = []
+            # A caption route asks for captions from another model, i.e. two passes
+            if vision_backend_mode == "inherit" and route_for("caption") is None and single_pass_eligible(llm, vision_pass):
+                for entry in reference_images:
+                    if entry.get("tensor") is None or entry.get("caption_override"):
+                        continue
+                    image_bytes = self._image_png_bytes(entry["tensor"])
+                    if image_bytes:
+                        entry["single_pass"] = True
+                        single_pass_labels.append(entry.get("label", "Reference"))
+                        single_pass_images.append(image_bytes)
+            if single_pass_images:
+                reference_llm = None
+                print(
+                    f"[Text-to-Image] Single-pass vision: {len(single_pass_images)} reference image(s) "
+                    f"attached to the {llm.backend_type} expansion request"
+                )
+
             reference_warnings: List[str] = []
             if vision_init_warning:
                 reference_warnings.append(vision_init_warning)
@@ -880,14 +946,17 @@ class TextToImagePromptEnhancer:
                     label = entry.get("label", "Reference")
                     tensor = entry.get("tensor")
                     override_caption = entry.get("caption_override")
+                    single_pass = bool(entry.get("single_pass"))
                     analysis = self._analyze_reference_image(
                         tensor,
                         label,
-                        vision_llm=vision_llm if vision_caption_enabled and vision_llm is not None else None,
+                        vision_llm=(
+                            vision_llm if vision_caption_enabled and vision_llm is not None and not single_pass else None
+                        ),
                         override_caption=override_caption,
                         qwen_config=vision_qwen_config if vision_backend_mode == "qwen3_vl" else None,
                         vision_temperature=temperature,
-                        vision_backend=analysis_backend_label,
+                        vision_backend=f"single_pass:{llm.backend_type}" if single_pass else analysis_backend_label,
                         vision_model=vision_model_used
                     )
                     if override_caption:
@@ -938,17 +1007,32 @@ class TextToImagePromptEnhancer:
             reference_meta = {}
             
             try:
-                directive_analyses, directive_meta = self._run_reference_directive_analysis(
-                    image_analyses,
-                    reference_plan,
-                    llm
-                )
+                directive_llm = reference_llm.for_task("directive_analysis") if reference_llm and image_analyses else None
+                refine_llm = reference_llm.for_task("refine") if reference_llm and image_analyses else None
+                # One combined request for every reference; per-reference calls if it fails
+                batched = None
+                if self.default_reference_analysis_method == "batched" and image_analyses:
+                    batched = self._synthesize_reference_directives(image_analyses, reference_plan, directive_llm)
+                if not image_analyses:
+                    # Nothing to synthesize: skip both timed paths so no empty "directives" stage is recorded
+                    batched_guidance = None
+                    directive_analyses, directive_meta = [], self._empty_directive_meta()
+                elif batched is not None:
+                    directive_analyses, directive_meta, batched_guidance = batched
+                else:
+                    batched_guidance = None
+                    directive_analyses, directive_meta = self._run_reference_directive_analysis(
+                        image_analyses,
+                        reference_plan,
+                        directive_llm
+                    )
 
                 reference_guidance, reference_notes, guidance_meta = self._build_reference_guidance(
                     directive_analyses,
                     reference_plan,
-                    llm,
-                    prompt_context
+                    refine_llm,
+                    prompt_context,
+                    batched_guidance=batched_guidance
                 )
                 reference_meta = self._merge_reference_metadata(reference_plan, directive_meta, guidance_meta)
             except Exception as ref_exc:
@@ -1019,6 +1103,12 @@ class TextToImagePromptEnhancer:
                 text_prompt,
                 resolved_settings.get("creative_randomness", "off")
             )
+            if creative_brainstorm and not llm_disabled and route_for("brainstorm"):
+                creative_brainstorm = self._brainstorm_with_llm(
+                    node_llm.for_task("brainstorm"),
+                    text_prompt,
+                    creative_brainstorm
+                )
             
             system_prompt = self._build_system_prompt(
                 target_platform,
@@ -1037,6 +1127,8 @@ class TextToImagePromptEnhancer:
                 creative_brainstorm,
                 reference_caption_payload
             )
+            if single_pass_images:
+                user_prompt += "\n\n" + caption_instructions(single_pass_labels)
             
             # STEP 4: Prepare keyword overrides and call LLM
             pos_kw_list = parse_keywords(positive_keywords)
@@ -1057,15 +1149,31 @@ class TextToImagePromptEnhancer:
                 "temperature": temperature
             }
 
-            response, llm_used, llm_attempts = self._call_main_llm_with_retries(
-                llm,
-                system_prompt,
-                user_prompt,
-                capped_tokens,
-                backend_params
-            )
-            llm = llm_used
+            deterministic_meta: Optional[Dict[str, Any]] = None
+            stop_settings = get_stop_settings(target_platform)
+            if llm_disabled:
+                response, llm_attempts = {"success": False, "response": "", "error": ""}, []
+            else:
+                response, llm_used, llm_attempts = self._call_main_llm_with_retries(
+                    llm,
+                    system_prompt,
+                    user_prompt,
+                    capped_tokens,
+                    backend_params,
+                    single_pass_stop_settings(stop_settings, len(single_pass_images)) if single_pass_images else stop_settings,
+                    images=single_pass_images
+                )
+                llm = llm_used
             raw_llm_output = response.get("response", "")
+            if single_pass_images:
+                self._apply_single_pass_captions(
+                    response,
+                    single_pass_labels,
+                    image_analyses,
+                    reference_meta,
+                    reference_warnings,
+                    stop_settings
+                )
             llm_error_message = response.get("error", "")
             main_llm_success = bool(response.get("success")) and bool((raw_llm_output or "").strip())
 
@@ -1073,8 +1181,19 @@ class TextToImagePromptEnhancer:
             fallback_used = False
 
             # STEP 5: Parse and format response (fallback on failure)
-            if main_llm_success:
-                enhanced_prompt = self._parse_llm_response(raw_llm_output, target_platform)
+            # Guidance notes carry directive instructions; no-LLM prompts use the analyses themselves
+            prompt_reference_notes = analysis_to_phrases(image_analyses) if llm_disabled else reference_notes
+            if llm_disabled:
+                enhanced_prompt, deterministic_meta = self.deterministic.expand_image(
+                    text_prompt,
+                    target_platform,
+                    platform_config,
+                    resolved_settings,
+                    prompt_reference_notes,
+                    seed=seed_value
+                )
+            elif main_llm_success:
+                enhanced_prompt = self._parse_llm_response(response.get("prompt_section", raw_llm_output), target_platform)
                 print(f"[Text-to-Image] LLM successfully enhanced prompt (length: {len(enhanced_prompt)} chars)")
             else:
                 enhanced_prompt, fallback_meta = self._build_deterministic_fallback_prompt(
@@ -1104,7 +1223,7 @@ class TextToImagePromptEnhancer:
                 enhanced_prompt,
                 target_platform,
                 platform_config,
-                reference_notes,
+                prompt_reference_notes,
                 resolved_settings
             )
 
@@ -1115,6 +1234,14 @@ class TextToImagePromptEnhancer:
                 )
             else:
                 density_meta = None
+
+            # STEP 7.6: Fit CLIP-tokenized platforms to their real token budget
+            enhanced_prompt, clip_budget_meta = fit_clip_token_budget(enhanced_prompt, target_platform)
+            if clip_budget_meta:
+                print(
+                    f"[Text-to-Image] ℹ️ CLIP tokens {clip_budget_meta['tokens_before']}→{clip_budget_meta['tokens_after']} "
+                    f"(budget {clip_budget_meta['budget']}, {len(clip_budget_meta['dropped_phrases'])} phrase(s) dropped)."
+                )
             
             # STEP 8: Generate negative prompt
             negative_prompt = get_negative_prompt_for_platform(target_platform, neg_kw_list)
@@ -1134,7 +1261,9 @@ class TextToImagePromptEnhancer:
                 "max_tokens_used": capped_tokens,
                 "fallback_used": fallback_used,
                 "fallback_meta": fallback_meta,
+                "deterministic_meta": deterministic_meta,
                 "density_meta": density_meta,
+                "clip_budget_meta": clip_budget_meta,
                 "quality_emphasis": quality_emphasis,
                 "reference_guidance_used": bool(reference_guidance.strip()) if reference_guidance else False,
                 "reference_directives": reference_plan,
@@ -1150,6 +1279,7 @@ class TextToImagePromptEnhancer:
                     "resolved_backend": vision_backend_mode,
                     "resolved_model": vision_model_used,
                     "caption_enabled": vision_caption_enabled,
+                    "single_pass_images": len(single_pass_images),
                 }
             }
             
@@ -1180,6 +1310,7 @@ class TextToImagePromptEnhancer:
                     "vision_backend_resolved": vision_backend_mode,
                     "vision_model_used": vision_model_used,
                     "vision_caption_enabled": vision_caption_enabled,
+                    "vision_pass": "single_pass" if single_pass_images else "two_pass",
                     "system_prompt": system_prompt,
                     "user_prompt": user_prompt,
                     "raw_llm_output": raw_llm_output,
@@ -1196,7 +1327,9 @@ class TextToImagePromptEnhancer:
                     "llm_attempts": llm_attempts,
                     "fallback_used": fallback_used,
                     "fallback_meta": fallback_meta,
+                    "deterministic_meta": deterministic_meta,
                     "density_meta": density_meta,
+                    "clip_budget_meta": clip_budget_meta,
                     "random_seed_requested": requested_seed,
                     "random_seed_used": seed_value,
                     "random_seed_mode_requested": seed_mode_normalized,
@@ -1205,6 +1338,7 @@ class TextToImagePromptEnhancer:
 
                 if vision_qwen_config:
                     metadata["vision_backend_config"] = vision_qwen_config
+                metadata["timings"] = timing_metadata()
                 
                 save_result = save_prompts_to_file(
                     positive_prompt=enhanced_prompt,
@@ -1220,13 +1354,21 @@ class TextToImagePromptEnhancer:
                 file_status = "Not saved"
             
             llm_status_parts = []
-            if main_llm_success:
+            if deterministic_meta:
+                llm_status_parts.append(f"Main LLM: none (deterministic, {deterministic_meta['words']} words)")
+            elif main_llm_success:
                 llm_status_parts.append("Main LLM: responded")
             else:
                 error_snippet = (llm_error_message or "unknown error").splitlines()[0][:120]
                 error_snippet = error_snippet.replace('|', '/')
                 llm_status_parts.append(f"Main LLM: failed ({error_snippet})")
 
+            if single_pass_images:
+                caption_count = sum(1 for analysis in image_analyses if analysis.get("vision_caption_source") == "single_pass")
+                llm_status_parts.append(
+                    f"Vision: single-pass ({caption_count}/{len(single_pass_images)} caption(s) from the expansion)"
+                )
+
             if token_cap_note:
                 llm_status_parts.append(
                     f"Token cap {capped_tokens}/{max_tokens_requested}"
@@ -1247,6 +1389,11 @@ class TextToImagePromptEnhancer:
                     f"Density boost +{density_meta.get('added_phrases', 0)}"
                 )
 
+            if clip_budget_meta:
+                llm_status_parts.append(
+                    f"CLIP tokens {clip_budget_meta['tokens_before']}→{clip_budget_meta['tokens_after']}"
+                )
+
             ref_count = reference_meta.get("reference_count", 0)
             ref_method = reference_meta.get("analysis_method", "none")
             if ref_count:
@@ -1279,7 +1426,19 @@ class TextToImagePromptEnhancer:
 
             llm_status_parts.append(f"Seed: {seed_value} ({resolved_seed_mode})")
 
-            status_prefix = "✅" if main_llm_success else "⚠️"
+            breaker_note = llm.breaker_status()
+            if breaker_note:
+                llm_status_parts.append(breaker_note)
+            for residency_llm in (llm, vision_llm if vision_llm is not llm else None):
+                residency_note = residency_llm.residency_status() if residency_llm is not None else ""
+                if residency_note:
+                    llm_status_parts.append(residency_note)
+
+            timing_summary = timing_status()
+            if timing_summary:
+                llm_status_parts.append(timing_summary)
+
+            status_prefix = "✅" if main_llm_success or deterministic_meta else "⚠️"
             status = (
                 f"{status_prefix} Enhanced for {platform_config['name']} | "
                 + " | ".join(llm_status_parts)
@@ -1327,40 +1486,78 @@ class TextToImagePromptEnhancer:
             random.setstate(python_random_state)
             np.random.set_state(numpy_random_state)
     
+    def _image_png_bytes(self, image: torch.Tensor) -> Optional[bytes]:
+        """First image of a ComfyUI IMAGE batch as PNG bytes, or None if it cannot be encoded."""
+
+        try:
+            img_np = image.detach().cpu().numpy()
+            if img_np.ndim == 4:
+                img_np = img_np[0]
+            img_np = np.clip(img_np, 0.0, 1.0)
+            if img_np.shape[-1] < 3:
+                img_np = np.repeat(img_np[..., :1], 3, axis=-1)
+            buffer = io.BytesIO()
+            Image.fromarray((img_np[..., :3] * 255).astype(np.uint8)).save(buffer, format="PNG")
+            return buffer.getvalue()
+        except Exception as exc:
+            print(f"[Text-to-Image] ⚠️ Could not encode reference image: {exc}")
+            return None
+
+    def _apply_single_pass_captions(
+        self,
+        response: Dict[str, Any],
+        labels: List[str],
+        analyses: List[Dict[str, Any]],
+        reference_meta: Dict[str, Any],
+        warnings: List[str],
+        stop_settings: Dict[str, Any]
+    ) -> None:
+        """
+        Split a single-pass reply into its caption and prompt sections.
+
+        Captions are stored on the matching analyses (and in ``reference_meta``
+        for the vision_caption output); the prompt section is put in
+        ``response["prompt_section"]``. A reply without a prompt marks the
+        response failed so the deterministic fallback applies.
+        """
+
+        if not (response.get("success") and (response.get("response") or "").strip()):
+            SINGLE_PASS_REQUESTS.inc(node="text_to_image", outcome="failed")
+            return
+
+        captions, prompt_section = split_response(response["response"], len(labels), stop_settings)
+        by_label = dict(zip(labels, captions))
+        for analysis in analyses:
+            label = analysis.get("label")
+            if label not in by_label:
+                continue
+            if by_label[label]:
+                analysis["vision_caption"] = by_label[label]
+                analysis["vision_caption_source"] = "single_pass"
+            else:
+                warnings.append(f"{label}: single-pass reply had no caption for this image.")
+
+        reference_meta["vision_captions"] = [
+            analysis["vision_caption"] for analysis in analyses if analysis.get("vision_caption")
+        ]
+        if any(captions):
+            reference_meta["vision_caption_sources"] = sorted(
+                set(reference_meta.get("vision_caption_sources") or []) | {"single_pass"}
+            )
+        SINGLE_PASS_REQUESTS.inc(node="text_to_image", outcome="captioned" if all(captions) else "no_caption")
+
+        if prompt_section:
+            response["prompt_section"] = prompt_section
+        else:
+            response["success"] = False
+            response["error"] = "Single-pass reply contained captions but no prompt section"
+
     def _get_simple_image_description(self, image: torch.Tensor, label: str) -> str:
         """Backward-compatible helper returning the concise summary of an image analysis."""
 
         analysis = self._analyze_reference_image(image, label)
         return str(analysis.get("summary", f"{label}: [Image provided as reference]"))
     
-    def _process_alternations(self, text: str) -> str:
-        """
-        Process alternation syntax {option1|option2|option3}
-        Replaces with randomly chosen option
-        """
-        import re
-        
-        # Pattern to match {option1|option2|option3}
-        pattern = r'\{([^{}]+)\}'
-        
-        def replace_alternation(match):
-            options = match.group(1).split('|')
-            # Strip whitespace from each option
-            options = [opt.strip() for opt in options]
-            return random.choice(options)
-        
-        # Keep replacing until no more alternations found (handles nested cases)
-        max_iterations = 10  # Prevent infinite loops
-        iteration = 0
-        while '{' in text and '|' in text and iteration < max_iterations:
-            new_text = re.sub(pattern, replace_alternation, text)
-            if new_text == text:  # No more changes
-                break
-            text = new_text
-            iteration += 1
-        
-        return text
-    
     def _preserve_emphasis_syntax(self, text: str) -> str:
         """
         Protect emphasis syntax (keyword:1.5) from being modified
@@ -1651,6 +1848,7 @@ class TextToImagePromptEnhancer:
             return "moderate"
         return "subtle"
 
+    @timed_stage("vision")
     def _analyze_reference_image(
         self,
         image: Optional[torch.Tensor],
@@ -1805,7 +2003,8 @@ class TextToImagePromptEnhancer:
                         image_bytes=image_bytes,
                         label=label,
                         prompt=caption_prompt,
-                        max_tokens=480
+                        max_tokens=480,
+                        **get_stop_settings()
                     )
                     log_entry = caption_result.get("log_entry") if isinstance(caption_result, dict) else None
                     if log_entry:
@@ -2150,6 +2349,15 @@ class TextToImagePromptEnhancer:
             return f"{summary} Focus: {focus}."
         return summary
 
+    def _report_prompt_savings(self, call: str, stats: Dict[str, Any]) -> None:
+        """Log how many input tokens prompt de-duplication removed from one call."""
+
+        if stats.get("input_tokens_saved"):
+            print(
+                f"[Text-to-Image] {call} prompt: ~{stats['input_tokens']} tokens "
+                f"(saved ~{stats['input_tokens_saved']}, {stats['saved_ratio']:.0%})"
+            )
+
     def _conduct_directive_analysis_llm(
         self,
         llm: Optional[LLMBackend],
@@ -2194,37 +2402,25 @@ class TextToImagePromptEnhancer:
             " aspect ratios, or describing yourself. Do not use bullet points or numbering. Keep all critical subjects intact."
         )
 
-        lines: List[str] = [
-            f"Reference label: {label}",
-            f"Directive choice: {display}",
-            f"Directive intent: {directive_text}",
-            "",
-            "Baseline summary:",
-            cloned.get("summary", "")
-        ]
-
+        # The caption is stated once; summary, details and category cues refer to it
+        prompt = PromptAssembler()
+        prompt.define("caption", caption_text)
+        prompt.line(f"Reference label: {label}")
+        prompt.line(f"Directive choice: {display}")
+        prompt.line(f"Directive intent: {directive_text}")
+        prompt.section("Baseline summary:").line(cloned.get("summary", ""))
         if caption_text:
-            lines.append("")
-            lines.append("Full reference caption (canonical):")
-            lines.append(caption_text)
-
+            prompt.canonical("Full reference caption (canonical):", "caption")
         if details:
-            lines.append("")
-            lines.append("Additional analysis notes:")
-            lines.extend(f"- {detail}" for detail in details)
-
+            prompt.section("Additional analysis notes:").lines(details, prefix="- ")
         if note_lines:
-            lines.append("")
-            lines.append("Category cues:")
-            lines.extend(f"- {note}" for note in note_lines)
-
-        lines.append("")
-        lines.append("Focus request:")
-        lines.append(f"- {focus_text}")
-        lines.append("")
-        lines.append("Compose at most two sentences that satisfy the focus. Return plain text without headers.")
+            prompt.section("Category cues:").lines(note_lines, prefix="- ")
+        prompt.section("Focus request:").line(focus_text, prefix="- ")
+        prompt.section().line("Compose at most two sentences that satisfy the focus. Return plain text without headers.")
 
-        user_prompt = "\n".join(lines)
+        user_prompt = prompt.render()
+        prompt_stats = prompt.stats()
+        self._report_prompt_savings(f"{label} directive analysis", prompt_stats)
 
         log_entry = {
             "label": label,
@@ -2233,7 +2429,8 @@ class TextToImagePromptEnhancer:
             "system_prompt": system_prompt,
             "user_prompt": user_prompt,
             "raw_response": None,
-            "success": False
+            "success": False,
+            **prompt_stats
         }
 
         attempted = bool(llm)
@@ -2263,6 +2460,16 @@ class TextToImagePromptEnhancer:
         self._append_analysis_detail(cloned, fallback)
         return cloned, log_entry, attempted
 
+    def _empty_directive_meta(self) -> Dict[str, Any]:
+        return {
+            "phase": "directive_analysis",
+            "reference_count": 0,
+            "llm_queries": 0,
+            "llm_successes": 0,
+            "llm_logs": []
+        }
+
+    @timed_stage("directives")
     def _run_reference_directive_analysis(
         self,
         analyses: List[Dict[str, Any]],
@@ -2272,14 +2479,7 @@ class TextToImagePromptEnhancer:
         """Generate directive-driven summaries for each reference before prompt construction."""
 
         if not analyses:
-            empty_meta = {
-                "phase": "directive_analysis",
-                "reference_count": 0,
-                "llm_queries": 0,
-                "llm_successes": 0,
-                "llm_logs": []
-            }
-            return [], empty_meta
+            return [], self._empty_directive_meta()
 
         resolved_plan = self._align_reference_plan(analyses, plan)
         processed: List[Dict[str, Any]] = []
@@ -2320,18 +2520,179 @@ class TextToImagePromptEnhancer:
             "reference_count": len(processed),
             "llm_queries": llm_queries,
             "llm_successes": llm_successes,
-            "llm_logs": llm_logs
+            "llm_logs": llm_logs,
+            "input_tokens_saved": sum(log.get("input_tokens_saved", 0) for log in llm_logs)
         }
         return processed, meta
 
+    def _batched_reference_budget(self, reference_count: int) -> int:
+        """Output token cap for a combined directive request."""
+
+        return min(1200, 120 + 200 * reference_count)
+
+    def _parse_batched_reference_response(self, raw: str, reference_count: int) -> Optional[Dict[int, Dict[str, str]]]:
+        """Split a combined response into per-reference focus/guidance; None if any reference is missing."""
+
+        sections: Dict[int, Dict[str, str]] = {}
+        current: Optional[Dict[str, str]] = None
+        field: Optional[str] = None
+        for line in (raw or "").splitlines():
+            stripped = line.strip().strip("*_").strip()
+            marker = _BATCH_MARKER_RE.match(stripped)
+            rest = marker.group(3).strip() if marker else ""
+            if marker and (marker.group(1) or not rest or _BATCH_FIELD_RE.match(rest)):
+                # "[R1]" takes trailing text; bare "R1:" / "Reference 1:" only a field such as "FOCUS: ..."
+                number = int(marker.group(1) or marker.group(2))
+                current = sections.setdefault(number, {"focus": "", "guidance": ""})
+                field = None
+                stripped = rest
+            if current is None or not stripped:
+                continue
+            tagged = _BATCH_FIELD_RE.match(stripped)
+            if tagged:
+                field = tagged.group(1).lower()
+                current[field] = tagged.group(2).strip().strip("*_").strip()
+            elif field:
+                current[field] = f"{current[field]} {stripped}".strip()
+
+        parsed: Dict[int, Dict[str, str]] = {}
+        for number in range(1, reference_count + 1):
+            section = sections.get(number)
+            if not section or not section.get("guidance"):
+                return None
+            parsed[number - 1] = {
+                "focus": section.get("focus") or section["guidance"],
+                "guidance": section["guidance"]
+            }
+        return parsed
+
+    @timed_stage("directives")
+    def _synthesize_reference_directives(
+        self,
+        analyses: List[Dict[str, Any]],
+        plan: List[Dict[str, Any]],
+        llm: Optional[LLMBackend]
+    ) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[int, str]]]:
+        """Produce directive focus and guidance for every reference in a single LLM call.
+
+        Returns (analyses, directive meta, guidance lines by reference index), or
+        None when the call fails or a reference is missing from the response so
+        the caller can fall back to the per-reference path.
+        """
+
+        if not analyses or not llm:
+            return None
+
+        resolved_plan = self._align_reference_plan(analyses, plan)
+        llm_logs: List[Dict[str, Any]] = []
+        llm_queries = 0
+        llm_successes = 0
+        for analysis in analyses:
+            for pre_log in analysis.get("llm_logs") or []:
+                llm_logs.append(pre_log)
+                if pre_log.get("attempted") not in (False, None):
+                    llm_queries += 1
+                    if pre_log.get("success"):
+                        llm_successes += 1
+
+        system_prompt = (
+            "You turn reference image captions into guidance for a prompt engineer. For every reference, write a FOCUS"
+            " line (up to two sentences on the traits the directive asks for) and a GUIDANCE line (up to two sentences on"
+            " how the final prompt should use them). Do not mention pixel dimensions, resolutions, or aspect ratios."
+            " Do not repeat sentences across references. Keep all critical subjects intact."
+        )
+
+        lines: List[str] = []
+        for index, (analysis, entry) in enumerate(zip(analyses, resolved_plan), start=1):
+            config = entry.get("config", {}) or {}
+            label = entry.get("label") or analysis.get("label", f"Reference {index}")
+            directive_text = config.get("llm_instruction") or config.get("user_guidance") or "Follow the directive."
+            focus_text = config.get("analysis_focus") or "Highlight the most useful traits from this reference."
+            lines.append(f"[R{index}] {label} — directive: {entry.get('display', 'Auto')}")
+            lines.append(f"Directive intent: {directive_text}")
+            lines.append(f"Focus request: {focus_text}")
+            avoid = [
+                self.reference_usage_labels.get(category, category.replace('_', ' '))
+                for category in config.get("exclude_categories", []) or []
+            ]
+            if avoid:
+                lines.append("Do not copy: " + ", ".join(avoid))
+            caption_text = (analysis.get("vision_caption") or "").strip()
+            if caption_text:
+                lines.append(f"Caption: {caption_text}")
+            else:
+                lines.append(f"Summary: {analysis.get('summary', '')}")
+            lines.append("")
+
+        lines.append("Answer in exactly this format, one block per reference, nothing else:")
+        for index in range(1, len(analyses) + 1):
+            lines.append(f"[R{index}]")
+            lines.append("FOCUS: ...")
+            lines.append("GUIDANCE: ...")
+        user_prompt = "\n".join(lines)
+
+        log_entry = {
+            "label": ", ".join(entry.get("label", "Reference") for entry in resolved_plan),
+            "directive": ", ".join(str(entry.get("display")) for entry in resolved_plan),
+            "mode": "batched",
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "raw_response": None,
+            "success": False
+        }
+
+        parsed: Optional[Dict[int, Dict[str, str]]] = None
+        try:
+            response = llm.send_prompt(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                max_tokens=self._batched_reference_budget(len(analyses))
+            )
+            raw = (response.get("response") or "").strip()
+            log_entry["raw_response"] = raw or None
+            if response.get("success") and raw:
+                parsed = self._parse_batched_reference_response(raw, len(analyses))
+        except Exception as exc:
+            print(f"Batched reference synthesis failed: {exc}")
+
+        if parsed is None:
+            print("[Text-to-Image] Batched reference synthesis unusable; falling back to per-reference calls")
+            return None
+
+        log_entry["success"] = True
+        llm_logs.append(log_entry)
+        processed: List[Dict[str, Any]] = []
+        guidance: Dict[int, str] = {}
+        for index, analysis in enumerate(analyses):
+            cloned = self._clone_analysis_payload(analysis)
+            cloned["directive_analysis"] = parsed[index]["focus"]
+            self._append_analysis_detail(cloned, parsed[index]["focus"])
+            processed.append(cloned)
+            guidance[index] = parsed[index]["guidance"]
+
+        meta = {
+            "phase": "directive_analysis",
+            "reference_count": len(processed),
+            "llm_queries": llm_queries + 1,
+            "llm_successes": llm_successes + 1,
+            "llm_logs": llm_logs
+        }
+        return processed, meta, guidance
+
+    @timed_stage("guidance")
     def _build_reference_guidance(
         self,
         analyses: List[Dict[str, Any]],
         plan: List[Dict[str, Any]],
         llm: LLMBackend,
-        prompt_context: str
+        prompt_context: str,
+        batched_guidance: Optional[Dict[int, str]] = None
     ) -> Tuple[str, List[str], Dict[str, Any]]:
-        """Generate textual guidance for using reference images and capture LLM usage stats."""
+        """Generate textual guidance for using reference images and capture LLM usage stats.
+
+        ``batched_guidance`` holds per-reference lines already produced by
+        :meth:`_synthesize_reference_directives`; no further LLM calls are made.
+        """
 
         if not analyses:
             return "", [], {
@@ -2348,9 +2709,11 @@ class TextToImagePromptEnhancer:
         resolved_plan = self._align_reference_plan(analyses, plan)
 
         method = self.default_reference_analysis_method or "sequential_refine"
-        if method not in {"single_pass", "sequential_refine"}:
+        if batched_guidance is not None:
+            method = "batched"
+        elif method not in {"single_pass", "sequential_refine"}:
             method = "sequential_refine"
-        if not llm:
+        if not llm and batched_guidance is None:
             method = "single_pass"
 
         guidance_lines: List[str] = [
@@ -2370,7 +2733,7 @@ class TextToImagePromptEnhancer:
         vision_captions: List[str] = []
         vision_caption_errors: List[str] = []
 
-        for analysis, entry in zip(analyses, resolved_plan):
+        for index, (analysis, entry) in enumerate(zip(analyses, resolved_plan)):
             note_label = entry.get('label', analysis.get('label', 'Reference'))
             note_display = entry.get('display', 'Auto')
             focus_lines = self._normalize_focus_lines(analysis.get("directive_analysis"))
@@ -2380,7 +2743,18 @@ class TextToImagePromptEnhancer:
                 focus_block.append(focus_header)
                 focus_block.extend(f"- {line}" for line in focus_lines)
 
-            if method == "sequential_refine":
+            if method == "batched":
+                refined = "- " + batched_guidance[index]
+                log_entry = {
+                    "label": note_label,
+                    "directive": entry.get("display"),
+                    "mode": "batched",
+                    "system_prompt": None,
+                    "user_prompt": None,
+                    "raw_response": batched_guidance[index],
+                    "success": True
+                }
+            elif method == "sequential_refine":
                 refined, success, log_entry = self._refine_reference_with_llm(llm, analysis, entry, previous_guidance)
                 llm_queries += 1
                 if success:
@@ -2447,6 +2821,7 @@ class TextToImagePromptEnhancer:
             "directive_labels": [entry.get("display") for entry in resolved_plan],
             "directives": [entry.get("directive_key") for entry in resolved_plan],
             "llm_logs": reference_logs,
+            "input_tokens_saved": sum(log.get("input_tokens_saved", 0) for log in reference_logs),
             "vision_captions": vision_captions,
             "vision_caption_errors": vision_caption_errors
         }
@@ -2490,6 +2865,7 @@ class TextToImagePromptEnhancer:
             "directive_labels": directive_labels,
             "directives": directives,
             "llm_logs": combined_logs,
+            "input_tokens_saved": directive_meta.get("input_tokens_saved", 0) + guidance_meta.get("input_tokens_saved", 0),
             "analysis_phase": directive_meta,
             "guidance_phase": guidance_meta,
             "vision_captions": guidance_meta.get("vision_captions", []),
@@ -2615,39 +2991,40 @@ class TextToImagePromptEnhancer:
             "Do not mention pixel dimensions, resolutions, or aspect ratios. Avoid repeating phrases verbatim."
         )
 
-        lines: List[str] = [
-            f"Reference label: {analysis.get('label', 'Reference')}",
-            f"Directive: {directive_text}",
-            f"Summary: {analysis.get('summary', '')}"
-        ]
+        label = analysis.get('label', 'Reference')
+        prompt = PromptAssembler()
+        prompt.define("caption", analysis.get("vision_caption"))
+        prompt.line(f"Reference label: {label}")
+        prompt.line(f"Directive: {directive_text}")
+        prompt.line(f"Summary: {analysis.get('summary', '')}")
+        prompt.canonical("Reference caption:", "caption")
 
         if emphasis_lines:
-            lines.append("Focus cues:")
-            lines.extend(f"- {cue}" for cue in emphasis_lines)
+            prompt.section("Focus cues:").lines(emphasis_lines, prefix="- ")
 
         if avoid_lines:
-            lines.append("Avoid copying:")
-            lines.extend(f"- {cue}" for cue in avoid_lines)
+            prompt.section("Avoid copying:").lines(avoid_lines, prefix="- ")
 
         if detail_entries:
-            lines.append("Additional observations:")
-            lines.extend(f"- {str(detail)}" for detail in detail_entries)
+            prompt.section("Additional observations:").lines((str(detail) for detail in detail_entries), prefix="- ")
 
         if previous_guidance:
-            lines.append("Guidance already covered for earlier references:")
-            lines.append(previous_guidance.strip())
+            prompt.section("Guidance already covered for earlier references:").lines(previous_guidance.strip().splitlines())
 
-        lines.append("Write guidance that honors the directive without repeating earlier sentences.")
-        user_prompt = "\n".join(lines)
+        prompt.section().line("Write guidance that honors the directive without repeating earlier sentences.")
+        user_prompt = prompt.render()
+        prompt_stats = prompt.stats()
+        self._report_prompt_savings(f"{label} refinement", prompt_stats)
 
         log_entry = {
-            "label": analysis.get("label", "Reference"),
+            "label": label,
             "directive": entry.get("display"),
             "mode": "sequential_refine",
             "system_prompt": system_prompt,
             "user_prompt": user_prompt,
             "raw_response": None,
-            "success": False
+            "success": False,
+            **prompt_stats
         }
 
         try:
@@ -2701,6 +3078,28 @@ class TextToImagePromptEnhancer:
 
         return None
 
+    def _brainstorm_with_llm(self, llm: LLMBackend, text_prompt: str, seed_idea: str) -> str:
+        """Let the brainstorm route rewrite the template idea; the template stays on failure."""
+
+        system_prompt = (
+            "You are a creative director. Reply with one or two sentences of concrete story direction "
+            "for an image prompt. No preamble, no lists."
+        )
+        user_prompt = (
+            f"Subject: {text_prompt}\n"
+            f"Starting idea: {seed_idea}\n"
+            "Rewrite the starting idea as a fresh, specific creative direction for this subject."
+        )
+        try:
+            response = llm.send_prompt(system_prompt=system_prompt, user_prompt=user_prompt, max_tokens=120)
+        except Exception as exc:
+            print(f"[Text-to-Image] ⚠️ Brainstorm LLM failed: {exc}")
+            return seed_idea
+        text = (response.get("response") or "").strip()
+        if not response.get("success") or not text:
+            return seed_idea
+        return f"Creative prompt idea: {text}"
+
     def _determine_max_tokens(
         self,
         platform_config: Dict,
@@ -2746,7 +3145,7 @@ class TextToImagePromptEnhancer:
 
         if backend_lower == "qwen3_vl":
             apply_cap(512, "Capped max tokens to 512 for local Qwen3-VL stability.")
-        elif backend_lower in {"lm_studio", "ollama"}:
+        elif backend_lower in {"lm_studio", "ollama", "openai_compat"}:
             small_signals = ["1.5b", "2b", "3b", "4b", "tiny", "mini", "phi-2", "phi-3", "phi3", "smol"]
             medium_signals = ["5b", "6b", "7b", "8b"]
             if any(sig in model_lower for sig in small_signals):
@@ -2759,15 +3158,23 @@ class TextToImagePromptEnhancer:
 
         return adjusted, cap_reason
 
+    @timed_stage("main_llm")
     def _call_main_llm_with_retries(
         self,
         llm: LLMBackend,
         system_prompt: str,
         user_prompt: str,
         max_tokens: int,
-        backend_params: Dict[str, Any]
+        backend_params: Dict[str, Any],
+        stop_settings: Optional[Dict[str, Any]] = None,
+        images: Optional[List[bytes]] = None
     ) -> Tuple[Dict[str, Any], LLMBackend, List[Dict[str, Any]]]:
-        """Send prompt with limited retries and adaptive token ceilings."""
+        """
+        Send prompt with limited retries and adaptive token ceilings.
+
+        With a multi-endpoint pool each retry avoids the hosts already tried;
+        with a single endpoint the backend is rebuilt to re-detect the model.
+        """
 
         attempt_tokens: List[int] = [int(max_tokens)]
         fallback_candidates = [max(240, min(max_tokens, 640)), 320]
@@ -2786,16 +3193,25 @@ class TextToImagePromptEnhancer:
         current_llm = llm
         last_response: Dict[str, Any] = {"success": False, "response": "", "error": "No attempt"}
 
+        tried_endpoints: List[str] = []
+
         for attempt_index, tokens in enumerate(ordered_tokens):
+            if attempt_index:
+                LLM_RETRIES.inc(backend=current_llm.backend_type)
             response = current_llm.send_prompt(
                 system_prompt=system_prompt,
                 user_prompt=user_prompt,
-                max_tokens=tokens
+                max_tokens=tokens,
+                exclude=tried_endpoints,
+                images=images or (),
+                **(stop_settings or {})
             )
+            tried_endpoints.append(current_llm.endpoint)
             last_response = response
             attempt_info = {
                 "attempt": attempt_index + 1,
                 "backend": current_llm.backend_type,
+                "endpoint": current_llm.endpoint,
                 "model": getattr(current_llm, "model_name", None),
                 "max_tokens": tokens,
                 "success": bool(response.get("success")),
@@ -2808,14 +3224,22 @@ class TextToImagePromptEnhancer:
                 attempt_info["used"] = True
                 return response, current_llm, attempts_log
 
-            if attempt_index < len(ordered_tokens) - 1:
+            if not current_llm.available():
+                # Every endpoint's breaker is open: skip the remaining attempts
+                attempt_info["circuit_open"] = True
+                print(f"[Text-to-Image] {current_llm.breaker_status()} - skipping retries")
+                break
+
+            if attempt_index < len(ordered_tokens) - 1 and current_llm.pool_size > 1:
+                print(f"[Text-to-Image] Attempt {attempt_index + 1} failed on {current_llm.endpoint}, failing over")
+            elif attempt_index < len(ordered_tokens) - 1:
                 try:
                     current_llm = LLMBackend(
                         backend_type=backend_params["backend_type"],
                         endpoint=backend_params["endpoint"],
                         model_name=None,
                         temperature=backend_params["temperature"]
-                    )
+                    ).for_task("main_expand")
                 except Exception as exc:
                     attempts_log.append({
                         "attempt": attempt_index + 1,
@@ -2832,33 +3256,7 @@ class TextToImagePromptEnhancer:
     def _settings_to_phrases(self, settings: Dict[str, str]) -> List[str]:
         """Convert resolved settings into descriptive phrases for fallbacks."""
 
-        phrases: List[str] = []
-        mapping = {
-            "camera_angle": "shot from {value}",
-            "composition": "composition guided by {value}",
-            "lighting_source": "lit by {value}",
-            "lighting_quality": "lighting quality is {value}",
-            "time_of_day": "set during {value}",
-            "historical_period": "evokes the {value}",
-            "weather": "{value} conditions",
-            "color_mood": "{value} color palette",
-            "genre_style": "{value} tone",
-            "subject_framing": "{value} framing",
-            "subject_pose": "subject posed {value}"
-        }
-
-        for key, template in mapping.items():
-            value = settings.get(key)
-            if not value:
-                continue
-            lowered = value.lower()
-            if "auto" in lowered or "none" in lowered:
-                continue
-            phrase = template.format(value=value)
-            if phrase not in phrases:
-                phrases.append(phrase)
-
-        return phrases
+        return settings_to_phrases(settings)
 
     def _build_deterministic_fallback_prompt(
         self,
@@ -2974,94 +3372,26 @@ class TextToImagePromptEnhancer:
         reference_plan: List[Dict[str, Any]],
         prompt_context: str
     ) -> str:
-        """Build LLM system prompt with platform-specific instructions"""
-        quality_emphasis = bool(platform_config.get("quality_emphasis", True))
-        
-        platform_name = platform_config["name"]
-        platform = platform_config.get("prompt_style", "natural")
-        target_words = platform_config.get("max_words")
-        min_word_goal: Optional[int] = None
-        if isinstance(target_words, (int, float)) and target_words >= 60:
-            min_word_goal = max(80, int(target_words * 0.75))
-        
-        prompt = f"""You are an expert prompt engineer for {platform_name} image generation.
-
-CRITICAL OUTPUT RULES:
-1. Output ONLY the final prompt text - no labels, explanations, or meta-commentary
-2. Do NOT include phrases like "Here is...", "Prompt:", etc.
-3. Start directly with the image description
-4. Follow the platform-specific format precisely
-5. Never mention source image dimensions, aspect ratios, or pixel counts
-6. Keep the user's base prompt concept central; additions must support rather than replace it
-7. Treat every reference directive and focus note from the user message as mandatory content; weave them into the final prompt exactly once.
-
-TARGET PLATFORM: {platform_name}
-Description: {platform_config['description']}
-Prompting Style: {platform_config['prompt_style']}
-Optimal Length: {platform_config['optimal_length']}
+        """
+        Build LLM system prompt with platform-specific instructions
 
-"""
-        prompt += "\nOUTPUT INTENSITY GUIDANCE:\n"
-        if min_word_goal:
-            prompt += f"- Minimum acceptable length: {min_word_goal} words. Falling short counts as a failure.\n"
-        else:
-            prompt += "- Deliver a multi-sentence, richly layered description (no terse summaries).\n"
+        Everything that depends only on the platform comes first and is
+        byte-identical between runs, so llama.cpp-based servers (LM Studio,
+        Ollama) can reuse the cached prefix; per-run settings and reference
+        directives follow in the USER REQUIREMENTS section.
+        """
+        prompt = self._build_platform_instructions(platform_key, platform_config)
 
+        # Add user-specified settings
+        prompt += "\n=== USER REQUIREMENTS ===\n"
         if reference_plan:
             prompt += "- Dedicate vivid language to every reference directive so each image influences the result.\n"
             if len(reference_plan) > 1:
                 prompt += "- Keep reference-derived cues distinct; do not merge them into a single generic sentence.\n"
-
-        if platform_key == "pony":
-            prompt += (
-                "- Start with the score tags exactly once, then shift into flowing natural-language prose.\n"
-                "- After the score tags, produce an expansive narrative covering subject, wardrobe, environment, lighting, and atmosphere. Sparse checklists are unacceptable.\n"
-            )
-            if reference_plan:
+            if platform_key == "pony":
                 prompt += "- When references are provided, weave their traits into luxuriant supporting clauses for extra detail.\n"
-        prompt += "\n"
-        
-        # Add platform-specific preferences
-        if platform_config.get("preferences"):
-            prompt += "\nPLATFORM REQUIREMENTS:\n"
-            for pref in platform_config["preferences"]:
-                prompt += f"- {pref}\n"
-        
-        # Add quality tokens if enabled
-        if quality_emphasis and platform_config.get("quality_tokens"):
-            prompt += f"\nQUALITY TOKENS (use appropriately): {', '.join(platform_config['quality_tokens'][:8])}\n"
-        
-        # Add required tokens for specific platforms
-        if platform_config.get("required_positive"):
-            prompt += f"\nREQUIRED TOKENS (must include): {', '.join(platform_config['required_positive'])}\n"
-        
-        # Add things to avoid
-        if platform_config.get("avoid"):
-            prompt += "\nAVOID:\n"
-            for avoid in platform_config["avoid"]:
-                prompt += f"- {avoid}\n"
-        
-        # Add user-specified settings
-        prompt += "\n=== USER REQUIREMENTS ===\n"
         prompt += "Incorporate these settings into the prompt:\n\n"
-        
-        # Length and detail expectations (always max detail)
-        length_guidance = platform_config.get("length_guidance")
-        if length_guidance:
-            prompt += f"TARGET LENGTH: {length_guidance}\n"
 
-        detail_expectation = platform_config.get("detail_expectation")
-        if detail_expectation:
-            prompt += f"DETAIL EXPECTATION: {detail_expectation}\n"
-
-        max_words = platform_config.get("max_words")
-        if max_words:
-            floor_words = int(max_words * 0.6)
-            if min_word_goal and min_word_goal > floor_words:
-                floor_words = min_word_goal
-            prompt += f"ABSOLUTE MINIMUM DETAIL: deliver no fewer than {floor_words} words.\n\n"
-        else:
-            prompt += "Ensure the description is long-form and exhaustive.\n\n"
         # Handle genre/style if specified
         genre = settings.get("genre_style", "")
         if genre and "auto" not in genre.lower() and "none" not in genre.lower():
@@ -3124,12 +3454,6 @@ Optimal Length: {platform_config['optimal_length']}
             prompt += f"CREATIVE RANDOMNESS ({creativity.upper()}): {self.creative_randomness_modes[creativity]}\n"
             prompt += "Blend surprise elements while keeping the requested subject recognizable.\n\n"
 
-        # Base prompt reinforcement
-        prompt += "\nBASE PROMPT PRIORITY:\n"
-        prompt += "- The user's text prompt is the authoritative subject. Preserve its characters, actions, and tone.\n"
-        prompt += "- If creative randomness or references introduce new ideas, they must enhance (not replace) the base concept.\n"
-        prompt += "- Reference directives override conflicting improvisations; missing them counts as failing the task.\n"
-
         # Reference usage guidance
         if reference_plan:
             prompt += "REFERENCE IMAGE GUIDELINES:\n"
@@ -3157,7 +3481,95 @@ Optimal Length: {platform_config['optimal_length']}
             if value and "none" not in value.lower() and "auto" not in value.lower():
                 label = key.replace("_", " ").title()
                 prompt += f"- {label}: {value}\n"
+
+        prompt += "\nOutput ONLY the final image prompt text, starting now.\n"
+        return prompt
+
+    def _build_platform_instructions(self, platform_key: str, platform_config: Dict) -> str:
+        """Static (per-platform) part of the system prompt: the cacheable prefix."""
+        quality_emphasis = bool(platform_config.get("quality_emphasis", True))
+        
+        platform_name = platform_config["name"]
+        platform = platform_config.get("prompt_style", "natural")
+        target_words = platform_config.get("max_words")
+        min_word_goal: Optional[int] = None
+        if isinstance(target_words, (int, float)) and target_words >= 60:
+            min_word_goal = max(80, int(target_words * 0.75))
+        
+        prompt = f"""You are an expert prompt engineer for {platform_name} image generation.
+
+CRITICAL OUTPUT RULES:
+1. Output ONLY the final prompt text - no labels, explanations, or meta-commentary
+2. Do NOT include phrases like "Here is...", "Prompt:", etc.
+3. Start directly with the image description
+4. Follow the platform-specific format precisely
+5. Never mention source image dimensions, aspect ratios, or pixel counts
+6. Keep the user's base prompt concept central; additions must support rather than replace it
+7. Treat every reference directive and focus note from the user message as mandatory content; weave them into the final prompt exactly once.
+
+TARGET PLATFORM: {platform_name}
+Description: {platform_config['description']}
+Prompting Style: {platform_config['prompt_style']}
+Optimal Length: {platform_config['optimal_length']}
+
+"""
+        prompt += "\nOUTPUT INTENSITY GUIDANCE:\n"
+        if min_word_goal:
+            prompt += f"- Minimum acceptable length: {min_word_goal} words. Falling short counts as a failure.\n"
+        else:
+            prompt += "- Deliver a multi-sentence, richly layered description (no terse summaries).\n"
+
+        if platform_key == "pony":
+            prompt += (
+                "- Start with the score tags exactly once, then shift into flowing natural-language prose.\n"
+                "- After the score tags, produce an expansive narrative covering subject, wardrobe, environment, lighting, and atmosphere. Sparse checklists are unacceptable.\n"
+            )
+        prompt += "\n"
+        
+        # Add platform-specific preferences
+        if platform_config.get("preferences"):
+            prompt += "\nPLATFORM REQUIREMENTS:\n"
+            for pref in platform_config["preferences"]:
+                prompt += f"- {pref}\n"
+        
+        # Add quality tokens if enabled
+        if quality_emphasis and platform_config.get("quality_tokens"):
+            prompt += f"\nQUALITY TOKENS (use appropriately): {', '.join(platform_config['quality_tokens'][:8])}\n"
+        
+        # Add required tokens for specific platforms
+        if platform_config.get("required_positive"):
+            prompt += f"\nREQUIRED TOKENS (must include): {', '.join(platform_config['required_positive'])}\n"
         
+        # Add things to avoid
+        if platform_config.get("avoid"):
+            prompt += "\nAVOID:\n"
+            for avoid in platform_config["avoid"]:
+                prompt += f"- {avoid}\n"
+        
+        # Length and detail expectations (always max detail)
+        length_guidance = platform_config.get("length_guidance")
+        if length_guidance:
+            prompt += f"TARGET LENGTH: {length_guidance}\n"
+
+        detail_expectation = platform_config.get("detail_expectation")
+        if detail_expectation:
+            prompt += f"DETAIL EXPECTATION: {detail_expectation}\n"
+
+        max_words = platform_config.get("max_words")
+        if max_words:
+            floor_words = int(max_words * 0.6)
+            if min_word_goal and min_word_goal > floor_words:
+                floor_words = min_word_goal
+            prompt += f"ABSOLUTE MINIMUM DETAIL: deliver no fewer than {floor_words} words.\n\n"
+        else:
+            prompt += "Ensure the description is long-form and exhaustive.\n\n"
+
+        # Base prompt reinforcement
+        prompt += "\nBASE PROMPT PRIORITY:\n"
+        prompt += "- The user's text prompt is the authoritative subject. Preserve its characters, actions, and tone.\n"
+        prompt += "- If creative randomness or references introduce new ideas, they must enhance (not replace) the base concept.\n"
+        prompt += "- Reference directives override conflicting improvisations; missing them counts as failing the task.\n"
+
         # Platform-specific format instructions
         if "pony" in platform_name.lower():
             prompt += """
@@ -3555,8 +3967,15 @@ Example of WRONG output (DO NOT DO THIS):
             f"Optimal Length: {platform_config['optimal_length']}"
         ]
 
+        deterministic_meta: Optional[Dict[str, Any]] = context.get("deterministic_meta")
+
         lines.append("\nLLM CALL SUMMARY:")
-        if main_llm_success:
+        if deterministic_meta:
+            lines.append(
+                f"  - Main prompt LLM: none (deterministic {deterministic_meta['style']} expansion, "
+                f"{deterministic_meta['setting_phrases']} setting / {deterministic_meta['bank_phrases']} bank phrases)"
+            )
+        elif main_llm_success:
             lines.append("  - Main prompt LLM: responded")
         else:
             snippet = (main_llm_error or "unknown error").splitlines()[0][:120]
@@ -3571,6 +3990,8 @@ Example of WRONG output (DO NOT DO THIS):
                 lines.append(
                     f"  - Reference LLM: {ref_successes}/{ref_queries} responses ({analysis_method})"
                 )
+                if ref_meta.get("input_tokens_saved"):
+                    lines.append(f"  - Reference prompt de-duplication: ~{ref_meta['input_tokens_saved']} input tokens saved")
             else:
                 lines.append(f"  - Reference LLM: not invoked ({analysis_method})")
         else:
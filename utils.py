@@ -2,12 +2,15 @@
 Utility functions for file saving and text processing
 """
 
-import os
 import re
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
+from .prompt_archive import archive_record, get_archive
+from .prompt_index import attach_index
+from .telemetry import timed_stage
 
 
+@timed_stage("save")
 def save_prompts_to_file(
     positive_prompt: str,
     negative_prompt: str,
@@ -17,44 +20,39 @@ def save_prompts_to_file(
     output_dir: str = "output/video_prompts"
 ) -> Dict:
     """
-    Save prompts and metadata to a text file
+    Save prompts and metadata to the prompt archive
+    
+    The record is queued for the background archive writer (see
+    ``prompt_archive``) so the node does not wait for disk I/O; the writer
+    also adds it to the directory's full-text index (``prompt_index``). The legacy
+    per-run text file is written too when ``PROMPT_ENHANCER_TEXT_EXPORT`` is set.
     
     Args:
         positive_prompt: Enhanced positive prompt
         negative_prompt: Generated negative prompt
         breakdown: Structured breakdown
         metadata: Dict with generation metadata
-        filename_base: Base filename (will append timestamp)
-        output_dir: Directory to save to
+        filename_base: Base name stored with the record (used for text export)
+        output_dir: Directory whose ``archive/`` holds the segments
         
     Returns:
-        Dict with success status and filepath
+        Dict with success status, archive segment path and record id
     """
     try:
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_base = sanitize_filename(filename_base)
-        filename = f"{safe_base}_{timestamp}.txt"
-        filepath = os.path.join(output_dir, filename)
-        
-        # Format content
-        content = format_prompt_file(
+        attach_index(output_dir)
+        record = archive_record(
             positive_prompt,
             negative_prompt,
             breakdown,
-            metadata
+            metadata,
+            filename_base,
+            output_dir
         )
         
-        # Write to file
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
         return {
             "success": True,
-            "filepath": filepath,
+            "filepath": get_archive(output_dir).current_path,
+            "record_id": record["id"],
             "error": None
         }
     
@@ -62,6 +60,7 @@ def save_prompts_to_file(
         return {
             "success": False,
             "filepath": None,
+            "record_id": None,
             "error": f"File save error: {str(e)}"
         }
 
@@ -145,6 +144,26 @@ def format_prompt_file(
             separator
         ])
 
+    timings = metadata.get("timings")
+    if timings:
+        timing_lines = [f"Total: {timings.get('total_seconds', 0):.2f}s"]
+        for stage in timings.get("stages", []):
+            line = f"  {stage.get('stage')}: {stage.get('seconds', 0):.2f}s"
+            if stage.get("llm_calls"):
+                line += (
+                    f" | calls {stage['llm_calls']}"
+                    f" | tokens {stage.get('prompt_tokens', 0)}→{stage.get('completion_tokens', 0)}"
+                    f" | sent {stage.get('bytes_sent', 0)} B, received {stage.get('bytes_received', 0)} B"
+                )
+            timing_lines.append(line)
+        parts.extend([
+            "",
+            "TIMINGS (before save):",
+            *timing_lines,
+            "",
+            separator
+        ])
+
     # Detailed LLM instruction/response trace
     trace_lines: List[str] = []
 
@@ -0,0 +1,303 @@
+"""
+Near-duplicate detection for prompt variations (MinHash + LSH)
+
+Small local models asked for ``num_variations`` > 1 often return expansions
+that differ in a handful of words. Each output is reduced to a MinHash
+signature over word 3-shingles, whose slot-wise agreement estimates the
+Jaccard similarity of the shingle sets. Variations are compared with each
+other and, optionally, with recent outputs of the same node kept in an LSH
+index (banded signatures), so history lookups only score the few entries that
+share a band instead of the whole window.
+
+:func:`enforce_diversity` regenerates only the variations whose similarity to
+an earlier variation (or to history) exceeds the threshold; the caller's
+``regenerate`` callback perturbs the variation seed and temperature per
+attempt. The report it returns is written into the node's breakdown.
+
+Environment variables: ``PROMPT_ENHANCER_DIVERSITY_THRESHOLD`` (estimated
+Jaccard similarity above which a variation is regenerated, default 0.6,
+``off`` disables the check), ``PROMPT_ENHANCER_DIVERSITY_RETRIES``
+(regeneration attempts per variation, default 1) and
+``PROMPT_ENHANCER_DIVERSITY_HISTORY`` (recent outputs per node to compare
+against, default 0 = variations only).
+"""
+
+import hashlib
+import os
+import random
+import re
+import struct
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import REGISTRY
+
+
+THRESHOLD_ENV = "PROMPT_ENHANCER_DIVERSITY_THRESHOLD"
+RETRIES_ENV = "PROMPT_ENHANCER_DIVERSITY_RETRIES"
+HISTORY_ENV = "PROMPT_ENHANCER_DIVERSITY_HISTORY"
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_RETRIES = 1
+SHINGLE_WORDS = 3
+NUM_PERM = 128
+# 32 bands x 4 rows: a pair at Jaccard 0.6 shares a band ~99% of the time
+LSH_BANDS = 32
+
+TEMPERATURE_STEP = 0.15
+MAX_TEMPERATURE = 1.5
+
+VARIATION_REGENERATIONS = REGISTRY.counter(
+    "prompt_enhancer_variation_regenerations_total",
+    "Variations regenerated because they were near-duplicates, by node and outcome.",
+    ("node", "outcome"),
+)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Fixed permutations so signatures are comparable across calls and processes
+_rng = random.Random(0x5EED)
+_PERMUTATIONS: List[Tuple[int, int]] = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)
+]
+
+
+def diversity_threshold() -> Optional[float]:
+    """Configured threshold, or None when the check is disabled."""
+
+    raw = os.environ.get(THRESHOLD_ENV, "").strip().lower()
+    if raw in ("off", "none", "false", "0"):
+        return None
+    try:
+        value = float(raw) if raw else DEFAULT_THRESHOLD
+    except ValueError:
+        value = DEFAULT_THRESHOLD
+    return min(1.0, max(0.0, value))
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.environ.get(name, "") or default))
+    except ValueError:
+        return default
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    """Lower-cased word ``size``-grams (the words themselves for very short text)."""
+
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature of ``text``'s shingles (``NUM_PERM`` 32-bit slots)."""
+
+    hashes = [
+        struct.unpack("<Q", hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest())[0]
+        for item in shingles(text)
+    ]
+    if not hashes:
+        return tuple([_MAX_HASH] * NUM_PERM)
+    return tuple(
+        min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimate_similarity(left: Sequence[int], right: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+
+    if not left or len(left) != len(right):
+        return 0.0
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class LSHIndex:
+    """Bounded window of recent signatures with banded LSH buckets."""
+
+    def __init__(self, capacity: int, bands: int = LSH_BANDS):
+        self.capacity = capacity
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._entries: "deque[Tuple[int, Tuple[int, ...]]]" = deque()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature: Sequence[int]):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, tuple(signature[start:start + self.rows])
+
+    def add(self, signature: Tuple[int, ...]) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries.append((entry_id, signature))
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.capacity:
+                old_id, old_signature = self._entries.popleft()
+                for key in self._band_keys(old_signature):
+                    bucket = self._buckets.get(key)
+                    if bucket is not None:
+                        bucket.discard(old_id)
+                        if not bucket:
+                            del self._buckets[key]
+
+    def best_match(self, signature: Sequence[int]) -> float:
+        """Highest estimated similarity to any entry sharing a band (0.0 if none)."""
+
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            if not candidates:
+                return 0.0
+            best = 0.0
+            for entry_id, other in self._entries:
+                if entry_id in candidates:
+                    best = max(best, estimate_similarity(signature, other))
+        return best
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_HISTORY: Dict[str, LSHIndex] = {}
+_HISTORY_LOCK = threading.Lock()
+
+
+def get_history(name: str) -> Optional[LSHIndex]:
+    """Process-wide recent-output index for one node, or None when history is off."""
+
+    capacity = _env_int(HISTORY_ENV, 0)
+    if capacity <= 0:
+        return None
+    with _HISTORY_LOCK:
+        index = _HISTORY.get(name)
+        if index is None or index.capacity != capacity:
+            index = LSHIndex(capacity)
+            _HISTORY[name] = index
+        return index
+
+
+def perturbed_temperature(base: float, attempt: int) -> float:
+    return round(min(MAX_TEMPERATURE, base + TEMPERATURE_STEP * attempt), 3)
+
+
+def _max_similarity(
+    index: int,
+    signatures: List[Tuple[int, ...]],
+    history: Optional[LSHIndex],
+) -> Tuple[float, Optional[str]]:
+    """Highest similarity of variation ``index`` to the earlier variations and history."""
+
+    best, source = 0.0, None
+    for other in range(index):
+        score = estimate_similarity(signatures[index], signatures[other])
+        if score > best:
+            best, source = score, f"variation {other + 1}"
+    if history is not None and len(history):
+        score = history.best_match(signatures[index])
+        if score > best:
+            best, source = score, "recent history"
+    return best, source
+
+
+def enforce_diversity(
+    texts: List[str],
+    regenerate: Callable[[int, int], Optional[str]],
+    history_name: Optional[str] = None,
+    threshold: Optional[float] = None,
+    max_attempts: Optional[int] = None,
+) -> Tuple[List[str], Dict]:
+    """
+    Regenerate the variations that are near-duplicates of an earlier one
+
+    Variation ``i`` is only compared with variations ``0..i-1`` (and history),
+    so the first of two similar outputs is kept and the later one retried.
+    ``regenerate(index, attempt)`` returns a new text or None (keep the
+    current one); it is called at most ``max_attempts`` times per variation.
+
+    Returns:
+        Tuple of (texts, report) where report has ``threshold``, per-variation
+        ``similarity`` / ``similar_to`` / ``attempts`` lists and ``regenerated``
+    """
+
+    threshold = diversity_threshold() if threshold is None else threshold
+    report = {
+        "threshold": threshold,
+        "similarity": [0.0] * len(texts),
+        "similar_to": [None] * len(texts),
+        "attempts": [0] * len(texts),
+        "regenerated": [],
+    }
+    if threshold is None or not texts:
+        return texts, report
+
+    attempts_allowed = _env_int(RETRIES_ENV, DEFAULT_RETRIES) if max_attempts is None else max_attempts
+    history = get_history(history_name) if history_name else None
+    texts = list(texts)
+    signatures = [minhash(text) for text in texts]
+
+    for index in range(len(texts)):
+        score, source = _max_similarity(index, signatures, history)
+        attempt = 0
+        while score > threshold and attempt < attempts_allowed:
+            attempt += 1
+            print(
+                f"[Diversity] Variation {index + 1} is {score:.0%} similar to {source}, "
+                f"regenerating (attempt {attempt}/{attempts_allowed})"
+            )
+            candidate = regenerate(index, attempt)
+            if not candidate:
+                break
+            candidate_signature = minhash(candidate)
+            previous = signatures[index]
+            signatures[index] = candidate_signature
+            candidate_score, candidate_source = _max_similarity(index, signatures, history)
+            if candidate_score < score:
+                texts[index] = candidate
+                score, source = candidate_score, candidate_source
+                if index not in report["regenerated"]:
+                    report["regenerated"].append(index)
+            else:
+                signatures[index] = previous
+        report["similarity"][index] = round(score, 3)
+        report["similar_to"][index] = source
+        report["attempts"][index] = attempt
+        if attempt:
+            outcome = "kept" if index not in report["regenerated"] else ("diverse" if score <= threshold else "improved")
+            VARIATION_REGENERATIONS.inc(node=history_name or "unknown", outcome=outcome)
+
+    if history is not None:
+        for signature in signatures:
+            history.add(signature)
+    return texts, report
+
+
+def format_diversity_report(report: Optional[Dict]) -> List[str]:
+    """Breakdown lines for an :func:`enforce_diversity` report."""
+
+    if not report or report.get("threshold") is None or not report.get("similarity"):
+        return []
+    if len(report["similarity"]) < 2 and not report["similar_to"][0]:
+        return []
+    lines = [f"\nVariation Diversity (MinHash Jaccard, regenerate above {report['threshold']:.2f}):"]
+    for index, score in enumerate(report["similarity"]):
+        source = report["similar_to"][index]
+        detail = f"max {score:.2f} vs {source}" if source else "unique"
+        if index in report["regenerated"]:
+            detail += f" (regenerated, {report['attempts'][index]} attempt(s))"
+        elif report["attempts"][index]:
+            detail += f" (kept after {report['attempts'][index]} attempt(s))"
+        lines.append(f"  - Variation {index + 1}: {detail}")
+    return lines
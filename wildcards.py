@@ -0,0 +1,850 @@
+"""
+Wildcard engine shared by every prompt node.
+
+Supported syntax:
+- ``{option1|option2|option3}``      - anonymous alternation
+- ``{category:option1|option2}``     - named inline wildcard
+- ``{category}``                     - built-in category or wildcard file
+- Options may nest: ``{a {red|blue} car|a {green|black} bike}``
+
+Templates are compiled once into a small tree (cached per template string)
+and rendered in a single pass, so long prompts with many wildcards no longer
+pay for repeated ``re.sub``/``str.replace`` scans. Every render draws from a
+private ``random.Random`` stream; the global ``random`` state is never touched.
+
+Wildcard files are plain ``.txt`` files (one option per line, ``#`` comments)
+placed in the package ``wildcards`` folder or in any directory listed in the
+``PROMPT_ENHANCER_WILDCARDS`` environment variable (``os.pathsep`` separated).
+``wildcards/hair/colors.txt`` is referenced as ``{hair/colors}``. Files are
+memory-mapped behind an on-disk line-offset index (see :class:`WildcardFile`)
+and picked up again automatically when they change.
+"""
+
+import hashlib
+import mmap
+import os
+import random
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence as SequenceABC
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .metrics import record_cache, register_cache_info
+
+
+BUILTIN_WILDCARDS: Dict[str, Tuple[str, ...]] = {
+    "animal": ("cat", "dog", "bird", "horse", "rabbit", "fox", "deer", "wolf"),
+    "person": ("man", "woman", "child", "elder", "teenager", "artist", "scientist"),
+    "profession": ("detective", "chef", "doctor", "teacher", "engineer", "musician", "artist"),
+    "instrument": ("piano", "guitar", "violin", "drums", "saxophone", "flute"),
+    "location": ("park", "studio", "street", "forest", "beach", "city", "room"),
+    "weather": ("sunny", "rainy", "snowy", "foggy", "stormy", "cloudy"),
+    "time": ("morning", "noon", "afternoon", "evening", "night", "midnight"),
+    "emotion": ("happy", "sad", "angry", "surprised", "calm", "excited", "pensive"),
+    "action": ("walking", "running", "dancing", "working", "playing", "creating"),
+    "color": ("red", "blue", "green", "yellow", "purple", "orange", "black", "white"),
+    "vehicle": ("car", "motorcycle", "bicycle", "truck", "bus", "train", "boat"),
+    "tool": ("hammer", "wrench", "paintbrush", "camera", "telescope", "microscope"),
+    "object": ("book", "ball", "box", "bottle", "phone", "computer", "chair"),
+}
+
+DEFAULT_WILDCARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wildcards")
+WILDCARD_PATH_ENV = "PROMPT_ENHANCER_WILDCARDS"
+INDEX_CACHE_DIR = os.environ.get(
+    "PROMPT_ENHANCER_WILDCARD_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "wildcard_index"),
+)
+
+# Seconds between directory rescans used to pick up edited/added wildcard files.
+RELOAD_CHECK_INTERVAL = 2.0
+
+# Wildcard file entries may themselves contain wildcards; cap the recursion so a
+# file that references itself cannot loop forever.
+MAX_NESTING_DEPTH = 8
+
+_NAME_PATTERN = r"[A-Za-z0-9_][\w \-/]*?"
+_NAMED_PREFIX_RE = re.compile(r"\s*(" + _NAME_PATTERN + r")\s*:")
+_REFERENCE_RE = re.compile(r"\s*(" + _NAME_PATTERN + r")\s*$")
+
+
+# ---------------------------------------------------------------------------
+# Compiled template tree
+# ---------------------------------------------------------------------------
+
+Node = Union[str, "Choice", "Reference"]
+
+
+@dataclass(frozen=True)
+class Choice:
+    """``{a|b}`` or ``{name:a|b}`` - pick one option sequence."""
+
+    name: Optional[str]
+    options: Tuple[Tuple[Node, ...], ...]
+
+
+@dataclass(frozen=True)
+class Reference:
+    """``{name}`` - resolved against a :class:`WildcardLibrary` at render time."""
+
+    name: str
+    raw: str
+
+
+class CompiledTemplate:
+    """A parsed wildcard template that can be rendered many times."""
+
+    __slots__ = ("source", "nodes", "is_static")
+
+    def __init__(self, source: str, nodes: Tuple[Node, ...]):
+        self.source = source
+        self.nodes = nodes
+        self.is_static = all(isinstance(node, str) for node in nodes)
+
+    def render(
+        self,
+        rng: Optional[random.Random] = None,
+        library: Optional["WildcardLibrary"] = None,
+    ) -> Tuple[str, Dict[str, str]]:
+        """Render the template, returning ``(text, replacements)``."""
+
+        if self.is_static:
+            return self.source, {}
+
+        rng = rng if rng is not None else random.Random()
+        library = library if library is not None else get_default_library()
+        out: List[str] = []
+        replacements: Dict[str, str] = {}
+        _render_nodes(self.nodes, rng, library, replacements, out, 0)
+        return "".join(out), replacements
+
+
+def _pair_braces(text: str) -> Dict[int, int]:
+    """Map each balanced ``{`` offset to its matching ``}`` offset."""
+
+    pairs: Dict[int, int] = {}
+    stack: List[int] = []
+    for index, char in enumerate(text):
+        if char == "{":
+            stack.append(index)
+        elif char == "}" and stack:
+            pairs[stack.pop()] = index
+    return pairs
+
+
+def _compile_span(text: str, start: int, end: int, pairs: Dict[int, int]) -> Tuple[Node, ...]:
+    nodes: List[Node] = []
+    literal_start = start
+    cursor = start
+    while cursor < end:
+        cursor = text.find("{", cursor, end)
+        if cursor < 0:
+            break
+        close = pairs.get(cursor)
+        if close is None:
+            cursor += 1
+            continue
+        node = _compile_group(text, cursor, close, pairs)
+        if node is None:
+            cursor = close + 1
+            continue
+        if cursor > literal_start:
+            nodes.append(text[literal_start:cursor])
+        nodes.append(node)
+        cursor = close + 1
+        literal_start = cursor
+    if literal_start < end:
+        nodes.append(text[literal_start:end])
+    return tuple(nodes)
+
+
+def _compile_group(text: str, open_at: int, close_at: int, pairs: Dict[int, int]) -> Optional[Node]:
+    """Compile ``text[open_at:close_at + 1]``; ``None`` keeps it as literal text."""
+
+    start = open_at + 1
+    bars: List[int] = []
+    has_nested = False
+    cursor = start
+    while cursor < close_at:
+        char = text[cursor]
+        if char == "{" and cursor in pairs:
+            has_nested = True
+            cursor = pairs[cursor] + 1
+            continue
+        if char == "|":
+            bars.append(cursor)
+        cursor += 1
+
+    first_end = bars[0] if bars else close_at
+    name: Optional[str] = None
+    named = _NAMED_PREFIX_RE.match(text, start, first_end)
+    if named:
+        name = named.group(1).strip().lower()
+        start = named.end()
+    elif not bars:
+        if not has_nested:
+            reference = _REFERENCE_RE.match(text, start, close_at)
+            if reference:
+                return Reference(reference.group(1).strip().lower(), text[open_at:close_at + 1])
+            return None
+
+    bounds = [start] + [bar + 1 for bar in bars]
+    ends = bars + [close_at]
+    options = tuple(
+        _strip_option(_compile_span(text, lo, hi, pairs))
+        for lo, hi in zip(bounds, ends)
+    )
+    return Choice(name, options)
+
+
+def _strip_option(nodes: Tuple[Node, ...]) -> Tuple[Node, ...]:
+    """Trim surrounding whitespace of an option, matching ``opt.strip()``."""
+
+    if not nodes:
+        return nodes
+    items = list(nodes)
+    if isinstance(items[0], str):
+        items[0] = items[0].lstrip()
+    if isinstance(items[-1], str):
+        items[-1] = items[-1].rstrip()
+    return tuple(item for item in items if item != "")
+
+
+@lru_cache(maxsize=512)
+def compile_wildcards(text: str) -> CompiledTemplate:
+    """Parse ``text`` into a reusable :class:`CompiledTemplate` (memoized)."""
+
+    text = text or ""
+    if "{" not in text:
+        return CompiledTemplate(text, (text,) if text else ())
+    return CompiledTemplate(text, _compile_span(text, 0, len(text), _pair_braces(text)))
+
+
+register_cache_info(
+    "wildcard_templates",
+    lambda: (lambda info: (info.hits, info.misses, info.currsize))(compile_wildcards.cache_info()),
+)
+
+
+def _render_nodes(
+    nodes: Sequence[Node],
+    rng: random.Random,
+    library: "WildcardLibrary",
+    replacements: Dict[str, str],
+    out: List[str],
+    depth: int,
+) -> None:
+    for node in nodes:
+        if isinstance(node, str):
+            out.append(node)
+        elif isinstance(node, Choice):
+            option = node.options[rng.randrange(len(node.options))]
+            if node.name is None:
+                _render_nodes(option, rng, library, replacements, out, depth)
+                continue
+            chunk: List[str] = []
+            _render_nodes(option, rng, library, replacements, chunk, depth)
+            value = "".join(chunk)
+            replacements[node.name] = value
+            out.append(value)
+        else:
+            _render_reference(node, rng, library, replacements, out, depth)
+
+
+def _render_reference(
+    node: Reference,
+    rng: random.Random,
+    library: "WildcardLibrary",
+    replacements: Dict[str, str],
+    out: List[str],
+    depth: int,
+) -> None:
+    # A {name} that follows an inline {name:...} reuses the earlier choice so a
+    # category can be mentioned several times consistently.
+    if node.name in replacements:
+        out.append(replacements[node.name])
+        return
+
+    entry = library.choose(node.name, rng)
+    if entry is None or depth >= MAX_NESTING_DEPTH:
+        out.append(node.raw if entry is None else entry)
+        return
+
+    template = compile_wildcards(entry)
+    if template.is_static:
+        value = entry
+    else:
+        chunk: List[str] = []
+        _render_nodes(template.nodes, rng, library, replacements, chunk, depth + 1)
+        value = "".join(chunk)
+    replacements[node.name] = value
+    out.append(value)
+
+
+# ---------------------------------------------------------------------------
+# Combinatorial enumeration / sampling
+# ---------------------------------------------------------------------------
+
+WILDCARD_MODES = ("random", "enumerate", "stratified")
+
+
+class WildcardSpace:
+    """
+    Every distinct expansion of a template, addressable by index.
+
+    Each template is treated as a mixed-radix number: a choice contributes
+    one digit per option (summed over nested alternatives) and sequences
+    multiply, with the last wildcard varying fastest. ``render_index(i)``
+    decodes one combination directly, so enumeration and sampling are lazy
+    and never materialize the space. ``{name}`` after ``{name:...}`` reuses
+    the earlier choice and does not add combinations.
+    """
+
+    def __init__(self, template: Union[str, CompiledTemplate], library: Optional["WildcardLibrary"] = None):
+        self.template = compile_wildcards(template) if isinstance(template, str) else template
+        self.library = library if library is not None else get_default_library()
+        self._memo: Dict[Tuple[int, frozenset], Tuple[int, frozenset]] = {}
+        self._entry_sums: Dict[Tuple[int, frozenset], Optional[List[int]]] = {}
+        self._pinned: List[object] = []
+        self.total, _ = self._count_seq(self.template.nodes, frozenset(), 0)
+
+    def render_index(self, index: int) -> Tuple[str, Dict[str, str]]:
+        """Render combination ``index`` (``0 <= index < total``)."""
+
+        if not 0 <= index < self.total:
+            raise IndexError(f"combination {index} out of range 0..{self.total - 1}")
+        out: List[str] = []
+        replacements: Dict[str, str] = {}
+        self._decode_seq(self.template.nodes, index, frozenset(), replacements, out, 0)
+        return "".join(out), replacements
+
+    def enumerate(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str, Dict[str, str]]]:
+        """Yield ``(index, text, replacements)`` for every combination in order."""
+
+        stop = self.total if stop is None else min(stop, self.total)
+        for index in range(start, stop):
+            text, replacements = self.render_index(index)
+            yield index, text, replacements
+
+    def sample(self, count: int, seed: Optional[int] = None) -> Iterator[Tuple[int, str, Dict[str, str]]]:
+        """
+        Yield ``count`` distinct combinations, one from each of ``count``
+        equal strata of the index space (i.e. spread across the leading
+        wildcards). Falls back to full enumeration when ``count >= total``.
+        """
+
+        if count >= self.total:
+            yield from self.enumerate()
+            return
+        rng = random.Random(seed)
+        for stratum in range(count):
+            low = stratum * self.total // count
+            high = (stratum + 1) * self.total // count
+            index = rng.randrange(low, high)
+            text, replacements = self.render_index(index)
+            yield index, text, replacements
+
+    # -- counting -----------------------------------------------------------
+
+    def _count_seq(self, nodes: Sequence[Node], bound: frozenset, depth: int) -> Tuple[int, frozenset]:
+        key = (id(nodes), bound)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+        total = 1
+        for node in nodes:
+            count, bound = self._count_node(node, bound, depth)
+            total *= count
+        self._pinned.append(nodes)
+        self._memo[key] = (total, bound)
+        return total, bound
+
+    def _count_node(self, node: Node, bound: frozenset, depth: int) -> Tuple[int, frozenset]:
+        if isinstance(node, str):
+            return 1, bound
+        if isinstance(node, Choice):
+            total = 0
+            always: Optional[frozenset] = None
+            for option in node.options:
+                count, option_bound = self._count_seq(option, bound, depth)
+                total += count
+                always = option_bound if always is None else always & option_bound
+            bound = always if always is not None else bound
+            if node.name is not None:
+                bound = bound | {node.name}
+            return max(total, 1), bound
+        if node.name in bound:
+            return 1, bound
+        sums = self._reference_sums(node, bound, depth)
+        if sums is None:
+            entries = self.library.get(node.name)
+            if not entries:
+                return 1, bound
+            return len(entries), bound | {node.name}
+        return sums[-1], bound | {node.name}
+
+    def _reference_sums(self, node: "Reference", bound: frozenset, depth: int) -> Optional[List[int]]:
+        """Prefix sums of per-entry counts, or ``None`` if every entry is plain text."""
+
+        entries = self.library.get(node.name)
+        key = (id(entries), bound)
+        if key in self._entry_sums:
+            return self._entry_sums[key]
+        sums: Optional[List[int]] = None
+        if entries and depth < MAX_NESTING_DEPTH:
+            # Files know their nested lines from the cached index; plain lines are never decoded
+            if isinstance(entries, WildcardFile):
+                nested = entries.nested_lines()
+            else:
+                nested = [index for index, entry in enumerate(entries) if "{" in entry]
+            if nested:
+                counts = {
+                    index: self._count_seq(compile_wildcards(entries[index]).nodes, bound, depth + 1)[0]
+                    for index in nested
+                }
+                running = 0
+                sums = []
+                for index in range(len(entries)):
+                    running += counts.get(index, 1)
+                    sums.append(running)
+        self._pinned.append(entries)
+        self._entry_sums[key] = sums
+        return sums
+
+    # -- decoding -----------------------------------------------------------
+
+    def _decode_seq(
+        self,
+        nodes: Sequence[Node],
+        index: int,
+        bound: frozenset,
+        replacements: Dict[str, str],
+        out: List[str],
+        depth: int,
+    ) -> None:
+        plan = []
+        for node in nodes:
+            count, next_bound = self._count_node(node, bound, depth)
+            plan.append((node, count, bound))
+            bound = next_bound
+        digits = [0] * len(plan)
+        for position in range(len(plan) - 1, -1, -1):
+            index, digits[position] = divmod(index, plan[position][1])
+        for (node, _count, node_bound), digit in zip(plan, digits):
+            self._decode_node(node, digit, node_bound, replacements, out, depth)
+
+    def _decode_node(
+        self,
+        node: Node,
+        digit: int,
+        bound: frozenset,
+        replacements: Dict[str, str],
+        out: List[str],
+        depth: int,
+    ) -> None:
+        if isinstance(node, str):
+            out.append(node)
+            return
+        if isinstance(node, Choice):
+            target = out if node.name is None else []
+            for option in node.options:
+                count, _ = self._count_seq(option, bound, depth)
+                if digit < count:
+                    self._decode_seq(option, digit, bound, replacements, target, depth)
+                    break
+                digit -= count
+            if node.name is not None:
+                value = "".join(target)
+                replacements[node.name] = value
+                out.append(value)
+            return
+        if node.name in bound:
+            out.append(replacements.get(node.name, node.raw))
+            return
+        entries = self.library.get(node.name)
+        if not entries:
+            out.append(node.raw)
+            return
+        sums = self._reference_sums(node, bound, depth)
+        if sums is None:
+            value = entries[digit]
+        else:
+            position = bisect_right(sums, digit)
+            offset = digit - (sums[position - 1] if position else 0)
+            chunk: List[str] = []
+            self._decode_seq(compile_wildcards(entries[position]).nodes, offset, bound, replacements, chunk, depth + 1)
+            value = "".join(chunk)
+        replacements[node.name] = value
+        out.append(value)
+
+
+def iter_wildcard_combinations(
+    text: str,
+    mode: str = "enumerate",
+    count: Optional[int] = None,
+    seed: Optional[int] = None,
+    library: Optional["WildcardLibrary"] = None,
+) -> Iterator[Tuple[int, str, Dict[str, str]]]:
+    """
+    Lazily yield ``(index, expanded_text, replacements)`` for ``text``.
+
+    Args:
+        text: Prompt containing wildcard syntax
+        mode: "enumerate" (every combination in order, optionally capped by
+            ``count``), "stratified" (``count`` distinct stratified samples)
+            or "random" (``count`` independent random draws; endless if None)
+        count: Maximum number of prompts to yield
+        seed: Seed for the sampling stream
+        library: Wildcard library (defaults to the shared library)
+    """
+    if mode not in WILDCARD_MODES:
+        raise ValueError(f"Unknown wildcard mode '{mode}' (expected one of {', '.join(WILDCARD_MODES)})")
+
+    if mode == "random":
+        rng = random.Random(seed)
+        template = compile_wildcards(text)
+        index = 0
+        while count is None or index < count:
+            expanded, replacements = template.render(rng, library)
+            yield index, expanded, replacements
+            index += 1
+        return
+
+    space = WildcardSpace(text, library)
+    if mode == "enumerate":
+        yield from space.enumerate(stop=count)
+    else:
+        yield from space.sample(count if count is not None else space.total, seed)
+
+
+# ---------------------------------------------------------------------------
+# Wildcard library (built-ins + user files)
+# ---------------------------------------------------------------------------
+
+class WildcardFile(SequenceABC):
+    """
+    Read-only sequence over the option lines of one wildcard ``.txt`` file.
+
+    The file is memory-mapped and indexed by the byte offset of every option
+    line, so ``len()`` and random access are O(1) and a library with hundreds
+    of thousands of lines is never materialized as Python strings. The offset
+    index, together with the positions of the lines holding nested ``{...}``
+    choices (so counting combinations never decodes plain lines), is persisted
+    in :data:`INDEX_CACHE_DIR` keyed by path and validated against the file's
+    mtime and size. Mapping is deferred until first use so
+    large libraries do not hold a mapping per category; the file handle is
+    closed as soon as the mapping exists. :meth:`close` releases the mapping
+    (an open mapping keeps Windows from saving over the file), and the library
+    closes every file it drops or replaces on a rescan. A closed file maps
+    and re-indexes the current contents again if it is still used.
+    """
+
+    def __init__(self, path: str, mtime_ns: int, size: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self._map: Optional[mmap.mmap] = None
+        self._offsets: Optional[array] = None
+        self._nested: Optional[array] = None
+        self._lock = threading.Lock()
+
+    def matches(self, mtime_ns: int, size: int) -> bool:
+        return self.mtime_ns == mtime_ns and self.size == size
+
+    def __len__(self) -> int:
+        return len(self._ensure_index())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._ensure_index())))]
+        with self._lock:
+            # Under the lock so close() cannot unmap between the lookup and the read
+            offsets = self._index_locked()
+            return _decode_line(self._map, offsets[index])
+
+    def nested_lines(self) -> array:
+        """Indices of the option lines that contain ``{`` (nested choices), ascending."""
+
+        with self._lock:
+            self._index_locked()
+            return self._nested
+
+    def close(self) -> None:
+        """Release the mapping; the next access maps and indexes the file again."""
+
+        with self._lock:
+            data, self._map = self._map, None
+            self._offsets = self._nested = None
+        if data is not None:
+            data.close()
+
+    def _ensure_index(self) -> array:
+        offsets = self._offsets
+        if offsets is not None:
+            return offsets
+        with self._lock:
+            return self._index_locked()
+
+    def _index_locked(self) -> array:
+        if self._offsets is None:
+            try:
+                self._offsets, self._nested = self._open()
+            except (OSError, ValueError) as exc:
+                print(f"[Wildcards] Failed to index {self.path}: {exc}")
+                self._offsets, self._nested = array("Q"), array("Q")
+        return self._offsets
+
+    def _open(self) -> Tuple[array, array]:
+        with open(self.path, "rb") as handle:
+            stat = os.fstat(handle.fileno())
+            self.mtime_ns, self.size = stat.st_mtime_ns, stat.st_size
+            if stat.st_size == 0:
+                return array("Q"), array("Q")
+            # The mapping keeps its own reference to the file; the handle is not needed after this
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        cache_path = _index_cache_path(self.path)
+        cached = _load_offset_cache(cache_path, self.mtime_ns, self.size)
+        record_cache("wildcard_index", cached is not None)
+        if cached is not None:
+            return cached
+        offsets = array("Q", (match.start() for match in _OPTION_LINE_RE.finditer(self._map)))
+        if offsets and offsets[0] == 0 and self._map[:3] == _UTF8_BOM:
+            # A BOM followed by a blank/comment first line is not an option
+            first = _decode_line(self._map, 0)
+            if not first or first.startswith("#"):
+                offsets.pop(0)
+        nested = _nested_line_indices(self._map, offsets)
+        _store_offset_cache(cache_path, self.mtime_ns, self.size, offsets, nested)
+        return offsets, nested
+
+
+_OPTION_LINE_RE = re.compile(rb"^[ \t]*[^#\s]", re.MULTILINE)
+_UTF8_BOM = b"\xef\xbb\xbf"
+_INDEX_MAGIC = b"WCIDX2\0\0"
+# magic, mtime_ns, size, option line count; then the offsets, then the nested line indices
+_INDEX_HEADER = struct.Struct("<8sqqq")
+
+
+def _decode_line(data: mmap.mmap, start: int) -> str:
+    end = data.find(b"\n", start)
+    if end < 0:
+        end = len(data)
+    return data[start:end].decode("utf-8", errors="replace").strip().lstrip("\ufeff")
+
+
+def _nested_line_indices(data: mmap.mmap, offsets: array) -> array:
+    """Indices of the option lines containing ``{``, found without decoding any line."""
+
+    nested = array("Q")
+    position = data.find(b"{")
+    while position >= 0:
+        resume = position + 1
+        line = bisect_right(offsets, position) - 1
+        if line >= 0:
+            end = data.find(b"\n", offsets[line])
+            end = len(data) if end < 0 else end
+            if position < end:
+                # On the option line itself, not on a comment or blank line after it
+                nested.append(line)
+                resume = end
+        position = data.find(b"{", resume)
+    return nested
+
+
+def _index_cache_path(path: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(INDEX_CACHE_DIR, f"{digest}.idx")
+
+
+def _load_offset_cache(cache_path: str, mtime_ns: int, size: int) -> Optional[Tuple[array, array]]:
+    try:
+        with open(cache_path, "rb") as handle:
+            header = handle.read(_INDEX_HEADER.size)
+            if len(header) != _INDEX_HEADER.size:
+                return None
+            magic, cached_mtime, cached_size, count = _INDEX_HEADER.unpack(header)
+            if magic != _INDEX_MAGIC or cached_mtime != mtime_ns or cached_size != size:
+                return None
+            offsets, nested = array("Q"), array("Q")
+            offsets.frombytes(handle.read(count * offsets.itemsize))
+            nested.frombytes(handle.read())
+            if len(offsets) != count:
+                return None
+            return offsets, nested
+    except (OSError, ValueError):
+        return None
+
+
+def _store_offset_cache(cache_path: str, mtime_ns: int, size: int, offsets: array, nested: array) -> None:
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_path, "wb") as handle:
+            handle.write(_INDEX_HEADER.pack(_INDEX_MAGIC, mtime_ns, size, len(offsets)))
+            offsets.tofile(handle)
+            nested.tofile(handle)
+        os.replace(temp_path, cache_path)
+    except OSError as exc:
+        print(f"[Wildcards] Could not cache index for {cache_path}: {exc}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+class WildcardLibrary:
+    """
+    Category name -> options registry backed by built-ins and ``.txt`` files.
+
+    Directories are rescanned at most every ``reload_interval`` seconds; files
+    whose mtime/size changed are re-indexed and new or deleted files appear or
+    disappear, so libraries hot-reload without restarting ComfyUI.
+    """
+
+    def __init__(
+        self,
+        directories: Optional[Sequence[str]] = None,
+        include_builtins: bool = True,
+        reload_interval: float = RELOAD_CHECK_INTERVAL,
+    ):
+        self._directories: List[str] = [os.path.abspath(path) for path in (directories or [])]
+        self._include_builtins = include_builtins
+        self._reload_interval = reload_interval
+        self._index: Optional[Dict[str, Sequence[str]]] = None
+        self._files: Dict[str, WildcardFile] = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def directories(self) -> List[str]:
+        return list(self._directories)
+
+    def add_directory(self, path: str) -> None:
+        """Register another wildcard directory; the index is rebuilt lazily."""
+
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._directories:
+                self._directories.append(path)
+                self._index = None
+
+    def reload(self) -> None:
+        """Force a rescan of every directory on the next lookup."""
+
+        with self._lock:
+            self._index = None
+
+    def close(self) -> None:
+        """Release every file mapping (files map again lazily if used afterwards)."""
+
+        with self._lock:
+            entries = list(self._files.values())
+        for entry in entries:
+            entry.close()
+
+    def categories(self) -> List[str]:
+        return sorted(self._get_index().keys())
+
+    def get(self, name: str) -> Optional[Sequence[str]]:
+        return self._get_index().get(name.strip().lower())
+
+    def choose(self, name: str, rng: random.Random) -> Optional[str]:
+        options = self.get(name)
+        if not options:
+            return None
+        return options[rng.randrange(len(options))]
+
+    def _get_index(self) -> Dict[str, Sequence[str]]:
+        index = self._index
+        if index is not None and time.monotonic() - self._last_scan < self._reload_interval:
+            return index
+        with self._lock:
+            if self._index is None or time.monotonic() - self._last_scan >= self._reload_interval:
+                self._index = self._scan(self._index)
+                self._last_scan = time.monotonic()
+            return self._index
+
+    def _scan(self, previous: Optional[Dict[str, Sequence[str]]]) -> Dict[str, Sequence[str]]:
+        index: Dict[str, Sequence[str]] = dict(BUILTIN_WILDCARDS) if self._include_builtins else {}
+        files: Dict[str, WildcardFile] = {}
+        changed = previous is None
+        for directory in self._directories:
+            if not os.path.isdir(directory):
+                continue
+            for root, _dirs, filenames in os.walk(directory):
+                for filename in sorted(filenames):
+                    if not filename.lower().endswith(".txt"):
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError as exc:
+                        print(f"[Wildcards] Failed to read {path}: {exc}")
+                        continue
+                    entry = self._files.get(path)
+                    if entry is None or not entry.matches(stat.st_mtime_ns, stat.st_size):
+                        entry = WildcardFile(path, stat.st_mtime_ns, stat.st_size)
+                        changed = True
+                    files[path] = entry
+                    name = os.path.relpath(path, directory)[:-4].replace(os.sep, "/").lower()
+                    index[name] = entry
+
+        if not changed and previous is not None and len(files) == len(self._files):
+            return previous
+        if previous is not None:
+            print(f"[Wildcards] Reloaded wildcard index ({len(files)} files)")
+        for path, entry in self._files.items():
+            if files.get(path) is not entry:
+                # Dropped or replaced: unmap now instead of whenever the GC gets to it
+                entry.close()
+        self._files = files
+        return index
+
+
+_DEFAULT_LIBRARY: Optional[WildcardLibrary] = None
+_DEFAULT_LIBRARY_LOCK = threading.Lock()
+
+
+def get_default_library() -> WildcardLibrary:
+    """Return the shared library (package ``wildcards`` folder + env paths)."""
+
+    global _DEFAULT_LIBRARY
+    if _DEFAULT_LIBRARY is None:
+        with _DEFAULT_LIBRARY_LOCK:
+            if _DEFAULT_LIBRARY is None:
+                directories = [DEFAULT_WILDCARD_DIR]
+                extra = os.environ.get(WILDCARD_PATH_ENV, "")
+                directories.extend(path for path in extra.split(os.pathsep) if path.strip())
+                _DEFAULT_LIBRARY = WildcardLibrary(directories)
+    return _DEFAULT_LIBRARY
+
+
+def expand_wildcards(
+    text: str,
+    seed: Optional[int] = None,
+    rng: Optional[random.Random] = None,
+    library: Optional[WildcardLibrary] = None,
+) -> Tuple[str, Dict[str, str]]:
+    """
+    Expand every wildcard/alternation in ``text``.
+
+    Args:
+        text: Prompt containing wildcard syntax
+        seed: Seed for a private random stream (ignored when ``rng`` is given)
+        rng: Explicit random stream to draw from
+        library: Wildcard library (defaults to the shared library)
+
+    Returns:
+        Tuple of (expanded_text, replacements) where replacements maps named
+        categories to the value chosen for them
+    """
+    if not text or "{" not in text:
+        return text, {}
+    if rng is None:
+        rng = random.Random(seed)
+    return compile_wildcards(text).render(rng, library)